@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""Benchmarks the Lirc and tab-separated value converters on a synthetic
+lircrc."""
+
+
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import mfgames_media.lirc
+
+
+# The programs and buttons the synthetic records are made from.
+PROGS = ["mythtv", "mplayer", "irexec", "xine", "vlc", "amarok"]
+BUTTONS = ["play", "pause", "stop", "ff", "rew", "up", "down", "left",
+           "right", "ok", "menu", "info", "mute", "vol+", "vol-", "power"]
+REMOTES = ["mceusb", "hauppauge", "streamzap", "*"]
+MODES = ["", "", "", "mythtv", "music", "video"]
+
+
+def create_lircrc(filename, lines, seed):
+    """Writes out a lircrc with at least the given number of lines. Most
+    records only have the standard fields, but some use modes, repeats,
+    and commands with equal signs in them."""
+
+    generator = random.Random(seed)
+    stream = open(filename, 'w')
+    count = 0
+
+    while count < lines:
+        record = [
+            "begin",
+            "\tprog = " + generator.choice(PROGS),
+            "\tremote = " + generator.choice(REMOTES),
+            "\tbutton = " + generator.choice(BUTTONS),
+            "\tconfig = key{0}".format(generator.randint(0, 9999)),
+            ]
+
+        mode = generator.choice(MODES)
+
+        if mode:
+            record.append("\tmode = " + mode)
+
+        if generator.random() < 0.3:
+            record.append("\trepeat = {0}".format(generator.randint(1, 5)))
+
+        if generator.random() < 0.1:
+            record.append("\tflags = once")
+
+        if generator.random() < 0.05:
+            record.append(
+                "\tconfig = irsend --count={0} SEND_ONCE tv KEY_MUTE".format(
+                    generator.randint(1, 3)))
+
+        record.append("end")
+        record.append("")
+        stream.write("\n".join(record) + "\n")
+        count += len(record)
+
+    stream.close()
+    return count
+
+
+def legacy_to_tabs(input, output):
+    """Converts the lircrc the way the original ConvertToTabSeparatedValues
+    did, loading every record first and writing a cell at a time."""
+
+    contents = open(input).readlines()
+    header = ["prog", "button", "config"]
+    records = []
+    record = {}
+
+    for block in contents:
+        block = block.strip()
+
+        if block == "" or block[0] == "#" or block == "begin":
+            continue
+
+        if block == "end":
+            records.append(record)
+            record = {}
+            continue
+
+        parts = block.split("=", 2)
+        key = parts[0].strip()
+        value = parts[1].strip()
+
+        if key not in header:
+            header.append(key)
+
+        record[header.index(key)] = value
+
+    with open(output, 'w+') as stream:
+        stream.write("\t".join(header) + "\n")
+
+        for record in records:
+            for index in range(len(header)):
+                if index in record:
+                    stream.write(record[index])
+
+                if index == len(header) - 1:
+                    stream.write("\n")
+                else:
+                    stream.write("\t")
+
+
+def legacy_to_lirc(input, output):
+    """Converts the tab-separated values the way the original
+    ConvertToLirc did, loading every line first."""
+
+    contents = open(input).readlines()
+    header = contents.pop(0).split("\t")
+
+    with open(output, 'w+') as stream:
+        for line in contents:
+            stream.write("begin\n")
+            record = line.split("\t")
+
+            for index in range(len(record)):
+                key = header[index].strip()
+                value = record[index].strip()
+
+                if not value == '':
+                    stream.write("\t" + key + " = " + value + "\n")
+
+            stream.write("end\n")
+
+
+def stream_to_tabs(input, output, pipe=False):
+    """Converts the lircrc with the streaming converter. If pipe is
+    true, the input comes through a pipe so it has to be spilled."""
+
+    if pipe:
+        process = subprocess.Popen(["cat", input], stdout=subprocess.PIPE)
+        stream = process.stdout
+    else:
+        stream = open(input)
+
+    with open(output, 'w', mfgames_media.lirc.BUFFER_SIZE) as destination:
+        mfgames_media.lirc.convert_to_tabs(stream, destination)
+
+    stream.close()
+
+    if pipe:
+        process.wait()
+
+
+def stream_to_lirc(input, output):
+    """Converts the tab-separated values with the streaming converter."""
+
+    stream = open(input)
+
+    with open(output, 'w', mfgames_media.lirc.BUFFER_SIZE) as destination:
+        mfgames_media.lirc.convert_to_lirc(stream, destination)
+
+    stream.close()
+
+
+# The scenarios that can be run, each taking an input and output file.
+SCENARIOS = {
+    "legacy-tabs": legacy_to_tabs,
+    "legacy-lirc": legacy_to_lirc,
+    "stream-tabs": stream_to_tabs,
+    "stream-tabs-pipe": lambda i, o: stream_to_tabs(i, o, True),
+    "stream-lirc": stream_to_lirc,
+    }
+
+
+def run_scenario(name, input, output):
+    """Runs a single scenario in its own process so the peak memory
+    only counts that scenario. Returns the time and peak memory."""
+
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--scenario", name, input, output],
+        stdout=subprocess.PIPE)
+    elapsed, peak = process.communicate()[0].split()
+
+    if process.returncode != 0:
+        raise Exception("Scenario failed: " + name)
+
+    return float(elapsed), int(peak)
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the Lirc converters on a synthetic lircrc.")
+    parser.add_argument(
+        '--lines', '-n',
+        type=int,
+        default=1000000,
+        help='The number of lines in the lircrc.')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=1,
+        help='The seed for the random lircrc.')
+    parser.add_argument(
+        '--scenario',
+        type=str,
+        help='Runs a single scenario and reports its time and memory.')
+    parser.add_argument(
+        'files',
+        type=str,
+        nargs='*',
+        help='The input and output of a single scenario.')
+    args = parser.parse_args(arguments)
+
+    # If we are running a single scenario, report the results in a
+    # form the parent can read.
+    if args.scenario:
+        start = time.time()
+        SCENARIOS[args.scenario](args.files[0], args.files[1])
+        elapsed = time.time() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print elapsed, peak
+        return
+
+    directory = tempfile.mkdtemp()
+    lircrc = os.path.join(directory, "lircrc")
+    tabs = os.path.join(directory, "lircrc.tsv")
+    output = os.path.join(directory, "output")
+
+    try:
+        start = time.time()
+        lines = create_lircrc(lircrc, args.lines, args.seed)
+        print "Created {0} lines ({1:.1f} MB) in {2:.2f}s".format(
+            lines,
+            os.path.getsize(lircrc) / 1000000.0,
+            time.time() - start)
+
+        # The tab-separated values are created once by the new code,
+        # since the original truncates commands with equal signs.
+        stream_to_tabs(lircrc, tabs)
+
+        for name, input in [
+            ("legacy-tabs", lircrc),
+            ("stream-tabs", lircrc),
+            ("stream-tabs-pipe", lircrc),
+            ("legacy-lirc", tabs),
+            ("stream-lirc", tabs)]:
+            elapsed, peak = run_scenario(name, input, output)
+            print "{0:<16} {1:>7.2f}s peak {2:>8.1f} MB".format(
+                name,
+                elapsed,
+                peak / 1024.0)
+    finally:
+        for filename in [lircrc, tabs, output]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""Benchmarks the Amarok pack planner on synthetic collections."""
+
+
+import argparse
+import random
+import sys
+import time
+
+import mfgames_media.amarok.planner
+
+
+def create_tracks(count, present_ratio, seed):
+    """Creates a synthetic collection. Most tracks are lossy files of a
+    few megabytes, but a fifth are much larger lossless files. The
+    ratings lean towards the middle like a real collection."""
+
+    generator = random.Random(seed)
+    tracks = []
+
+    for index in range(count):
+        if generator.random() < 0.2:
+            size = int(generator.lognormvariate(17.2, 0.4))
+        else:
+            size = int(generator.lognormvariate(15.6, 0.4))
+
+        rating = min(10, max(0, int(generator.gauss(6, 2))))
+        rpath = "artist{0}/album{1}/track{2}.mp3".format(
+            index % 997,
+            index % 89,
+            index)
+        tracks.append(mfgames_media.amarok.planner.Track(
+            rpath,
+            rpath,
+            rpath,
+            rating,
+            generator.randint(0, 100),
+            size,
+            generator.random() < present_ratio))
+
+    return tracks
+
+
+def plan_greedy(tracks, capacity, planner):
+    """Plans the pack the way the original PackProcess did it. The
+    present tracks are always kept, then the rest are copied from the
+    highest rating down as long as they fit. The result is valued the
+    same way as the planner."""
+
+    remaining = capacity - sum([t.size for t in tracks if t.present])
+    value = sum([planner.get_value(t) for t in tracks if t.present])
+    copies = 0
+
+    for track in sorted(tracks, key=lambda t: -t.rating):
+        if track.present or track.size > remaining:
+            continue
+
+        remaining -= track.size
+        value += planner.get_value(track)
+        copies += 1
+
+    return value, capacity - remaining, copies
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the pack planner on synthetic collections.")
+    parser.add_argument(
+        '--count', '-n',
+        type=int,
+        default=100000,
+        help='The number of tracks in the collection.')
+    parser.add_argument(
+        '--capacity', '-c',
+        type=str,
+        default="8,16,64",
+        help='Comma-separated device sizes in gigabytes.')
+    parser.add_argument(
+        '--present',
+        type=float,
+        default=0.05,
+        help='The fraction of tracks already on the device.')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=1,
+        help='The seed for the random collection.')
+    args = parser.parse_args(arguments)
+
+    start = time.time()
+    tracks = create_tracks(args.count, args.present, args.seed)
+    print "Created {0} tracks in {1:.2f}s".format(
+        len(tracks),
+        time.time() - start)
+
+    for capacity in args.capacity.split(","):
+        capacity = int(float(capacity) * 1000 * 1000 * 1000)
+
+        # The present tracks count as already on the device, so make
+        # sure they fit before we compare.
+        for track in tracks:
+            track.present = False
+
+        generator = random.Random(args.seed)
+        used = 0
+
+        for track in tracks:
+            if generator.random() < args.present \
+                    and used + track.size <= capacity / 2:
+                track.present = True
+                used += track.size
+
+        planner = mfgames_media.amarok.planner.PackPlanner(capacity)
+
+        start = time.time()
+        greedy_value, greedy_bytes, greedy_copies = plan_greedy(
+            tracks,
+            capacity,
+            planner)
+        greedy_time = time.time() - start
+
+        start = time.time()
+        plan = planner.plan(tracks)
+        plan_time = time.time() - start
+
+        print "{0:>3} GB greedy  {1:>7.2f}s value {2:>10.1f} used {3:>6.2%} copies {4}".format(
+            capacity / 1000 / 1000 / 1000,
+            greedy_time,
+            greedy_value,
+            float(greedy_bytes) / capacity,
+            greedy_copies)
+        print "{0:>3} GB planner {1:>7.2f}s value {2:>10.1f} used {3:>6.2%} copies {4} deletes {5} mean rating {6:.2f}".format(
+            capacity / 1000 / 1000 / 1000,
+            plan_time,
+            plan.value,
+            float(plan.used_bytes) / capacity,
+            len(plan.copy),
+            len(plan.delete),
+            sum([t.rating for t in plan.keep + plan.copy])
+            / float(len(plan.keep + plan.copy) or 1))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""Benchmarks the TMDB processes against the local stand-in server."""
+
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import simplejson
+
+import mfgames_media.themoviedb
+import mfgames_media.themoviedb.server
+
+
+def run_process(process, arguments):
+    """Parses the arguments for the process and runs it, hiding
+    anything it prints."""
+
+    parser = argparse.ArgumentParser()
+    process.setup_arguments(parser)
+    args = parser.parse_args(arguments)
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+
+    try:
+        process.process(args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    return process
+
+
+class Benchmark(object):
+    """Runs each of the scenarios against the stand-in server and
+    collects the end-to-end time, requests per second, and the cache
+    hit rate for each one."""
+
+    def __init__(self, server, directory, count):
+        self.server = server
+        self.directory = directory
+        self.count = count
+        self.results = []
+
+    def get_common(self):
+        """Retrieves the arguments shared by all the processes."""
+
+        return [
+            "--api-key", "benchmark",
+            "--api-url", self.server.url,
+            "--cache-dir", os.path.join(self.directory, "cache"),
+            ]
+
+    def get_sidecar(self, id):
+        """Retrieves the sidecar filename for the movie."""
+
+        return os.path.join(self.directory, "movies", "{0}.json".format(id))
+
+    def measure(self, name, function):
+        """Runs a scenario and records how it went."""
+
+        self.server.reset()
+        self.hits = 0
+        self.misses = 0
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        counts = self.server.reset()
+        requests = sum([
+            value
+            for key, value in counts.iteritems()
+            if key not in ("rate-limited", "not-modified")])
+        lookups = self.hits + self.misses
+
+        result = {
+            "name": name,
+            "count": self.count,
+            "seconds": elapsed,
+            "requests": requests,
+            "requests-per-second": requests / elapsed if elapsed else 0,
+            "rate-limited": counts.get("rate-limited", 0),
+            "cache-hit-rate": float(self.hits) / lookups if lookups else 0,
+            }
+        self.results.append(result)
+
+        print "{0:<20} {1:>8.2f}s {2:>8} req {3:>9.1f} req/s {4:>6.1%} hits".format(
+            name,
+            elapsed,
+            requests,
+            result["requests-per-second"],
+            result["cache-hit-rate"])
+
+    def add_cache_counts(self, process):
+        """Adds the cache counts from a finished process."""
+
+        if process.cache:
+            self.hits += process.cache.hits
+            self.misses += process.cache.misses
+
+    def run_each(self, factory, arguments):
+        """Runs a new process for each of the movies, the same way the
+        shell scripts do."""
+
+        for id in range(1, self.count + 1):
+            process = run_process(factory(), self.get_common() + arguments(id))
+            self.add_cache_counts(process)
+
+    def run_once(self, factory, arguments):
+        """Runs a single batch process for all the movies."""
+
+        process = run_process(factory(), self.get_common() + arguments)
+        self.add_cache_counts(process)
+
+    def write_batch(self):
+        """Writes out the batch file with all the movies."""
+
+        filename = os.path.join(self.directory, "batch.txt")
+        stream = open(filename, 'w')
+
+        for id in range(1, self.count + 1):
+            stream.write("{0} {1}\n".format(id, self.get_sidecar(id)))
+
+        stream.close()
+        return filename
+
+    def run(self):
+        """Runs all of the scenarios, first with an empty cache and then
+        again with the cache from the previous run."""
+
+        os.makedirs(os.path.join(self.directory, "movies"))
+        sidecars = [self.get_sidecar(id) for id in range(1, self.count + 1)]
+        batch = self.write_batch()
+
+        for phase in ("cold", "warm"):
+            self.measure(
+                "id-" + phase,
+                lambda: self.run_each(
+                    mfgames_media.themoviedb.IdProcess,
+                    lambda id: ["Movie {0} ({1})".format(id, 1950 + id % 70)]))
+
+        for phase in ("cold", "warm"):
+            self.measure(
+                "json-" + phase,
+                lambda: self.run_each(
+                    mfgames_media.themoviedb.JsonProcess,
+                    lambda id: ["--force", str(id), self.get_sidecar(id)]))
+
+        self.measure(
+            "json-batch-warm",
+            lambda: self.run_once(
+                mfgames_media.themoviedb.JsonBatchProcess,
+                ["--force", "--rate", "0", batch]))
+        self.measure(
+            "json-batch-uncached",
+            lambda: self.run_once(
+                mfgames_media.themoviedb.JsonBatchProcess,
+                ["--force", "--rate", "0", "--no-cache", batch]))
+
+        for phase in ("cold", "current"):
+            self.measure(
+                "poster-" + phase,
+                lambda: self.run_each(
+                    mfgames_media.themoviedb.PosterProcess,
+                    lambda id: [self.get_sidecar(id)]))
+
+        self.measure(
+            "poster-batch-force",
+            lambda: self.run_once(
+                mfgames_media.themoviedb.PosterBatchProcess,
+                ["--force"] + sidecars))
+
+        for phase in ("cold", "current"):
+            self.measure(
+                "nfo-" + phase,
+                lambda: self.run_each(
+                    mfgames_media.themoviedb.NfoProcess,
+                    lambda id: [self.get_sidecar(id)]))
+
+        return self.results
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the TMDB processes against a local server.")
+    parser.add_argument(
+        '--count', '-n',
+        type=int,
+        default=100,
+        help='The number of movies in each scenario.')
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.02,
+        help='Seconds the server waits before answering each request.')
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=0,
+        help='The requests per second before the server answers with 429.')
+    parser.add_argument(
+        '--output', '-o',
+        type=str,
+        help='File to write the results to as JSON.')
+    args = parser.parse_args(arguments)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    # Start up the server and give the scenarios a scratch directory.
+    server = mfgames_media.themoviedb.server.StandInServer(
+        latency=args.latency,
+        rate=args.rate)
+    server.start()
+    directory = tempfile.mkdtemp(prefix="bench-tmdb-")
+
+    try:
+        results = Benchmark(server, directory, args.count).run()
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
+
+    if args.output:
+        stream = open(args.output, 'w')
+        simplejson.dump(results, stream, sort_keys=True, indent=4)
+        stream.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
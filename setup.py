@@ -32,6 +32,7 @@ setup(
 
     # Scripts
     scripts=[
+        'src/mfgames-catalogue',
         'src/mfgames-mplayer',
         'src/mfgames-tellico',
         'src/mfgames-tmdb',
@@ -40,7 +41,9 @@ setup(
     # Packages
     packages=[
         "mfgames_media",
+        "mfgames_media.amarok",
         "mfgames_media.mplayer",
+        "mfgames_media.themoviedb",
         ],
     package_dir = {'': 'src'}
     )
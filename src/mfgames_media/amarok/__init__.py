@@ -0,0 +1,775 @@
+"""Contains the various Amarok processing classes."""
+
+
+import errno
+import logging
+import multiprocessing.pool
+import os
+import re
+
+import MySQLdb
+import MySQLdb.cursors
+
+import mfgames_tools.process
+
+import mfgames_media.amarok.copier
+import mfgames_media.amarok.journal
+import mfgames_media.amarok.manifest
+import mfgames_media.amarok.planner
+import mfgames_media.amarok.snapshot
+import mfgames_media.amarok.transcoder
+
+
+# The number of rows pulled from the server at a time when streaming
+# a query.
+FETCH_SIZE = 1000
+
+
+class AmarokException(Exception):
+    """Indicates that the arguments given to an Amarok process can't be
+    used."""
+    pass
+
+
+class AmarokProcess(mfgames_tools.process.Process):
+    """Extends the basic Process class to handle Amarok databases."""
+
+    def __init__(self):
+        super(AmarokProcess, self).__init__()
+        self.db = None
+
+    def process(self, args):
+        """Performs processing on a single Amarok database."""
+
+        # Call the parent to process the arguments first.
+        super(AmarokProcess, self).process(args)
+        self.connect(args)
+
+    def connect(self, args):
+        """Connects to the Amarok database."""
+
+        # Set up logging to report usage.
+        log = logging.getLogger('amarok')
+
+        self.db = MySQLdb.connect (
+            host = args.db_host,
+            user = args.db_user,
+            passwd = args.db_pass,
+            db = args.db_name)
+
+        log.info("Connected to Amarok database: " + args.db_name)
+
+    def setup_arguments(self, parser):
+        """Sets up the command-line arguments connecting to the Amarok
+        database."""
+
+        super(AmarokProcess, self).setup_arguments(parser)
+
+        # Add the Amarok file options.
+        parser.add_argument(
+            '--db-user',
+            type=str,
+            default='',
+            help='The database username to use.')
+        parser.add_argument(
+            '--db-host',
+            type=str,
+            default='localhost',
+            help='The database host to use.')
+        parser.add_argument(
+            '--db-pass',
+            type=str,
+            default='',
+            help='The database password to use.')
+        parser.add_argument(
+            '--db-name',
+            type=str,
+            default='amarok',
+            help='The database name to use.')
+
+
+class PackDevice(object):
+    """Describes a single destination being packed with its own limits,
+    along with the manifest of what is already on it and the journal of
+    an interrupted pack."""
+
+    def __init__(self, path, max_size, min_rating):
+        self.path = path
+        self.max_size = max_size
+        self.min_rating = min_rating
+        self.manifest = mfgames_media.amarok.manifest.DestinationManifest(
+            path)
+        self.journal = mfgames_media.amarok.journal.PackJournal(path)
+        self.present = {}
+        self.steps = None
+
+    def load(self, rescan=False, restart=False):
+        """Finds the files already on the device and loads the steps
+        left over from an interrupted pack, if there are any."""
+
+        # Start by getting the names of all the files in the directory
+        # and their respective sizes. We trust the manifest from the
+        # last run and only rescan the directories that have changed
+        # since then.
+        if rescan or not self.manifest.load():
+            self.manifest.refresh(True)
+        else:
+            self.manifest.refresh()
+
+        # These are keyed by the lowercase relative name since VFAT
+        # doesn't care about case.
+        self.present = dict([
+            (relativename.lower(), (relativename, bytes))
+            for relativename, bytes in self.manifest.get_files().iteritems()])
+
+        # If the last pack was interrupted, we pick up where it stopped
+        # instead of planning again.
+        if restart:
+            self.journal.discard()
+
+        if self.journal.load():
+            self.steps = self.journal.get_remaining()
+
+
+class PackProcess(AmarokProcess):
+    """Takes the files referred to by the Amarok database and packs
+    them into one or more directories, taking into account the disk
+    limits of each one."""
+
+    def __init__(self):
+        super(PackProcess, self).__init__()
+
+    def connect(self, args):
+        """Waits to connect to the database until we know we need it,
+        since we may be resuming or planning from a snapshot."""
+
+        pass
+
+    def process(self, args):
+        """Packs files into the given directories."""
+
+        # Call the parent to process the arguments first.
+        super(PackProcess, self).process(args)
+
+        # Set up logging to report usage.
+        log = logging.getLogger('pack')
+
+        # Verify and report the incoming values.
+        devices = [self.get_device(args, spec) for spec in args.devices]
+
+        for device in devices:
+            if not os.path.exists(device.path):
+                raise AmarokException("Cannot find directory: " + device.path)
+
+            log.info("Scanning directory: " + device.path)
+            device.load(args.rescan, args.restart)
+
+            log.info(
+                "Found {0} files using {1}".format(
+                    len(device.present),
+                    self.to_human(
+                        sum([size for name, size in device.present.values()]))))
+
+            if device.steps is not None:
+                log.info("Resuming interrupted pack: " + device.path)
+
+        # Go through all the files in the database once for all of the
+        # devices that need to be planned, then plan each one from the
+        # same tracks.
+        planning = [device for device in devices if device.steps is None]
+
+        if planning:
+            # When transcoding, the size in the database isn't the size
+            # on the device so we can't filter by it.
+            if args.transcode:
+                max_size = None
+            else:
+                max_size = max([device.max_size for device in planning])
+
+            log.info("Identifying files")
+            index = self.query_tracks(
+                args,
+                min([device.min_rating for device in planning]),
+                max_size)
+
+            transcoder = self.get_transcoder(args)
+
+            if transcoder:
+                transcoder.prepare(
+                    index,
+                    args.source_directory,
+                    args.source_workers)
+
+            for device in planning:
+                device.steps = self.plan(args, device, index)
+
+                # Encode the tracks the plan picked that aren't cached
+                # yet, then plan again with their real sizes until the
+                # plan only uses tracks we have. The dry run only uses
+                # the estimated sizes.
+                while transcoder and not args.dry_run:
+                    outputs = [
+                        step.source
+                        for step in device.steps
+                        if step.action == "copy"
+                        and transcoder.is_pending(step.source)]
+
+                    if not outputs:
+                        break
+
+                    transcoder.transcode(outputs)
+                    device.steps = self.plan(args, device, index)
+
+                if not args.dry_run:
+                    device.journal.start(device.steps)
+
+        if args.dry_run:
+            for device in devices:
+                log.info("Plan for " + device.path)
+                self.report_steps(device.steps)
+
+            return
+
+        # Each device is usually on its own bus, so they are all
+        # written at the same time.
+        pool = multiprocessing.pool.ThreadPool(len(devices))
+
+        try:
+            pool.map(lambda device: self.execute(args, device), devices, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_transcoder(self, args):
+        """Creates the transcoder if any extensions need transcoding."""
+
+        if not args.transcode:
+            return None
+
+        return mfgames_media.amarok.transcoder.Transcoder(
+            args.transcode,
+            args.transcode_command,
+            args.transcode_extension,
+            args.transcode_cache,
+            args.transcode_workers,
+            args.transcode_ratio)
+
+    def get_device(self, args, spec):
+        """Parses a destination, which is either a path or a path
+        followed by "=", its maximum size, and optionally ":" and its
+        minimum rating. Anything not given comes from the arguments."""
+
+        path = spec
+        max_size = args.max_size
+        min_rating = args.min_rating
+
+        if "=" in spec:
+            path, limits = spec.rsplit("=", 1)
+            limits = limits.split(":")
+            max_size = limits[0]
+
+            if len(limits) > 1:
+                min_rating = int(limits[1])
+
+        if not max_size:
+            raise AmarokException("No maximum size for " + path)
+
+        return PackDevice(path, self.from_human(max_size), min_rating)
+
+    def plan(self, args, device, index):
+        """Plans the pack for a device from the tracks in the database
+        and returns the steps to carry it out."""
+
+        log = logging.getLogger('pack')
+        present = device.present
+
+        # Build up the tracks for this device from the shared ones,
+        # using the size of the copy already on the device if we have
+        # it.
+        tracks = []
+
+        for entry in index:
+            if entry.rating < device.min_rating:
+                continue
+
+            if entry.rpath in present:
+                size = present[entry.rpath][1]
+            else:
+                size = entry.size
+
+            tracks.append(
+                mfgames_media.amarok.planner.Track(
+                    entry.rpath,
+                    entry.source,
+                    entry.dest,
+                    entry.rating,
+                    entry.score,
+                    size,
+                    entry.rpath in present))
+
+        # Anything in the destination that isn't a track we want needs
+        # to be deleted.
+        wanted = set([track.rpath for track in tracks])
+        unknown = dict([
+            (rpath, size)
+            for rpath, (name, size) in present.iteritems()
+            if rpath not in wanted])
+
+        # Figure out the best set of tracks that fits on the device,
+        # evicting the lower-value ones if a better set fits.
+        planner = mfgames_media.amarok.planner.PackPlanner(
+            device.max_size,
+            args.rating_base,
+            args.score_weight,
+            args.keep_bonus)
+        plan = planner.plan(tracks, unknown)
+
+        log.info(
+            "Planned {0} of {1} for {2}: keeping {3} files, "
+            "copying {4} files ({5}), deleting {6} files ({7})".format(
+                self.to_human(plan.used_bytes),
+                self.to_human(device.max_size),
+                device.path,
+                len(plan.keep),
+                len(plan.copy),
+                self.to_human(plan.copy_bytes),
+                len(plan.delete),
+                self.to_human(plan.delete_bytes)))
+
+        # The deletes come first so we have room for the new files.
+        steps = []
+
+        for rpath in plan.delete:
+            steps.append(
+                mfgames_media.amarok.journal.PackStep(
+                    "delete",
+                    present[rpath][0],
+                    present[rpath][1]))
+
+        # A transcoded track already has the full path to the cached
+        # output as its source, which the join leaves alone.
+        for track in plan.copy:
+            steps.append(
+                mfgames_media.amarok.journal.PackStep(
+                    "copy",
+                    track.dest,
+                    track.size,
+                    os.path.join(args.source_directory, track.source)))
+
+        return steps
+
+    def report_steps(self, steps):
+        """Reports the steps that would be carried out."""
+
+        log = logging.getLogger('pack')
+
+        for step in steps:
+            if step.action == "delete":
+                log.info("  Would remove {0}".format(step.path))
+            else:
+                log.info(
+                    "  Would copy {0} ({1})".format(
+                        step.path,
+                        self.to_human(step.size)))
+
+        copies = [step for step in steps if step.action == "copy"]
+        log.info(
+            "Would delete {0} files and copy {1} files ({2})".format(
+                len(steps) - len(copies),
+                len(copies),
+                self.to_human(sum([step.size for step in copies]))))
+
+    def execute(self, args, device):
+        """Carries out the steps for a device, recording each one in
+        the journal as it finishes."""
+
+        log = logging.getLogger('pack')
+        steps = device.steps
+        journal = device.journal
+        manifest = device.manifest
+
+        # Remove the files first so we have room for the new ones. The
+        # file may already be gone if we were interrupted after removing
+        # it but before the journal recorded it.
+        for step in steps:
+            if step.action != "delete":
+                continue
+
+            log.info("  Removing {0}".format(step.path))
+
+            try:
+                os.remove(os.path.join(device.path, step.path))
+            except OSError, exception:
+                if exception.errno != errno.ENOENT:
+                    raise
+
+            manifest.remove(step.path)
+            journal.finish_step(step)
+
+        manifest.save()
+
+        # Copy the new files into the destination, recording each one
+        # as soon as it is in place.
+        jobs = [
+            mfgames_media.amarok.copier.CopyJob(
+                step.source,
+                os.path.join(device.path, step.path),
+                step.size,
+                step)
+            for step in steps
+            if step.action == "copy"]
+
+        def finish_job(job):
+            manifest.add(job.data.path)
+            journal.finish_step(job.data)
+
+        engine = mfgames_media.amarok.copier.CopyEngine(
+            args.source_workers,
+            args.dest_workers,
+            device.path)
+
+        try:
+            copied = engine.copy(jobs, finish_job)
+        finally:
+            manifest.save()
+
+        journal.close()
+
+        log.info(
+            "Copied {0} files to {1}, {2} failed".format(
+                len(copied),
+                device.path,
+                len(jobs) - len(copied)))
+
+    def query_tracks(self, args, min_rating, max_size=None):
+        """Finds the tracks at or above the minimum rating and figures
+        out their sizes from the size Amarok recorded for the source
+        file. The tracks are shared by all of the devices, so none of
+        them are present."""
+
+        tracks = {}
+        missing = []
+
+        for row in self.get_rows(args, min_rating, max_size):
+            # Pull out the fields and remove the common prefixes from
+            # the path. Amarok always put . in front of the path. We also
+            # have to handle some characters that are not valid in VFAT
+            # filesystems.
+            score = row[0]
+            rating = row[1]
+            rpath = row[2]
+            filesize = row[3]
+
+            rpath = str.replace(rpath, "." + args.source_directory, '')
+            spath = rpath
+
+            rpath = str.replace(rpath, ":", " -")
+            rpath = str.replace(rpath, "?", "")
+            rpath = str.replace(rpath, "./", "/")
+
+            dpath = rpath
+            rpath = rpath.lower()
+
+            # We trust the size in the database and only look at the
+            # source file if Amarok doesn't know it.
+            track = mfgames_media.amarok.planner.Track(
+                rpath,
+                spath,
+                dpath,
+                rating,
+                score,
+                filesize or 0,
+                False)
+            tracks[rpath] = track
+
+            if not track.size:
+                missing.append(track)
+
+        # Look up the sizes of the remaining source files in parallel
+        # since they are usually on a network share. The ones we can't
+        # find are left out.
+        sizes = mfgames_media.amarok.copier.get_sizes(
+            [
+                os.path.join(args.source_directory, track.source)
+                for track in missing],
+            args.source_workers)
+
+        for track, size in zip(missing, sizes):
+            if size is None:
+                del tracks[track.rpath]
+            else:
+                track.size = size
+
+        return tracks.values()
+
+    def get_rows(self, args, min_rating, max_size=None):
+        """Retrieves the score, rating, path, and size of the tracks.
+        These come from the snapshot of an earlier query if the database
+        hasn't changed since, or if we can't or shouldn't use the
+        database at all."""
+
+        log = logging.getLogger('pack')
+
+        if args.source_directory:
+            prefix = "." + args.source_directory
+        else:
+            prefix = None
+
+        if args.no_snapshot:
+            super(PackProcess, self).connect(args)
+            return self.stream_rows(prefix, min_rating, max_size)
+
+        snapshot = mfgames_media.amarok.snapshot.TrackSnapshot(args.snapshot)
+        usable = snapshot.load() and snapshot.covers(
+            prefix,
+            min_rating,
+            max_size)
+
+        if args.offline:
+            if not usable:
+                raise IOError(
+                    "No snapshot covers this pack: " + snapshot.filename)
+
+            log.info("Using snapshot: " + snapshot.filename)
+            return snapshot.get_rows(min_rating, max_size)
+
+        try:
+            super(PackProcess, self).connect(args)
+        except MySQLdb.Error, exception:
+            if not usable:
+                raise
+
+            log.warning(
+                "Using snapshot since we cannot connect to the database: "
+                + str(exception))
+            return snapshot.get_rows(min_rating, max_size)
+
+        marker = self.get_marker()
+
+        if usable and snapshot.marker == marker:
+            log.info("Database has not changed, using snapshot")
+            return snapshot.get_rows(min_rating, max_size)
+
+        # Write the snapshot while we stream the rows to the caller.
+        return snapshot.save(
+            marker,
+            prefix,
+            min_rating,
+            max_size,
+            self.stream_rows(prefix, min_rating, max_size))
+
+    def stream_rows(self, prefix, min_rating, max_size=None):
+        """Queries the database for the tracks, streaming the results
+        from the server so the whole collection is never held in memory
+        at once."""
+
+        # Let the database filter out everything we'd throw away
+        # anyway: the tracks below the minimum rating, the ones outside
+        # of the source directory, and the ones that could never fit.
+        sql = ("SELECT "
+               + "s.score, "
+               + "s.rating, "
+               + "u.rpath, "
+               + "t.filesize "
+               + "FROM statistics s "
+               + "JOIN urls u "
+               + "ON s.url = u.id "
+               + "LEFT JOIN tracks t "
+               + "ON t.url = u.id "
+               + "WHERE s.rating >= %s")
+        params = [min_rating]
+
+        if prefix:
+            sql += " AND SUBSTRING(u.rpath, 1, %s) = %s"
+            params += [len(prefix), prefix]
+
+        if max_size:
+            sql += " AND (t.filesize IS NULL OR t.filesize <= %s)"
+            params.append(max_size)
+
+        cursor = self.db.cursor(MySQLdb.cursors.SSCursor)
+
+        try:
+            cursor.execute(sql, params)
+
+            while (1):
+                # Fetch the next batch of rows from the server.
+                rows = cursor.fetchmany(FETCH_SIZE)
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield tuple(row)
+        finally:
+            cursor.close()
+
+    def get_marker(self):
+        """Retrieves a cheap summary of the database that changes
+        whenever a track is added, removed, rated, or modified, which
+        tells us if a snapshot is still current."""
+
+        cursor = self.db.cursor()
+        cursor.execute("SELECT "
+                       + "COUNT(*), MAX(id), SUM(rating), SUM(score) "
+                       + "FROM statistics")
+        marker = list(cursor.fetchone())
+        cursor.execute("SELECT "
+                       + "COUNT(*), MAX(id), MAX(modifydate) "
+                       + "FROM tracks")
+        marker += list(cursor.fetchone())
+        cursor.close()
+
+        return ":".join([str(value) for value in marker])
+
+    def from_human(self, format):
+        """Converts a formatted string, like 10KB or 10 into an
+        integer value."""
+
+        # Look for straight numbers which don't need anything.
+        if re.match('^\d+$', format) != None:
+            # This is a straight number, so just return it.
+            return int(format)
+
+        # Look for a standard format.
+        match = re.match('^(\d+)([KMG])B?$', format)
+
+        if match == None:
+            raise AmarokException("Cannot parse " + format)
+        
+        # Pull out the number and the multiplier.
+        value = int(match.group(1))
+
+        suffix = match.group(2)
+
+        if suffix == 'K':
+            return value * 1000
+
+        if suffix == 'M':
+            return value * 1000 * 1000
+
+        if suffix == 'G':
+            return value * 1000 * 1000 * 1000
+
+    def to_human(self, value):
+        """Converts a value string into a formatted string."""
+
+        if value > 1000 * 1000 * 1000:
+            return "{0:.2f} GB".format(value / 1000.0 / 1000.0 / 1000.0)
+
+        if value > 1000 * 1000:
+            return "{0:.2f} MB".format(value / 1000.0 / 1000.0)
+
+        if value > 1000:
+            return "{0:.2f} KB".format(value / 1000.0)
+
+        return value
+
+    def setup_arguments(self, parser):
+        """Sets up the command-line arguments connecting to the Amarok
+        database."""
+
+        super(PackProcess, self).setup_arguments(parser)
+
+        # Add the Amarok file options.
+        parser.add_argument(
+            '--max-size',
+            type=str,
+            help='The maximum size to allow for copied files, unless a destination has its own.')
+        parser.add_argument(
+            '--min-rating',
+            type=int,
+            default=7, # 4 stars
+            help='The minimum rating to copy, unless a destination has its own.')
+        parser.add_argument(
+            '--rating-base',
+            type=float,
+            default=2.0,
+            help='How much more each half-star is worth than the one below it.')
+        parser.add_argument(
+            '--score-weight',
+            type=float,
+            default=1.0,
+            help='How much the Amarok score counts, 1.0 makes a perfect score worth half a star.')
+        parser.add_argument(
+            '--keep-bonus',
+            type=float,
+            default=0.1,
+            help='The extra value of a file already in the destination to avoid churn.')
+        parser.add_argument(
+            '--source-workers',
+            type=int,
+            default=4,
+            help='The number of files to read from the source at the same time.')
+        parser.add_argument(
+            '--dest-workers',
+            type=int,
+            default=1,
+            help='The number of files to write to the destination at the same time.')
+        parser.add_argument(
+            '--transcode',
+            type=str,
+            action='append',
+            metavar='EXT',
+            help='An extension of the files to transcode before packing, such as flac.')
+        parser.add_argument(
+            '--transcode-command',
+            type=str,
+            default=mfgames_media.amarok.transcoder.DEFAULT_COMMAND,
+            help='The encoder command, where {input} and {output} are the files.')
+        parser.add_argument(
+            '--transcode-extension',
+            type=str,
+            default=mfgames_media.amarok.transcoder.DEFAULT_EXTENSION,
+            help='The extension of the files created by the encoder.')
+        parser.add_argument(
+            '--transcode-cache',
+            type=str,
+            help='Directory to keep the transcoded files in.')
+        parser.add_argument(
+            '--transcode-workers',
+            type=int,
+            help='The number of encoders to run at the same time, defaults to the number of cores.')
+        parser.add_argument(
+            '--transcode-ratio',
+            type=float,
+            default=mfgames_media.amarok.transcoder.DEFAULT_RATIO,
+            help='The expected size of a transcoded file compared to its source before it is encoded.')
+        parser.add_argument(
+            '--snapshot',
+            type=str,
+            help='The file to keep a snapshot of the database query in.')
+        parser.add_argument(
+            '--no-snapshot',
+            action='store_true',
+            help='If used, the database is always queried and no snapshot is kept.')
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='If used, the pack is planned from the snapshot without the database.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='If used, the plan is shown without changing the destination.')
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='If used, an interrupted pack is planned again instead of resumed.')
+        parser.add_argument(
+            '--rescan',
+            action='store_true',
+            help='If used, the destination is scanned again instead of trusting its manifest.')
+        parser.add_argument(
+            '--source-directory',
+            type=str,
+            help="Contains the directory roots that need to be removed to determine relative paths.")
+        parser.add_argument(
+            'devices',
+            metavar='path[=size[:rating]]',
+            type=str,
+            nargs='+',
+            help='The paths to pack the files into, each with an optional maximum size and minimum rating.')
+
+    def get_help(self):
+        """Returns the help line for the process."""
+        return 'Packs files from Amarok into a directory.'
@@ -0,0 +1,385 @@
+"""Copies files in parallel using the kernel where it can."""
+
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import multiprocessing.pool
+import os
+import shutil
+import threading
+import time
+
+
+# The number of bytes we ask the kernel to copy at a time. This is also
+# how often the progress is updated.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# The number of bytes we read from the source before waiting for a
+# destination slot, so the source keeps working while the destination
+# is busy writing another file.
+PREFETCH_SIZE = 16 * 1024 * 1024
+
+# The number of seconds between the progress reports.
+REPORT_INTERVAL = 5.0
+
+# The suffix of the file being written until it is complete and renamed
+# to the destination.
+PART_SUFFIX = ".part"
+
+
+def load_kernel_copy():
+    """Finds the system calls that copy between files without going
+    through user space. This returns the copy_file_range and sendfile
+    functions from libc, either of which may be None if the library
+    doesn't have them. Since these are called through ctypes, they
+    release the interpreter lock while the kernel copies."""
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None, None
+
+    copy_file_range = getattr(libc, "copy_file_range", None)
+    sendfile = getattr(libc, "sendfile", None)
+
+    if copy_file_range:
+        copy_file_range.restype = ctypes.c_ssize_t
+        copy_file_range.argtypes = [
+            ctypes.c_int,
+            ctypes.c_void_p,
+            ctypes.c_int,
+            ctypes.c_void_p,
+            ctypes.c_size_t,
+            ctypes.c_uint]
+
+    if sendfile:
+        sendfile.restype = ctypes.c_ssize_t
+        sendfile.argtypes = [
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_void_p,
+            ctypes.c_size_t]
+
+    return copy_file_range, sendfile
+
+
+COPY_FILE_RANGE, SENDFILE = load_kernel_copy()
+
+
+def get_size(path):
+    """Retrieves the size of a file or None if it doesn't exist."""
+
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def get_sizes(paths, workers=4):
+    """Retrieves the sizes of many files at once, which hides the
+    latency of a network share. Missing files have a size of None."""
+
+    pool = multiprocessing.pool.ThreadPool(max(1, workers))
+
+    try:
+        return pool.map(get_size, paths, 64)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class CopyJob(object):
+    """Describes a single file to copy."""
+
+    def __init__(self, source, dest, size=None, data=None):
+        self.source = source
+        self.dest = dest
+        self.size = size
+        self.data = data
+
+
+class CopyProgress(object):
+    """Keeps track of the bytes copied by all the workers and reports
+    the throughput and estimated time remaining."""
+
+    def __init__(self, total_bytes, total_files, name=None):
+        self.log = logging.getLogger('copy')
+        self.name = name
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.bytes = 0
+        self.files = 0
+        self.started = time.time()
+        self.reported = self.started
+        self.lock = threading.Lock()
+
+    def add_bytes(self, count):
+        """Adds to the bytes copied, reporting if it has been long
+        enough since the last report."""
+
+        with self.lock:
+            self.bytes += count
+            now = time.time()
+
+            if now - self.reported < REPORT_INTERVAL:
+                return
+
+            self.reported = now
+
+        self.report()
+
+    def add_file(self):
+        """Counts a finished file."""
+
+        with self.lock:
+            self.files += 1
+
+    def get_rate(self):
+        """Retrieves the overall throughput in bytes per second."""
+
+        elapsed = time.time() - self.started
+        return self.bytes / elapsed if elapsed > 0 else 0
+
+    def report(self):
+        """Logs the current progress."""
+
+        rate = self.get_rate()
+        remaining = max(0, self.total_bytes - self.bytes)
+
+        if rate > 0:
+            eta = int(remaining / rate)
+            eta = "{0}:{1:02d}:{2:02d}".format(
+                eta / 3600,
+                eta / 60 % 60,
+                eta % 60)
+        else:
+            eta = "unknown"
+
+        message = (
+            "Copied {0} of {1} files, {2:.1f} of {3:.1f} MB "
+            "at {4:.2f} MB/s, ETA {5}".format(
+                self.files,
+                self.total_files,
+                self.bytes / 1000000.0,
+                self.total_bytes / 1000000.0,
+                rate / 1000000.0,
+                eta))
+
+        if self.name:
+            message = self.name + ": " + message
+
+        self.log.info(message)
+
+
+class CopyEngine(object):
+    """Copies files with a pool of workers. The source workers limit
+    how many files are read at the same time while the destination
+    workers limit how many are written, so a slow flash device only
+    sees a few writers while the network share keeps reading ahead.
+    Each worker reads the start of its file before waiting for a
+    destination slot, then lets the kernel copy the rest with
+    copy_file_range or sendfile, falling back to plain reads and
+    writes when neither works between the two filesystems. Each file
+    is written under a temporary name and renamed when it is complete,
+    so an interrupted copy never looks like a finished file."""
+
+    def __init__(self, source_workers=4, dest_workers=1, name=None):
+        self.log = logging.getLogger('copy')
+        self.name = name
+        self.source_workers = max(1, source_workers)
+        self.dest_slots = threading.Semaphore(max(1, dest_workers))
+        self.progress = None
+        self.callback = None
+        self.callback_lock = threading.Lock()
+
+        # Once a system call fails because of the filesystems, we don't
+        # keep trying it.
+        self.use_copy_file_range = COPY_FILE_RANGE is not None
+        self.use_sendfile = SENDFILE is not None
+
+    def copy(self, jobs, callback=None):
+        """Copies all the jobs and returns the ones that succeeded. The
+        callback is called with each job as soon as it finishes. Only
+        one callback runs at a time, so it doesn't need to be safe to
+        call from multiple threads."""
+
+        total_bytes = sum([job.size or 0 for job in jobs])
+        self.progress = CopyProgress(total_bytes, len(jobs), self.name)
+        self.callback = callback
+
+        pool = multiprocessing.pool.ThreadPool(self.source_workers)
+
+        try:
+            results = pool.map(self.copy_job, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.progress.report()
+
+        return [job for job, result in zip(jobs, results) if result]
+
+    def copy_job(self, job):
+        """Copies a single file, returning true if it was successful."""
+
+        try:
+            self.copy_file(job.source, job.dest)
+        except (IOError, OSError), exception:
+            self.log.error(
+                "Cannot copy {0}: {1}".format(job.source, exception))
+            return False
+
+        self.progress.add_file()
+        self.log.debug("Copied {0}".format(job.dest))
+
+        if self.callback:
+            with self.callback_lock:
+                self.callback(job)
+
+        return True
+
+    def copy_file(self, source, dest):
+        """Copies the source file to the destination."""
+
+        temp_dest = dest + PART_SUFFIX
+
+        try:
+            self.copy_temp(source, temp_dest)
+        except:
+            # Don't leave the partial file behind if we can help it.
+            try:
+                os.remove(temp_dest)
+            except OSError:
+                pass
+
+            raise
+
+        os.rename(temp_dest, dest)
+
+    def copy_temp(self, source, dest):
+        """Copies the source file into the temporary destination."""
+
+        source_fd = os.open(source, os.O_RDONLY)
+
+        try:
+            # Read the start of the file while we wait for the
+            # destination.
+            prefetch = []
+            prefetched = 0
+
+            while prefetched < PREFETCH_SIZE:
+                data = os.read(source_fd, CHUNK_SIZE)
+
+                if not data:
+                    break
+
+                prefetch.append(data)
+                prefetched += len(data)
+
+            with self.dest_slots:
+                dest_dir = os.path.dirname(dest)
+
+                if dest_dir and not os.path.isdir(dest_dir):
+                    try:
+                        os.makedirs(dest_dir)
+                    except OSError:
+                        # Another worker may have created it first.
+                        if not os.path.isdir(dest_dir):
+                            raise
+
+                dest_fd = os.open(
+                    dest,
+                    os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                    0644)
+
+                try:
+                    for data in prefetch:
+                        self.write_all(dest_fd, data)
+                        self.progress.add_bytes(len(data))
+
+                    prefetch = None
+                    self.copy_rest(source_fd, dest_fd)
+                finally:
+                    os.close(dest_fd)
+        finally:
+            os.close(source_fd)
+
+        # Keep the permissions like shutil.copy, but don't fail on
+        # filesystems that can't hold them.
+        try:
+            shutil.copymode(source, dest)
+        except OSError:
+            pass
+
+    def copy_rest(self, source_fd, dest_fd):
+        """Copies the rest of the source from its current position."""
+
+        while True:
+            count = self.copy_chunk(source_fd, dest_fd)
+
+            if not count:
+                return
+
+            self.progress.add_bytes(count)
+
+    def copy_chunk(self, source_fd, dest_fd):
+        """Copies the next chunk using the fastest method that works,
+        returning the number of bytes copied or zero at the end."""
+
+        if self.use_copy_file_range:
+            count = COPY_FILE_RANGE(
+                source_fd,
+                None,
+                dest_fd,
+                None,
+                CHUNK_SIZE,
+                0)
+
+            if count >= 0:
+                return count
+
+            if not self.is_unsupported(ctypes.get_errno()):
+                self.raise_error()
+
+            self.use_copy_file_range = False
+
+        if self.use_sendfile:
+            count = SENDFILE(dest_fd, source_fd, None, CHUNK_SIZE)
+
+            if count >= 0:
+                return count
+
+            if not self.is_unsupported(ctypes.get_errno()):
+                self.raise_error()
+
+            self.use_sendfile = False
+
+        data = os.read(source_fd, CHUNK_SIZE)
+        self.write_all(dest_fd, data)
+        return len(data)
+
+    def is_unsupported(self, code):
+        """Determines if the error from a system call means it can't
+        copy between these files, as opposed to a real failure."""
+
+        return code in (
+            errno.ENOSYS,
+            errno.EXDEV,
+            errno.EINVAL,
+            errno.EOPNOTSUPP,
+            errno.EBADF)
+
+    def raise_error(self):
+        """Raises the error from the last system call."""
+
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+
+    def write_all(self, fd, data):
+        """Writes all the data, even if it takes more than one call."""
+
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
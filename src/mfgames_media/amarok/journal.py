@@ -0,0 +1,168 @@
+"""Records the progress of a pack so an interrupted one can resume."""
+
+
+import logging
+import os
+import threading
+
+import simplejson
+
+
+# The name of the journal inside the destination directory.
+JOURNAL_NAME = ".mfgames-pack.journal"
+
+# Version of the journal. If the file on disk has a different version,
+# it is thrown away and the pack is planned again.
+JOURNAL_VERSION = 1
+
+
+class PackStep(object):
+    """Describes a single change to the destination. The action is
+    either "delete" or "copy", the path is relative to the destination,
+    and the source is only used for copies."""
+
+    __slots__ = (
+        "action",
+        "path",
+        "size",
+        "source",
+        )
+
+    def __init__(self, action, path, size, source=None):
+        self.action = action
+        self.path = path
+        self.size = size
+        self.source = source
+
+    def get_key(self):
+        """Retrieves the key identifying the step in the journal."""
+
+        return self.action + ":" + self.path
+
+    def to_json(self):
+        """Converts the step into a list for the journal."""
+
+        return [self.action, self.path, self.size, self.source]
+
+
+class PackJournal(object):
+    """Keeps the steps of a pack on the destination along with which of
+    them have finished. The first line of the journal is the plan and
+    every line after it is the key of a finished step. The lines are
+    appended and synced as each step finishes, so the journal survives
+    the device being unplugged and a rerun can pick up with the steps
+    that haven't finished yet. The journal is removed once the whole
+    plan has been carried out."""
+
+    def __init__(self, path):
+        self.log = logging.getLogger('journal')
+        self.filename = os.path.join(path, JOURNAL_NAME)
+        self.steps = None
+        self.finished = set()
+        self.stream = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Loads the journal from the destination, returning true if
+        there is an unfinished pack to resume."""
+
+        if not os.path.isfile(self.filename):
+            return False
+
+        stream = open(self.filename, 'r')
+        lines = stream.readlines()
+        stream.close()
+
+        try:
+            header = simplejson.loads(lines[0])
+        except (IndexError, ValueError):
+            self.log.warning("Ignoring invalid journal: " + self.filename)
+            return False
+
+        if header.get("version") != JOURNAL_VERSION:
+            self.log.info("Ignoring out of date journal: " + self.filename)
+            return False
+
+        # The paths are byte strings everywhere else, including the
+        # keys of the finished steps below, so we put them back the way
+        # they came in.
+        self.steps = [
+            PackStep(
+                action,
+                self.encode(path),
+                size,
+                self.encode(source))
+            for action, path, size, source in header["steps"]]
+
+        # The last line may have been cut off if we were unplugged
+        # while writing it, which only means we redo that step.
+        for line in lines[1:]:
+            if line.endswith("\n"):
+                self.finished.add(line[:-1])
+
+        return True
+
+    def start(self, steps):
+        """Writes out a new journal for the steps."""
+
+        self.steps = steps
+        self.finished = set()
+
+        # The plan is written to a temporary file and then renamed so
+        # we never resume from a partial plan.
+        header = {
+            "version": JOURNAL_VERSION,
+            "steps": [step.to_json() for step in steps],
+            }
+        temp_filename = self.filename + ".tmp"
+        stream = open(temp_filename, 'w')
+        stream.write(simplejson.dumps(header) + "\n")
+        stream.flush()
+        os.fsync(stream.fileno())
+        stream.close()
+        os.rename(temp_filename, self.filename)
+
+    def get_remaining(self):
+        """Retrieves the steps that haven't finished yet."""
+
+        return [
+            step
+            for step in self.steps
+            if step.get_key() not in self.finished]
+
+    def finish_step(self, step):
+        """Records that a step has finished. This can be called from
+        multiple threads."""
+
+        with self.lock:
+            if not self.stream:
+                self.stream = open(self.filename, 'a')
+
+            self.stream.write(step.get_key() + "\n")
+            self.stream.flush()
+            os.fsync(self.stream.fileno())
+            self.finished.add(step.get_key())
+
+    def close(self):
+        """Closes the journal, removing it if every step finished."""
+
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if self.steps is not None and not self.get_remaining():
+            self.discard()
+
+    def encode(self, value):
+        """Converts a string read from the journal back into bytes."""
+
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+
+        return value
+
+    def discard(self):
+        """Removes the journal from the destination."""
+
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
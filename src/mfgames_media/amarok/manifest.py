@@ -0,0 +1,202 @@
+"""Keeps track of the files already packed into a destination."""
+
+
+import logging
+import os
+import simplejson
+
+import mfgames_media.walker
+
+
+# The name of the manifest inside the destination directory.
+MANIFEST_NAME = ".mfgames-pack.json"
+
+# The files at the top of the destination that belong to the pack
+# itself, such as the manifest and the journal, start with this.
+RESERVED_PREFIX = ".mfgames-pack"
+
+# Version of the persisted manifest. If the file on disk has a
+# different version, it is thrown away and rebuilt.
+MANIFEST_VERSION = 1
+
+
+class DestinationManifest(object):
+    """Records the relative path, size, and modification time of every
+    file in a packed destination. The manifest is kept on the device
+    itself so it travels with it. Each directory also records its
+    modification time, so a later run only has to stat the directories
+    and rescan the ones that changed instead of walking every file over
+    a slow USB connection. Changes to the contents of an existing file
+    don't change its directory, so those need a rescan to notice."""
+
+    def __init__(self, path, filename=None):
+        self.log = logging.getLogger('manifest')
+        self.path = path
+        self.filename = filename or os.path.join(path, MANIFEST_NAME)
+        self.dirty = False
+
+        # The directories are keyed by their relative path with ""
+        # being the destination itself. Each one has the "mtime" of the
+        # directory, the "files" inside it as a dictionary of the name
+        # to the size and modification time, and the names of its
+        # immediate subdirectories in "dirs".
+        self.directories = {}
+
+    def load(self):
+        """Loads the manifest from the destination, if it exists."""
+
+        if not os.path.isfile(self.filename):
+            self.log.info("Manifest does not exist: " + self.filename)
+            return False
+
+        try:
+            stream = open(self.filename, 'r')
+            data = simplejson.load(stream)
+            stream.close()
+        except ValueError:
+            self.log.warning("Ignoring invalid manifest: " + self.filename)
+            return False
+
+        if data.get("version") != MANIFEST_VERSION:
+            self.log.info("Ignoring out of date manifest: " + self.filename)
+            return False
+
+        self.directories = data["directories"]
+        return True
+
+    def save(self):
+        """Writes out the manifest to the destination if it has
+        changed."""
+
+        if not self.dirty:
+            return
+
+        # Write out to a temporary file and then rename it so we
+        # never leave a truncated manifest if we are unplugged.
+        data = {
+            "version": MANIFEST_VERSION,
+            "directories": self.directories,
+            }
+        temp_filename = self.filename + ".tmp"
+        stream = open(temp_filename, 'w')
+        simplejson.dump(data, stream)
+        stream.close()
+        os.rename(temp_filename, self.filename)
+
+        self.dirty = False
+
+    def refresh(self, rebuild=False, workers=4):
+        """Brings the manifest up to date with the destination, only
+        rescanning the directories whose modification time has changed
+        unless rebuild is true."""
+
+        if rebuild:
+            self.directories = {}
+            self.dirty = True
+
+        walker = mfgames_media.walker.TreeWalker(
+            ignore=[RESERVED_PREFIX + "*"],
+            workers=workers)
+        found = set()
+
+        for directory in walker.walk_directories(self.path, self.get_dirs):
+            found.add(directory.relpath)
+
+            if directory.files is None:
+                continue
+
+            files = {}
+
+            for entry in directory.files:
+                name = os.path.basename(entry.relpath)
+                files[name] = [entry.size, entry.mtime]
+
+            self.directories[directory.relpath] = {
+                "mtime": directory.mtime,
+                "files": files,
+                "dirs": directory.dirs,
+                }
+            self.dirty = True
+
+        # Remove the directories that no longer exist.
+        for reldir in self.directories.keys():
+            if reldir not in found:
+                del self.directories[reldir]
+                self.dirty = True
+
+    def get_dirs(self, reldir, mtime):
+        """Retrieves the subdirectories of a directory if it hasn't
+        changed since it was last scanned. Changes inside the
+        subdirectories do not change the modification time of this one,
+        so they are still walked. Saving the manifest always changes the
+        destination itself, so it is always rescanned."""
+
+        record = self.directories.get(reldir)
+
+        if record and record["mtime"] == mtime and reldir:
+            return record["dirs"]
+
+        return None
+
+    def get_files(self):
+        """Retrieves a dictionary of the relative path of every file in
+        the destination to its size."""
+
+        files = {}
+
+        for reldir, record in self.directories.iteritems():
+            for name, (size, mtime) in record["files"].iteritems():
+                files[os.path.join(reldir, name)] = size
+
+        return files
+
+    def add(self, relpath):
+        """Records a file that was copied into the destination."""
+
+        reldir, name = os.path.split(relpath)
+        record = self.add_directory(reldir)
+        stat = os.stat(os.path.join(self.path, relpath))
+        record["files"][name] = [stat.st_size, stat.st_mtime]
+        self.update_mtime(reldir)
+
+    def remove(self, relpath):
+        """Records a file that was removed from the destination."""
+
+        reldir, name = os.path.split(relpath)
+        record = self.directories.get(reldir)
+
+        if record and name in record["files"]:
+            del record["files"][name]
+            self.update_mtime(reldir)
+
+    def add_directory(self, reldir):
+        """Makes sure we have a record for a directory that was created
+        while packing, along with all of its parents."""
+
+        record = self.directories.get(reldir)
+
+        if record:
+            return record
+
+        record = {
+            "mtime": 0,
+            "files": {},
+            "dirs": [],
+            }
+        self.directories[reldir] = record
+
+        if reldir:
+            parent, name = os.path.split(reldir)
+            self.add_directory(parent)["dirs"].append(name)
+            self.update_mtime(parent)
+
+        self.update_mtime(reldir)
+        return record
+
+    def update_mtime(self, reldir):
+        """Records the current modification time of a directory after
+        we changed it, so the next refresh doesn't rescan it."""
+
+        self.directories[reldir]["mtime"] = os.stat(
+            os.path.join(self.path, reldir)).st_mtime
+        self.dirty = True
@@ -0,0 +1,227 @@
+"""Plans which tracks to pack into a limited amount of space."""
+
+
+import logging
+
+
+class Track(object):
+    """Describes a single track that could be packed. The relative
+    path is the lowercase key used to match the files already in the
+    destination, the source is the path in the collection, and the
+    destination is the path to create in the packed directory."""
+
+    __slots__ = (
+        "rpath",
+        "source",
+        "dest",
+        "rating",
+        "score",
+        "size",
+        "present",
+        "value",
+        )
+
+    def __init__(self, rpath, source, dest, rating, score, size, present):
+        self.rpath = rpath
+        self.source = source
+        self.dest = dest
+        self.rating = rating
+        self.score = score or 0
+        self.size = size
+        self.present = present
+        self.value = 0.0
+
+
+class PackPlan(object):
+    """Contains the results of planning a pack. The keep and copy lists
+    are the tracks selected for the destination, the delete list is the
+    relative paths of the files to remove."""
+
+    def __init__(self):
+        self.keep = []
+        self.copy = []
+        self.delete = []
+        self.value = 0.0
+        self.used_bytes = 0
+        self.copy_bytes = 0
+        self.delete_bytes = 0
+
+
+class PackPlanner(object):
+    """Selects the set of tracks with the most value that fits in the
+    capacity, which is a 0-1 knapsack. The value of a track grows
+    exponentially with its rating plus its score scaled by the score
+    weight, so a track a star higher is worth several lower ones. The
+    tracks already in the destination get a bonus so we don't churn the
+    device for a marginal gain. They don't need to be copied, but they
+    still take up space, so lower-value ones are evicted when a better
+    set fits.
+
+    An exact solution is too expensive for a collection, so this uses
+    the core approach: the tracks are sorted by value per byte and
+    taken greedily, then the tracks around the point where the greedy
+    fill stops are solved exactly with dynamic programming over a
+    coarse grid of sizes. Anything left over is filled greedily with
+    the smaller tracks that still fit."""
+
+    def __init__(
+        self,
+        capacity,
+        rating_base=2.0,
+        score_weight=1.0,
+        keep_bonus=0.1,
+        core_size=64,
+        resolution=10000):
+        self.log = logging.getLogger('pack')
+        self.capacity = capacity
+        self.rating_base = rating_base
+        self.score_weight = score_weight
+        self.keep_bonus = keep_bonus
+        self.core_size = core_size
+        self.resolution = resolution
+
+    def get_value(self, track):
+        """Calculates the value of having the track on the device.
+        Each half-star multiplies the value by the rating base. Amarok
+        scores go from 0 to 100, so a weight of 1.0 makes the score
+        worth up to half a star."""
+
+        value = self.rating_base ** (
+            track.rating + self.score_weight * track.score / 100.0)
+
+        if track.present:
+            value *= 1.0 + self.keep_bonus
+
+        return value
+
+    def plan(self, tracks, unknown=None):
+        """Plans the pack for the tracks. The unknown files are the
+        relative paths and sizes of the files in the destination that
+        aren't tracks we want, which are always deleted."""
+
+        # Calculate the value of every track, ignoring anything that
+        # could never be packed.
+        candidates = []
+
+        for track in tracks:
+            if track.size <= 0 or track.size > self.capacity:
+                continue
+
+            track.value = self.get_value(track)
+
+            if track.value > 0:
+                candidates.append(track)
+
+        candidates.sort(
+            key=lambda track: (-track.value / track.size, track.rpath))
+
+        # Fill greedily until we find the first track that doesn't
+        # fit. This is the break point of the knapsack.
+        remaining = self.capacity
+        selected = set()
+        index = 0
+
+        while index < len(candidates) \
+                and candidates[index].size <= remaining:
+            remaining -= candidates[index].size
+            selected.add(index)
+            index += 1
+
+        # Solve the tracks around the break point exactly. The ones
+        # before the core stay selected and the ones after it are only
+        # considered by the final greedy fill.
+        if index < len(candidates):
+            start = max(0, index - self.core_size / 2)
+            end = min(len(candidates), index + self.core_size / 2)
+            core = range(start, end)
+
+            for core_index in core:
+                if core_index in selected:
+                    selected.remove(core_index)
+                    remaining += candidates[core_index].size
+
+            for core_index in self.solve_core(candidates, core, remaining):
+                selected.add(core_index)
+                remaining -= candidates[core_index].size
+
+            # Fill whatever space is left over with the rest of the
+            # tracks that still fit.
+            for fill_index in range(end, len(candidates)):
+                if candidates[fill_index].size <= remaining:
+                    selected.add(fill_index)
+                    remaining -= candidates[fill_index].size
+
+        # Build up the plan from the selected tracks.
+        plan = PackPlan()
+
+        for index, track in enumerate(candidates):
+            if index in selected:
+                plan.value += track.value
+                plan.used_bytes += track.size
+
+                if track.present:
+                    plan.keep.append(track)
+                else:
+                    plan.copy.append(track)
+                    plan.copy_bytes += track.size
+
+        # Anything present that wasn't selected needs to be evicted.
+        kept = set([track.rpath for track in plan.keep])
+
+        for track in tracks:
+            if track.present and track.rpath not in kept:
+                plan.delete.append(track.rpath)
+                plan.delete_bytes += track.size
+
+        for rpath, size in (unknown or {}).iteritems():
+            plan.delete.append(rpath)
+            plan.delete_bytes += size
+
+        # Copy the most valuable tracks first so an interrupted pack
+        # still has the best of the plan.
+        plan.copy.sort(key=lambda track: (-track.value, track.rpath))
+        plan.delete.sort()
+
+        return plan
+
+    def solve_core(self, candidates, core, capacity):
+        """Solves the knapsack exactly for the core tracks with the
+        sizes rounded up to a grid so the table stays small. Rounding
+        up means the solution always fits in the real capacity."""
+
+        if not core or capacity <= 0:
+            return []
+
+        unit = max(1, capacity / self.resolution)
+        cells = capacity / unit
+
+        # The best value for each used size and which tracks make it
+        # up. We go from the largest size down so each track is only
+        # used once.
+        best = [0.0] * (cells + 1)
+        chosen = [None] * (cells + 1)
+
+        for core_index in core:
+            track = candidates[core_index]
+            weight = -(-track.size // unit)
+
+            if weight > cells:
+                continue
+
+            for cell in range(cells, weight - 1, -1):
+                value = best[cell - weight] + track.value
+
+                if value > best[cell]:
+                    best[cell] = value
+                    chosen[cell] = (core_index, chosen[cell - weight])
+
+        # Walk the chain of choices for the best cell.
+        cell = max(range(cells + 1), key=lambda cell: best[cell])
+        results = []
+        link = chosen[cell]
+
+        while link:
+            results.append(link[0])
+            link = link[1]
+
+        return results
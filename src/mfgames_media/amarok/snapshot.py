@@ -0,0 +1,175 @@
+"""Keeps a local copy of the tracks queried from the Amarok database."""
+
+
+import gzip
+import logging
+import os
+
+import simplejson
+
+
+# Version of the snapshot. If the file on disk has a different version,
+# it is ignored and the database is queried again.
+SNAPSHOT_VERSION = 2
+
+
+def get_snapshot_filename():
+    """Retrieves the default filename of the snapshot."""
+
+    return os.path.join(
+        os.path.expanduser("~"),
+        '.cache',
+        'mfgames',
+        'mfgames-media',
+        'amarok-snapshot.json.gz')
+
+
+class TrackSnapshot(object):
+    """Stores the rows of the pack query along with a marker of the
+    state of the database when it was taken and the filters used. A
+    later query can be answered from the snapshot if the marker hasn't
+    changed and the filters are the same or narrower, or without the
+    database at all when running offline. Each row is the score, the
+    rating, the path, and the file size of a track.
+
+    The first line of the snapshot is the header with the marker and
+    filters and every line after it is a single row. The rows are
+    written as they come from the database and read back one at a time,
+    so the snapshot never holds the whole collection in memory."""
+
+    def __init__(self, filename=None):
+        self.log = logging.getLogger('snapshot')
+        self.filename = filename or get_snapshot_filename()
+        self.marker = None
+        self.prefix = None
+        self.min_rating = None
+        self.max_size = None
+
+    def load(self):
+        """Loads the header of the snapshot, returning true if it could
+        be read."""
+
+        if not os.path.isfile(self.filename):
+            return False
+
+        try:
+            stream = gzip.open(self.filename, 'rb')
+
+            try:
+                header = simplejson.loads(stream.readline())
+            finally:
+                stream.close()
+        except (IOError, ValueError):
+            self.log.warning("Ignoring invalid snapshot: " + self.filename)
+            return False
+
+        if not isinstance(header, dict) \
+                or header.get("version") != SNAPSHOT_VERSION:
+            self.log.info("Ignoring out of date snapshot: " + self.filename)
+            return False
+
+        self.marker = header["marker"]
+        self.prefix = self.encode(header["prefix"])
+        self.min_rating = header["min_rating"]
+        self.max_size = header["max_size"]
+
+        return True
+
+    def save(self, marker, prefix, min_rating, max_size, rows):
+        """Writes out the rows of a query with the filters used and the
+        marker of the database. This yields each row as it is written,
+        so the rows can be used while they are streamed from the
+        database. The snapshot only replaces the old one once every row
+        has been written."""
+
+        directory = os.path.dirname(self.filename)
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "marker": marker,
+            "prefix": prefix,
+            "min_rating": min_rating,
+            "max_size": max_size,
+            }
+        temp_filename = self.filename + ".tmp"
+        stream = gzip.open(temp_filename, 'wb')
+        count = 0
+
+        try:
+            stream.write(simplejson.dumps(header) + "\n")
+
+            for row in rows:
+                stream.write(
+                    simplejson.dumps(row, separators=(',', ':')) + "\n")
+                count += 1
+                yield row
+        except:
+            # If we didn't get every row, throw away what we have.
+            stream.close()
+            os.remove(temp_filename)
+            raise
+
+        stream.close()
+        os.rename(temp_filename, self.filename)
+
+        self.marker = marker
+        self.prefix = prefix
+        self.min_rating = min_rating
+        self.max_size = max_size
+
+        self.log.info(
+            "Wrote snapshot of {0} tracks to {1}".format(
+                count,
+                self.filename))
+
+    def covers(self, prefix, min_rating, max_size):
+        """Determines if the snapshot has every row a query with the
+        given filters would return."""
+
+        if self.marker is None or prefix != self.prefix:
+            return False
+
+        if min_rating < self.min_rating:
+            return False
+
+        if self.max_size is None:
+            return True
+
+        return max_size is not None and max_size <= self.max_size
+
+    def get_rows(self, min_rating, max_size):
+        """Yields the rows that pass the filters."""
+
+        stream = gzip.open(self.filename, 'rb')
+
+        try:
+            # Skip over the header.
+            stream.readline()
+
+            for line in stream:
+                score, rating, rpath, filesize = simplejson.loads(line)
+
+                if rating < min_rating:
+                    continue
+
+                if max_size is not None \
+                        and filesize is not None \
+                        and filesize > max_size:
+                    continue
+
+                # The database gives us byte strings for the paths, so
+                # we put them back the way they came in.
+                yield (score, rating, self.encode(rpath), filesize)
+        finally:
+            stream.close()
+
+    def encode(self, value):
+        """Converts a string read from the snapshot back into bytes."""
+
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+
+        return value
@@ -0,0 +1,245 @@
+"""Transcodes tracks into a smaller format before they are packed."""
+
+
+import hashlib
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import shlex
+import subprocess
+
+
+# The default command used to transcode a track. The {input} and
+# {output} are replaced with the source and the file to create.
+DEFAULT_COMMAND = "ffmpeg -v error -y -i {input} -vn -c:a libvorbis -q:a 5 {output}"
+
+# The default extension of the transcoded files.
+DEFAULT_EXTENSION = "ogg"
+
+# The fraction of the source size we expect a transcoded file to be
+# before we know better.
+DEFAULT_RATIO = 0.3
+
+
+def get_cache_directory():
+    """Retrieves the default directory for the transcoded files."""
+
+    return os.path.join(
+        os.path.expanduser("~"),
+        '.cache',
+        'mfgames',
+        'mfgames-media',
+        'transcode')
+
+
+def get_mtime(path):
+    """Retrieves the modification time of a file or None if it doesn't
+    exist."""
+
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class Transcoder(object):
+    """Replaces the tracks in formats that take up too much room with
+    transcoded copies kept in a local cache. The cache is keyed by the
+    source path, its modification time, and the profile, which is the
+    encoder command and extension, so a track is only encoded once
+    until it or the profile changes.
+
+    The tracks are prepared before planning with the size of the cached
+    copy or an estimate if there isn't one yet. Only the tracks the plan
+    actually selects get encoded, after which the plan is made again
+    with the real sizes. Each worker runs its own encoder process, so
+    the pool keeps all the cores busy."""
+
+    def __init__(
+        self,
+        extensions,
+        command=DEFAULT_COMMAND,
+        extension=DEFAULT_EXTENSION,
+        directory=None,
+        workers=None,
+        ratio=DEFAULT_RATIO):
+        self.log = logging.getLogger('transcode')
+        self.extensions = set([
+            "." + name.lower().lstrip(".")
+            for name in extensions])
+        self.command = command
+        self.extension = "." + extension.lstrip(".")
+        self.directory = directory or get_cache_directory()
+        self.workers = workers or multiprocessing.cpu_count()
+        self.ratio = ratio
+        self.profile = hashlib.sha1(
+            self.command + "\0" + self.extension).hexdigest()
+
+        # The tracks that still need to be encoded are keyed by the
+        # cached output with the original source, size, and paths so we
+        # can go back to them if the encoder fails.
+        self.pending = {}
+
+    def get_output(self, source, mtime):
+        """Retrieves the cached output for a source file."""
+
+        key = hashlib.sha1(
+            "{0}\0{1!r}\0{2}".format(source, mtime, self.profile)
+            ).hexdigest()
+
+        return os.path.join(self.directory, key[0:2], key + self.extension)
+
+    def is_pending(self, output):
+        """Determines if the output still needs to be encoded."""
+
+        return output in self.pending
+
+    def prepare(self, tracks, source_directory, workers=4):
+        """Switches the tracks that need transcoding over to their
+        cached outputs. The source of a switched track becomes the full
+        path to the output and its size is either the real size of the
+        output or an estimate."""
+
+        tracks = [
+            track
+            for track in tracks
+            if os.path.splitext(track.source)[1].lower() in self.extensions]
+
+        if not tracks:
+            return
+
+        # Get the modification times of the sources in parallel since
+        # they are usually on a network share.
+        sources = [
+            os.path.join(source_directory, track.source)
+            for track in tracks]
+        pool = multiprocessing.pool.ThreadPool(max(1, workers))
+
+        try:
+            mtimes = pool.map(get_mtime, sources, 64)
+        finally:
+            pool.close()
+            pool.join()
+
+        cached = 0
+
+        for track, source, mtime in zip(tracks, sources, mtimes):
+            if mtime is None:
+                continue
+
+            output = self.get_output(source, mtime)
+
+            try:
+                size = os.path.getsize(output)
+                cached += 1
+            except OSError:
+                size = None
+                self.pending[output] = (
+                    source,
+                    track.size,
+                    track.rpath,
+                    track.dest,
+                    track)
+
+            # The destination gets the new extension so it doesn't
+            # match the untranscoded file on the device.
+            track.source = output
+            track.dest = os.path.splitext(track.dest)[0] + self.extension
+            track.rpath = os.path.splitext(track.rpath)[0] + self.extension
+            track.size = size or max(1, int(track.size * self.ratio))
+
+        self.log.info(
+            "Found {0} tracks to transcode, {1} already cached".format(
+                len(tracks),
+                cached))
+
+    def transcode(self, outputs):
+        """Encodes the pending outputs in parallel and updates their
+        tracks with the real sizes. If the encoder fails, the track goes
+        back to its original source."""
+
+        jobs = [
+            (self.pending[output][0], output)
+            for output in outputs
+            if output in self.pending]
+
+        if not jobs:
+            return
+
+        self.log.info(
+            "Transcoding {0} tracks with {1} workers".format(
+                len(jobs),
+                self.workers))
+        pool = multiprocessing.pool.ThreadPool(self.workers)
+
+        try:
+            results = pool.map(self.encode, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        for (source, output), result in zip(jobs, results):
+            source, size, rpath, dest, track = self.pending.pop(output)
+
+            if result:
+                track.size = os.path.getsize(output)
+            else:
+                track.source = source
+                track.size = size
+                track.rpath = rpath
+                track.dest = dest
+
+    def encode(self, job):
+        """Runs the encoder for a single track, returning true if it
+        succeeded. The output is written under a temporary name that
+        keeps the extension, since encoders use it to pick the
+        format."""
+
+        source, output = job
+        directory = os.path.dirname(output)
+        temp_output = os.path.join(
+            directory,
+            "tmp-{0}-{1}".format(os.getpid(), os.path.basename(output)))
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another worker may have created it first.
+                if not os.path.isdir(directory):
+                    raise
+
+        commands = [
+            argument.format(input=source, output=temp_output)
+            for argument in shlex.split(self.command)]
+
+        self.log.debug("Transcoding " + source)
+
+        try:
+            process = subprocess.Popen(
+                commands,
+                shell=False,
+                close_fds=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT)
+        except OSError, exception:
+            self.log.error(
+                "Cannot run {0}: {1}".format(commands[0], exception))
+            return False
+
+        messages = process.communicate()[0]
+
+        if process.returncode != 0 or not os.path.isfile(temp_output):
+            self.log.error(
+                "Cannot transcode {0}: {1}".format(
+                    source,
+                    messages.strip() or process.returncode))
+
+            if os.path.isfile(temp_output):
+                os.remove(temp_output)
+
+            return False
+
+        os.rename(temp_output, output)
+        return True
@@ -0,0 +1,480 @@
+"""Single-file SQLite catalogue of the movie metadata sidecars."""
+
+
+import logging
+import mfgames_tools.process
+import os
+import sqlite3
+import time
+
+import simplejson
+
+import mfgames_media.themoviedb.nfo
+import mfgames_media.walker
+
+
+# Schema used to identify the current file structure. If the catalogue
+# on disk has a different one, it needs to be created again.
+DATABASE_SCHEMA = 1
+
+
+def get_catalogue_filename():
+    """Retrieves the default filename for the catalogue."""
+
+    return os.path.join(
+        os.path.expanduser("~"),
+        '.config',
+        'mfgames',
+        'mfgames-media',
+        'catalogue.sqlite3')
+
+
+def get_resolution_sql():
+    """Builds the SQL expression that turns the MPlayer width and height
+    into a resolution name, using the same rules as the NFO files."""
+
+    width = "CAST(json_extract(body, '$.mplayer.\"video-width\"') AS INTEGER)"
+    height = "CAST(json_extract(body, '$.mplayer.\"video-height\"') AS INTEGER)"
+    cases = [
+        "WHEN IFNULL({0}, 0) >= {2} OR IFNULL({1}, 0) >= {3} THEN '{4}'"
+        .format(width, height, min_width, min_height, name)
+        for name, min_width, min_height
+        in mfgames_media.themoviedb.nfo.RESOLUTIONS]
+
+    return "CASE " + " ".join(cases) + " END"
+
+
+class Catalogue(object):
+    """Stores the same documents as the JSON sidecars, with the
+    "enable-mplayer", "mplayer", "enable-tmdb", and "tmdb" keys, in a
+    single SQLite database keyed by the path of the sidecar. The common
+    fields are pulled out of the documents into indexed generated
+    columns so they can be queried without parsing every document. The
+    genres are kept in their own table since a movie has many."""
+
+    def __init__(self, filename=None):
+        self.log = logging.getLogger('catalogue')
+        self.filename = filename or get_catalogue_filename()
+        self.db = None
+
+    def open(self):
+        """Opens the catalogue, creating it if it doesn't exist."""
+
+        exists = os.path.isfile(self.filename)
+
+        if not exists:
+            directory = os.path.dirname(self.filename)
+
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        self.db = sqlite3.connect(self.filename)
+
+        if not exists:
+            self.create()
+            return
+
+        cursor = self.db.cursor()
+        cursor.execute("SELECT value FROM catalogue WHERE name = 'schema'")
+        schema_version = int(cursor.fetchone()[0])
+        cursor.close()
+
+        if schema_version != DATABASE_SCHEMA:
+            raise IOError(
+                "Catalogue schema {0} needs to be created again: {1}"
+                .format(schema_version, self.filename))
+
+    def create(self):
+        """Creates the structure of a new catalogue."""
+
+        self.db.execute(
+            "CREATE TABLE catalogue (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "INSERT INTO catalogue VALUES ('schema', ?)",
+            (str(DATABASE_SCHEMA),))
+        self.db.execute(
+            "CREATE TABLE document ("
+            + "path TEXT PRIMARY KEY, "
+            + "mtime REAL, "
+            + "updated REAL, "
+            + "body TEXT NOT NULL, "
+            + "length REAL GENERATED ALWAYS AS ("
+            + "CAST(json_extract(body, '$.mplayer.length') AS REAL)) VIRTUAL, "
+            + "resolution TEXT GENERATED ALWAYS AS ("
+            + get_resolution_sql()
+            + ") VIRTUAL, "
+            + "tmdb_id INTEGER GENERATED ALWAYS AS ("
+            + "json_extract(body, '$.tmdb.id')) VIRTUAL, "
+            + "title TEXT GENERATED ALWAYS AS ("
+            + "json_extract(body, '$.tmdb.title')) VIRTUAL, "
+            + "release_year INTEGER GENERATED ALWAYS AS ("
+            + "CAST(substr(json_extract(body, '$.tmdb.release_date'), 1, 4) "
+            + "AS INTEGER)) VIRTUAL, "
+            + "poster TEXT GENERATED ALWAYS AS ("
+            + "json_extract(body, '$.\"tmdb-poster\"')) VIRTUAL)")
+        self.db.execute(
+            "CREATE TABLE genre ("
+            + "path TEXT NOT NULL REFERENCES document(path), "
+            + "name TEXT NOT NULL)")
+
+        for column in ("length", "resolution", "tmdb_id", "release_year"):
+            self.db.execute(
+                "CREATE INDEX document_{0} ON document({0})".format(column))
+
+        self.db.execute("CREATE INDEX genre_name ON genre(name)")
+        self.db.execute("CREATE INDEX genre_path ON genre(path)")
+        self.db.commit()
+
+    def close(self):
+        """Commits any changes and closes the catalogue."""
+
+        if self.db:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def get_mtime(self, path):
+        """Retrieves the modification time of the sidecar when it was
+        last imported or None if it isn't in the catalogue."""
+
+        cursor = self.db.cursor()
+        cursor.execute("SELECT mtime FROM document WHERE path = ?", (path,))
+        row = cursor.fetchone()
+        cursor.close()
+
+        return row[0] if row else None
+
+    def get(self, path):
+        """Retrieves the document for the sidecar path or None if it
+        isn't in the catalogue."""
+
+        cursor = self.db.cursor()
+        cursor.execute("SELECT body FROM document WHERE path = ?", (path,))
+        row = cursor.fetchone()
+        cursor.close()
+
+        return simplejson.loads(row[0]) if row else None
+
+    def put(self, path, document, mtime=None):
+        """Stores the document for the sidecar path, replacing any
+        existing one."""
+
+        self.db.execute("DELETE FROM genre WHERE path = ?", (path,))
+        self.db.execute(
+            "INSERT OR REPLACE INTO document (path, mtime, updated, body) "
+            + "VALUES (?, ?, ?, ?)",
+            (path, mtime, time.time(), simplejson.dumps(document)))
+
+        # Pull out the genres into their own table.
+        movie = document.get("tmdb") or {}
+        genres = [
+            (path, genre["name"])
+            for genre in movie.get("genres") or []
+            if genre.get("name")]
+        self.db.executemany("INSERT INTO genre VALUES (?, ?)", genres)
+
+    def query(self, where="", parameters=()):
+        """Retrieves the path and document for every entry that matches
+        the SQL condition, ordered by path."""
+
+        cursor = self.db.cursor()
+        cursor.execute(
+            "SELECT path, body FROM document "
+            + ("WHERE " + where + " " if where else "")
+            + "ORDER BY path",
+            parameters)
+
+        for path, body in cursor:
+            yield path, simplejson.loads(body)
+
+        cursor.close()
+
+
+class CatalogueProcess(mfgames_tools.process.Process):
+    """Common base class for the processes that work with the
+    catalogue."""
+
+    def __init__(self):
+        super(CatalogueProcess, self).__init__()
+
+        # Set up logging for this process.
+        self.log = logging.getLogger('catalogue')
+
+    def process(self, args):
+        # Perform any base class processing.
+        super(CatalogueProcess, self).process(args)
+
+        # Open up the catalogue.
+        self.catalogue = Catalogue(args.catalogue)
+        self.catalogue.open()
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(CatalogueProcess, self).setup_arguments(parser)
+
+        # Add the common catalogue arguments.
+        parser.add_argument(
+            '--catalogue', '-c',
+            type=str,
+            help='The catalogue file to use instead of the default.')
+
+
+class ImportProcess(CatalogueProcess):
+    """Imports the JSON sidecars from directories into the
+    catalogue."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        super(ImportProcess, self).process(args)
+
+        imported = 0
+        current = 0
+        failed = 0
+
+        walker = mfgames_media.walker.TreeWalker(extensions=[".json"])
+
+        for root in args.directory:
+            for entry in walker.walk(os.path.abspath(root)):
+                # Skip the sidecars that haven't changed since they were
+                # last imported.
+                filename = entry.path
+                mtime = entry.mtime
+
+                if self.catalogue.get_mtime(filename) == mtime \
+                        and not args.force:
+                    current += 1
+                    continue
+
+                try:
+                    stream = open(filename, 'r')
+                    document = simplejson.load(stream)
+                    stream.close()
+                except ValueError:
+                    self.log.error("Cannot parse JSON file: " + filename)
+                    failed += 1
+                    continue
+
+                if not isinstance(document, dict):
+                    continue
+
+                self.catalogue.put(filename, document, mtime)
+                imported += 1
+
+        self.catalogue.close()
+        self.log.info(
+            "Imported {0} sidecars, {1} current, {2} failed".format(
+                imported,
+                current,
+                failed))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(ImportProcess, self).setup_arguments(parser)
+
+        # Add the import-specific arguments.
+        parser.add_argument(
+            'directory',
+            type=str,
+            nargs='+',
+            help='Directories to search for the JSON sidecars.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then unchanged sidecars will be imported again.")
+
+    def get_help(self):
+        return "Imports the JSON sidecars in directories into the catalogue."
+
+
+class ExportProcess(CatalogueProcess):
+    """Writes the documents in the catalogue back out as JSON
+    sidecars."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        super(ExportProcess, self).process(args)
+
+        exported = 0
+        current = 0
+
+        for path, document in self.catalogue.query():
+            # If we were given a prefix, only export those sidecars.
+            if args.prefix and not path.startswith(args.prefix):
+                continue
+
+            # The sidecars written by the other processes are pretty
+            # printed, so we do the same and skip the identical ones.
+            formatted = simplejson.dumps(document, sort_keys=True, indent=4)
+
+            if os.path.isfile(path) and not args.force:
+                stream = open(path, 'r')
+                existing = stream.read()
+                stream.close()
+
+                if existing == formatted:
+                    current += 1
+                    continue
+
+            directory = os.path.dirname(path)
+
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            temp_path = path + ".tmp"
+            stream = open(temp_path, 'w')
+            stream.write(formatted)
+            stream.close()
+            os.rename(temp_path, path)
+
+            # Remember the new time so the next import skips it.
+            self.catalogue.put(path, document, os.stat(path).st_mtime)
+            exported += 1
+
+        self.catalogue.close()
+        self.log.info(
+            "Exported {0} sidecars, {1} current".format(exported, current))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(ExportProcess, self).setup_arguments(parser)
+
+        # Add the export-specific arguments.
+        parser.add_argument(
+            '--prefix', '-p',
+            type=str,
+            help='Only export the sidecars whose paths start with this.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then identical sidecars will be written again.")
+
+    def get_help(self):
+        return "Exports the catalogue back out to JSON sidecars."
+
+
+class QueryProcess(CatalogueProcess):
+    """Searches the catalogue for the documents that match all the
+    given conditions."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        super(QueryProcess, self).process(args)
+
+        # Build up the conditions from the arguments.
+        conditions = []
+        parameters = []
+
+        if args.resolution:
+            conditions.append("resolution = ?")
+            parameters.append(args.resolution)
+
+        if args.min_year:
+            conditions.append("release_year >= ?")
+            parameters.append(args.min_year)
+
+        if args.max_year:
+            conditions.append("release_year <= ?")
+            parameters.append(args.max_year)
+
+        if args.min_length:
+            conditions.append("length >= ?")
+            parameters.append(args.min_length)
+
+        if args.max_length:
+            conditions.append("length <= ?")
+            parameters.append(args.max_length)
+
+        for genre in args.genre or []:
+            conditions.append(
+                "path IN (SELECT path FROM genre WHERE name = ?)")
+            parameters.append(genre.decode("utf-8"))
+
+        if args.no_poster:
+            conditions.append("poster IS NULL")
+
+        if args.no_tmdb:
+            conditions.append("tmdb_id IS NULL")
+
+        if args.where:
+            conditions.append("(" + args.where + ")")
+
+        # Write out each of the matching documents.
+        count = 0
+
+        for path, document in self.catalogue.query(
+                " AND ".join(conditions),
+                parameters):
+            movie = document.get("tmdb") or {}
+            values = {
+                "path": path,
+                "title": movie.get("title") or "",
+                "year": (movie.get("release_date") or "")[0:4],
+                "id": movie.get("id") or "",
+                "resolution": mfgames_media.themoviedb.nfo.get_resolution(
+                    document),
+                }
+
+            if isinstance(values["title"], unicode):
+                values["title"] = values["title"].encode("utf-8")
+
+            print args.format % values
+            count += 1
+
+        self.catalogue.close()
+        self.log.info("Found {0} documents".format(count))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(QueryProcess, self).setup_arguments(parser)
+
+        # Add the query-specific arguments.
+        parser.add_argument(
+            '--resolution', '-r',
+            type=str,
+            choices=[
+                name
+                for name, min_width, min_height
+                in mfgames_media.themoviedb.nfo.RESOLUTIONS],
+            help='Only include the movies with this resolution.')
+        parser.add_argument(
+            '--min-year',
+            type=int,
+            help='Only include the movies released in or after this year.')
+        parser.add_argument(
+            '--max-year',
+            type=int,
+            help='Only include the movies released in or before this year.')
+        parser.add_argument(
+            '--min-length',
+            type=float,
+            help='Only include the movies at least this many seconds long.')
+        parser.add_argument(
+            '--max-length',
+            type=float,
+            help='Only include the movies at most this many seconds long.')
+        parser.add_argument(
+            '--genre', '-g',
+            type=str,
+            action='append',
+            help='Only include the movies with this genre.')
+        parser.add_argument(
+            '--no-poster',
+            action='store_true',
+            help='Only include the movies without a downloaded poster.')
+        parser.add_argument(
+            '--no-tmdb',
+            action='store_true',
+            help='Only include the movies without TMDB information.')
+        parser.add_argument(
+            '--where',
+            type=str,
+            help='Additional SQL condition on the length, resolution, '
+            + 'tmdb_id, title, release_year, poster, and body columns.')
+        parser.add_argument(
+            '--format', '-f',
+            type=str,
+            default="%(path)s",
+            help='Output format: %%(path)s, %%(title)s, %%(year)s, %%(id)s, %%(resolution)s')
+
+    def get_help(self):
+        return "Searches the catalogue for movies."
@@ -3,10 +3,151 @@
 
 import logging
 import os
+import shutil
+import tempfile
 
+import mfgames_media.lircrc
 import mfgames_tools.process
 
 
+# The standard fields that always start the tab-separated header.
+STANDARD_FIELDS = ["prog", "button", "config"]
+
+# The number of bytes buffered when writing out a converted file.
+BUFFER_SIZE = 1024 * 1024
+
+
+def read_records(stream, warn=True):
+    """Reads the begin/end blocks of a Lirc configuration, yielding
+    each one as a list of key and value pairs in the order they appear
+    as soon as it ends, so only a single record is ever held in
+    memory. If warn is false, unknown lines are skipped quietly."""
+
+    log = logging.getLogger('tabs')
+    record = []
+
+    for block in stream:
+        # Trim the newlines at the beginning and end of each line.
+        block = block.strip()
+
+        # Skip blank lines.
+        if block == "" or block[0] == "#":
+            continue
+
+        # We don't worry about begins, only end.
+        if block == "begin":
+            continue
+
+        # If we hit the end, then we want to move to the next line in
+        # the file.
+        if block == "end":
+            yield record
+            record = []
+            continue
+
+        # Otherwise, split this on the first equal sign so the value
+        # can contain them.
+        if "=" not in block:
+            if warn:
+                log.warning("Skipping unknown line: " + block)
+
+            continue
+
+        key, value = block.split("=", 1)
+        record.append((key.strip(), value.strip()))
+
+
+def read_columns(stream):
+    """Reads through a Lirc configuration to find all of the fields,
+    returning the names in the order they first appear with the
+    standard ones first and a dictionary of each name to its index."""
+
+    header = list(STANDARD_FIELDS)
+    columns = dict([(key, index) for index, key in enumerate(header)])
+
+    for record in read_records(stream):
+        for key, value in record:
+            if key not in columns:
+                columns[key] = len(header)
+                header.append(key)
+
+    return header, columns
+
+
+def is_seekable(stream):
+    """Determines if we can go back to the beginning of a stream."""
+
+    try:
+        stream.seek(0, os.SEEK_CUR)
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def convert_to_tabs(input, output):
+    """Converts a Lirc configuration into tab-separated values. The
+    header has to come first but isn't known until every record has
+    been seen, so the input is read twice. If the input can't be read
+    twice, like a pipe, it is spilled into a temporary file first.
+    Returns the number of records written."""
+
+    spill = None
+
+    if not is_seekable(input):
+        spill = tempfile.TemporaryFile()
+        shutil.copyfileobj(input, spill, BUFFER_SIZE)
+        input = spill
+
+    try:
+        input.seek(0)
+        header, columns = read_columns(input)
+
+        # Write out the header and then each record as a single row.
+        output.write("\t".join(header) + "\n")
+        input.seek(0)
+        count = 0
+
+        for record in read_records(input, False):
+            row = [""] * len(header)
+
+            for key, value in record:
+                row[columns[key]] = value
+
+            output.write("\t".join(row) + "\n")
+            count += 1
+
+        return count
+    finally:
+        if spill:
+            spill.close()
+
+
+def convert_to_lirc(input, output):
+    """Converts tab-separated values into a Lirc configuration, one row
+    at a time. Returns the number of records written."""
+
+    # Pull off the first record and parse it for key values.
+    header = [key.strip() for key in input.readline().split("\t")]
+    count = 0
+
+    for line in input:
+        # Write out each field on its own separate line, skipping the
+        # empty ones, and the whole record at once.
+        lines = ["begin\n"]
+
+        for key, value in zip(header, line.split("\t")):
+            value = value.strip()
+
+            if value:
+                lines.append("\t" + key + " = " + value + "\n")
+
+        lines.append("end\n")
+        output.write("".join(lines))
+        count += 1
+
+    return count
+
+
 class ConvertToTabSeparatedValues(mfgames_tools.process.Process):
     """Converts the given input file into a tab separated values."""
 
@@ -24,80 +165,13 @@ class ConvertToTabSeparatedValues(mfgames_tools.process.Process):
         log = logging.getLogger('tabs')
         log.info('Processing Lirc input: ' + args.input.name)
 
-        # Open up the file which is a formatted text file. Since
-        # we don't expect the file to be huge, we just load
-        # everything up into memory.
-        contents = args.input.readlines()
-
-        # Create a header with the standard fields we use.
-        header = []
-        header.append("prog")
-        header.append("button")
-        header.append("config")
-
-        # Create a list of lines we are writing out since we want
-        # to output the generated header first.
-        lines = []
-        
-        # Loop through the lines in the file.
-        records = []
-        record = {}
-
-        for block in contents:
-            # Trim the newlines at the beginning and end of
-            # each line.
-            block = block.strip()
-            
-            # Skip blank lines.
-            if block == "" or block[0] == "#":
-                continue
-            
-            # We don't worry about begins, only end.
-            if block == "begin":
-                continue
-            
-            # If we hit the end, then we want to move to the
-            # next line in the file.
-            if block == "end":
-                records.append(record)
-                record = {}
-                continue
-
-            # Otherwise, split this on the equal sign.
-            parts = block.split("=", 2)
-            key = parts[0].strip()
-            value = parts[1].strip()
-
-            # If we don't have the header in the list, then we
-            # need to append it.
-            if key not in header:
-                header.append(key)
+        # Stream the records into the output so we never hold more
+        # than one of them in memory.
+        with open(args.output, 'w', BUFFER_SIZE) as output:
+            count = convert_to_tabs(args.input, output)
+
+        log.info('Wrote {0} records'.format(count))
 
-            # Add the value into the record at the right location.
-            index = header.index(key)
-            record[index] = value
-
-        # Write out the contents of the file.
-        with open(args.output, 'w+') as output:
-            # Write out the header.
-            output.write("\t".join(header) + "\n")
-
-            # Go through each of the records.
-            for record in records:
-                # Write out the fields in the same orders.
-                for index in range(len(header)):
-                    # Check to see if we have data in the record.
-                    # If we do, write it out to the output.
-                    if index in record:
-                        output.write(record[index])
-
-                    # Add a tab or newline depending if we are at
-                    # the last header record.
-                    if index == len(header) - 1:
-                        output.write("\n")
-                    else:
-                        output.write("\t")
-                    
     def setup_arguments(self, parser):
         """
         Sets up the command-line arguments for the tab
@@ -138,36 +212,13 @@ class ConvertToLirc(mfgames_tools.process.Process):
         log = logging.getLogger('tabs')
         log.info('Processing TSV input: ' + args.input.name)
 
-        # Open up the file which is a formatted text file. Since
-        # we don't expect the file to be huge, we just load
-        # everything up into memory.
-        contents = args.input.readlines()
-
-        # Pull off the first record and parse it for key values.
-        header = contents.pop(0).split("\t")
-
-        # Open up a handle to the output file.
-        with open(args.output, 'w+') as output:
-            # Go through the contents and write out each field
-            # on its own separate line.
-            for line in contents:
-                # Write out the begin record.
-                output.write("begin\n")
-
-                # Go through all the fields.
-                record = line.split("\t")
-
-                for index in range(len(record)):
-                    key = header[index].strip()
-                    value = record[index].strip()
+        # Stream the rows into the output so we never hold more than
+        # one of them in memory.
+        with open(args.output, 'w', BUFFER_SIZE) as output:
+            count = convert_to_lirc(args.input, output)
 
-                    if not value == '':
-                        output.write(
-                            "\t" + key + " = " + value + "\n")
+        log.info('Wrote {0} records'.format(count))
 
-                # Finish up the record.
-                output.write("end\n")
-                    
     def setup_arguments(self, parser):
         """
         Sets up the command-line arguments for the tab
@@ -189,3 +240,137 @@ class ConvertToLirc(mfgames_tools.process.Process):
     def get_help(self):
         """Returns the help line for the process."""
         return 'Converts tab-separated values into a Lirc configuration.'
+
+
+class CompileLircTable(mfgames_tools.process.Process):
+    """Parses a lircrc with its includes and modes and writes out the
+    table a key dispatcher can load."""
+
+    def __init__(self):
+        super(CompileLircTable, self).__init__()
+
+    def process(self, args):
+        """Compiles the lircrc into a table."""
+
+        # Call the parent to process the arguments first.
+        super(CompileLircTable, self).process(args)
+
+        # Set up logging to report usage.
+        log = logging.getLogger('lircrc')
+
+        # If the table is already up to date with the same lircrc,
+        # there is nothing to do.
+        table = mfgames_media.lircrc.LircTable()
+
+        if not args.force \
+                and table.load(args.output) \
+                and os.path.abspath(args.input) in table.sources \
+                and table.is_current():
+            log.info('Table is already current: ' + args.output)
+            return
+
+        # Parse the lircrc and compile the results.
+        log.info('Processing Lirc input: ' + args.input)
+        parser = mfgames_media.lircrc.LircParser()
+        entries = parser.parse(args.input)
+        table.compile(entries, parser.filenames)
+        table.save(args.output)
+
+        log.info(
+            'Wrote {0} entries from {1} files into {2} keys'.format(
+                len(entries),
+                len(parser.filenames),
+                len(table.table)))
+
+    def setup_arguments(self, parser):
+        """
+        Sets up the command-line arguments for the table compiling
+        process.
+        """
+
+        super(CompileLircTable, self).setup_arguments(parser)
+
+        parser.add_argument(
+            'input',
+            type=str,
+            help='Contains the lircrc to compile, along with its includes.')
+        parser.add_argument(
+            'output',
+            type=str,
+            help='The destination file for the compiled table.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help='If used, the table is compiled even if it is current.')
+
+    def get_help(self):
+        """Returns the help line for the process."""
+        return 'Compiles a lircrc into a lookup table.'
+
+
+class LookupLircTable(mfgames_tools.process.Process):
+    """Prints the configs a button triggers in a compiled table."""
+
+    def __init__(self):
+        super(LookupLircTable, self).__init__()
+
+    def process(self, args):
+        """Looks up a button in the table."""
+
+        # Call the parent to process the arguments first.
+        super(LookupLircTable, self).process(args)
+
+        # Load the table, which has to be compiled first.
+        table = mfgames_media.lircrc.LircTable()
+
+        if not table.load(args.table):
+            raise IOError('Cannot load the table: ' + args.table)
+
+        if not table.is_current():
+            logging.getLogger('lircrc').warning(
+                'Table is out of date: ' + args.table)
+
+        # Print out each config, with the mode change after it.
+        for binding in table.lookup(
+            args.prog,
+            args.button,
+            args.mode,
+            args.remote):
+            for config in binding[1]:
+                print config
+
+            if binding[2]:
+                print "mode = " + binding[2]
+
+    def setup_arguments(self, parser):
+        """
+        Sets up the command-line arguments for the lookup process.
+        """
+
+        super(LookupLircTable, self).setup_arguments(parser)
+
+        parser.add_argument(
+            'table',
+            type=str,
+            help='Contains the table compiled from a lircrc.')
+        parser.add_argument(
+            'prog',
+            type=str,
+            help='The program receiving the button.')
+        parser.add_argument(
+            'button',
+            type=str,
+            help='The button pressed, with a sequence separated by spaces.')
+        parser.add_argument(
+            '--mode', '-m',
+            type=str,
+            default=mfgames_media.lircrc.GLOBAL_MODE,
+            help='The mode the program is in.')
+        parser.add_argument(
+            '--remote', '-r',
+            type=str,
+            help='The remote the button was pressed on.')
+
+    def get_help(self):
+        """Returns the help line for the process."""
+        return 'Prints the configs a button triggers in a compiled table.'
@@ -0,0 +1,313 @@
+"""Parses lircrc files into entries and compiles them into a table."""
+
+
+import logging
+import marshal
+import os
+
+
+# Version of the compiled table. If the file on disk has a different
+# version, it is ignored and the lircrc is parsed again.
+TABLE_VERSION = 1
+
+# The mode of the entries that aren't inside a mode block.
+GLOBAL_MODE = ""
+
+# The button or remote that matches any other.
+WILDCARD = "*"
+
+
+class LircEntry(object):
+    """Describes a single begin/end block of a lircrc. The mode is the
+    block the entry is inside of, or the global mode, while change_mode
+    is the "mode" field which switches to another mode when the entry
+    is triggered. An entry with more than one button is a sequence and
+    one with more than one config cycles through them on each press."""
+
+    __slots__ = (
+        "mode",
+        "prog",
+        "remote",
+        "buttons",
+        "configs",
+        "change_mode",
+        "flags",
+        "repeat",
+        "delay",
+        "filename",
+        "line",
+        )
+
+    def __init__(self, mode, filename, line):
+        self.mode = mode
+        self.prog = None
+        self.remote = WILDCARD
+        self.buttons = []
+        self.configs = []
+        self.change_mode = None
+        self.flags = []
+        self.repeat = 0
+        self.delay = 0
+        self.filename = filename
+        self.line = line
+
+    def get_key(self):
+        """Retrieves the key of the entry in the compiled table. The
+        buttons of a sequence are joined with spaces."""
+
+        return (self.mode, self.prog, " ".join(self.buttons))
+
+    def get_binding(self):
+        """Retrieves what the entry does when triggered, in the form it
+        is stored in the compiled table."""
+
+        return (
+            self.remote,
+            tuple(self.configs),
+            self.change_mode,
+            tuple(self.flags),
+            self.repeat,
+            self.delay)
+
+
+class LircParser(object):
+    """Parses a lircrc into a list of entries in the order they appear.
+    The "include" lines are expanded in place, relative to the file
+    they are in, and the entries inside "begin mode" and "end mode"
+    blocks keep the name of their mode. The problems lirc would reject
+    are logged with the file and line, and the line or entry skipped."""
+
+    def __init__(self):
+        self.log = logging.getLogger('lircrc')
+        self.entries = []
+        self.filenames = []
+
+    def parse(self, filename):
+        """Parses the lircrc and everything it includes, returning the
+        list of entries."""
+
+        self.parse_file(os.path.abspath(filename), [], GLOBAL_MODE)
+        return self.entries
+
+    def parse_file(self, filename, stack, mode):
+        """Parses a single file. The stack has the files including this
+        one, so an include loop can be caught, and the mode is the one
+        the include was in since lirc keeps it across files."""
+
+        realpath = os.path.realpath(filename)
+
+        if realpath in stack:
+            self.log.error("Skipping recursive include: " + filename)
+            return
+
+        stack = stack + [realpath]
+        self.filenames.append(filename)
+        start_mode = mode
+        entry = None
+
+        with open(filename, 'r') as stream:
+            for number, line in enumerate(stream, 1):
+                # Trim the line and skip blanks and comments.
+                line = line.strip()
+
+                if line == "" or line[0] == "#":
+                    continue
+
+                location = "{0}:{1}: ".format(filename, number)
+
+                # Inside an entry, everything is a field until the end.
+                if entry:
+                    if line == "end":
+                        self.add_entry(entry, location)
+                        entry = None
+                    elif "=" in line:
+                        key, value = line.split("=", 1)
+                        self.set_field(
+                            entry,
+                            key.strip(),
+                            value.strip(),
+                            location)
+                    else:
+                        self.log.warning(location + "Skipping line: " + line)
+
+                    continue
+
+                # Outside of an entry, we have the structure lines.
+                parts = line.split(None, 1)
+                command = parts[0]
+                argument = parts[1].strip() if len(parts) > 1 else None
+
+                if command == "begin" and argument is None:
+                    entry = LircEntry(mode, filename, number)
+                elif command == "begin":
+                    if mode != GLOBAL_MODE:
+                        self.log.warning(
+                            location + "Cannot nest modes, ending " + mode)
+
+                    mode = argument
+                elif command == "end" and argument is not None:
+                    if argument != mode:
+                        self.log.warning(
+                            location + "Ending mode {0} inside {1}".format(
+                                argument,
+                                mode or "no mode"))
+
+                    mode = GLOBAL_MODE
+                elif command == "include" and argument is not None:
+                    self.include(filename, argument, location, stack, mode)
+                else:
+                    self.log.warning(location + "Skipping line: " + line)
+
+        if entry:
+            self.log.warning(
+                "{0}:{1}: Skipping entry without an end".format(
+                    filename,
+                    entry.line))
+
+        if mode != start_mode:
+            self.log.warning(
+                "{0}: Mode {1} has no end".format(filename, mode))
+
+    def include(self, filename, argument, location, stack, mode):
+        """Parses an included file. The name may be in quotes or angle
+        brackets and is relative to the file including it."""
+
+        if argument[0] + argument[-1] in ('""', '<>'):
+            argument = argument[1:-1]
+
+        path = os.path.join(
+            os.path.dirname(filename),
+            os.path.expanduser(argument))
+
+        if not os.path.isfile(path):
+            self.log.error(location + "Cannot find include: " + path)
+            return
+
+        self.parse_file(path, stack, mode)
+
+    def set_field(self, entry, key, value, location):
+        """Sets a single field of an entry."""
+
+        if key == "prog":
+            entry.prog = value
+        elif key == "remote":
+            entry.remote = value
+        elif key == "button":
+            entry.buttons.append(value)
+        elif key == "config":
+            entry.configs.append(value)
+        elif key == "mode":
+            entry.change_mode = value
+        elif key == "flags":
+            entry.flags.extend(value.replace("|", " ").split())
+        elif key in ("repeat", "delay"):
+            try:
+                setattr(entry, key, int(value))
+            except ValueError:
+                self.log.warning(
+                    location + "Ignoring invalid {0}: {1}".format(key, value))
+        else:
+            self.log.warning(location + "Ignoring unknown field: " + key)
+
+    def add_entry(self, entry, location):
+        """Adds a finished entry, unless it is missing a field lirc
+        needs to use it."""
+
+        if not entry.prog:
+            self.log.warning(location + "Skipping entry without a prog")
+        elif not entry.buttons:
+            self.log.warning(location + "Skipping entry without a button")
+        else:
+            self.entries.append(entry)
+
+
+class LircTable(object):
+    """Maps the mode, prog, and button of a key press to the bindings
+    of the entries it triggers, so a dispatcher can load the table
+    instead of parsing the lircrc every time it starts. Each binding is
+    a tuple of the remote, the configs, the mode to change to, the
+    flags, the repeat, and the delay.
+
+    The table is written with marshal, which loads plain tuples and
+    strings far faster than parsing text. It keeps the modification
+    time of every file the lircrc included, so it can tell when it needs
+    to be compiled again."""
+
+    def __init__(self):
+        self.sources = {}
+        self.table = {}
+
+    def compile(self, entries, filenames):
+        """Builds the table from the parsed entries. The bindings for
+        each key are in the order of the lircrc."""
+
+        self.sources = {}
+        self.table = {}
+
+        for filename in filenames:
+            self.sources[filename] = os.stat(filename).st_mtime
+
+        for entry in entries:
+            self.table.setdefault(entry.get_key(), []).append(
+                entry.get_binding())
+
+    def load(self, filename):
+        """Loads the table, returning true if it could be read."""
+
+        try:
+            stream = open(filename, 'rb')
+
+            try:
+                version, sources, table = marshal.load(stream)
+            finally:
+                stream.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return False
+
+        if version != TABLE_VERSION:
+            return False
+
+        self.sources = sources
+        self.table = table
+        return True
+
+    def save(self, filename):
+        """Writes out the table."""
+
+        temp_filename = filename + ".tmp"
+        stream = open(temp_filename, 'wb')
+        marshal.dump((TABLE_VERSION, self.sources, self.table), stream)
+        stream.close()
+        os.rename(temp_filename, filename)
+
+    def is_current(self):
+        """Determines if none of the lircrc files have changed since
+        the table was compiled."""
+
+        for filename, mtime in self.sources.iteritems():
+            try:
+                if os.stat(filename).st_mtime != mtime:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    def lookup(self, prog, button, mode=GLOBAL_MODE, remote=None):
+        """Retrieves the bindings triggered by a button, with the ones
+        for that button before the ones for any button. If the remote
+        is given, only the bindings for that remote or any remote are
+        included."""
+
+        bindings = self.table.get((mode, prog, button), [])
+
+        if button != WILDCARD:
+            bindings = bindings + self.table.get((mode, prog, WILDCARD), [])
+
+        if remote is None:
+            return bindings
+
+        return [
+            binding
+            for binding in bindings
+            if binding[0] in (remote, WILDCARD)]
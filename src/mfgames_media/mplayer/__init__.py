@@ -8,6 +8,62 @@ import os
 import simplejson
 
 
+def identify(video):
+    """Runs MPlayer against the video and returns a dictionary of the
+    identification fields, such as "video-width" and "length"."""
+
+    info = {}
+
+    # Figure out the command we'll be running.
+    commands = [
+        "mplayer",
+        "-identify",
+        "-frames", "0",
+        "-vc", "null",
+        "-vo", "null",
+        "-ao", "null",
+        "-msglevel", "all=-1",
+        video];
+
+    process = subprocess.Popen(
+        commands,
+        shell=False,
+        close_fds=True,
+        bufsize=0,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT)
+
+    for line in process.stdout:
+        # Ignore non-ID lines.
+        if not line.startswith("ID_"):
+            continue
+
+        # Split out the two parts of the line.
+        [key, value] = line.split('=')
+
+        # Clean out the white space, remove the "ID_" in front of
+        # it, convert everything to lowercase and change "_" to
+        # "-".
+        key = key.strip()
+        key = key[3:]
+        key = key.lower()
+        key = key.replace("_", "-")
+
+        value = value.strip()
+
+        # Ignore filenames since we can move the file.
+        if key.endswith("filename"):
+            continue
+
+        # Put the key into the value.
+        info[key] = value
+
+    process.stdout.close()
+    process.wait()
+
+    return info
+
+
 class JsonProcess(mfgames_tools.process.Process):
     def __init__(self):
         super(JsonProcess, self).__init__()
@@ -53,53 +109,7 @@ class JsonProcess(mfgames_tools.process.Process):
 
         # Put in the enable flag.
         json["enable-mplayer"] = True
-        json["mplayer"] = {}
-
-        # Figure out the command we'll be running.
-        commands = [
-            "mplayer",
-            "-identify",
-            "-frames", "0",
-            "-vc", "null",
-            "-vo", "null",
-            "-ao", "null",
-            "-msglevel", "all=-1",
-            args.video];
-
-        process = subprocess.Popen(
-            commands,
-            shell=False,
-            close_fds=True,
-            bufsize=0,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT)
-
-        for line in process.stdout:
-            # Ignore non-ID lines.
-            if not line.startswith("ID_"):
-                continue
-
-            # Split out the two parts of the line.
-            [key, value] = line.split('=')
-
-            # Clean out the white space, remove the "ID_" in front of
-            # it, convert everything to lowercase and change "_" to
-            # "-".
-            key = key.strip()
-            key = key[3:]
-            key = key.lower()
-            key = key.replace("_", "-")
-
-            value = value.strip()
-
-            # Ignore filenames since we can move the file.
-            if key.endswith("filename"):
-                continue
-            
-            # Put the key into the value.
-            json["mplayer"][key] = value
-
-        process.stdout.close()
+        json["mplayer"] = identify(args.video)
 
         # Now that we are done, get the formatted JSON file.
         formatted = simplejson.dumps(json, indent=4, sort_keys=True)
@@ -0,0 +1,408 @@
+"""Finds duplicate media files without reading all of them."""
+
+
+import hashlib
+import logging
+import multiprocessing.pool
+import os
+import threading
+
+import simplejson
+
+import mfgames_media.mplayer
+import mfgames_media.walker
+import mfgames_tools.process
+
+
+# The number of bytes read from each sample of a file.
+SAMPLE_SIZE = 64 * 1024
+
+# The number of samples spread across a file, including the start and
+# the end.
+SAMPLE_COUNT = 8
+
+# The number of bytes read at a time when hashing an entire file.
+CHUNK_SIZE = 1024 * 1024
+
+# The fields from MPlayer that have to match for two files to be the
+# same.
+MEDIA_FIELDS = [
+    "length",
+    "video-width",
+    "video-height",
+    ]
+
+
+class DupesFinder(object):
+    """Finds the groups of identical files. The files are bucketed by
+    size, with hard links to the same file only counted once, then by
+    the length and resolution MPlayer found, then by a
+    hash of blocks sampled across the file, and only the files still
+    sharing a bucket have their entire contents hashed. Each step only
+    looks at the files that still have a possible duplicate, so most of
+    a library is never read."""
+
+    def __init__(
+        self,
+        workers=4,
+        sample_count=SAMPLE_COUNT,
+        sample_size=SAMPLE_SIZE,
+        identify=False):
+        self.log = logging.getLogger('dupes')
+        self.workers = max(1, workers)
+        self.sample_count = max(2, sample_count)
+        self.sample_size = sample_size
+        self.identify = identify
+        self.bytes_read = 0
+        self.lock = threading.Lock()
+
+    def find(self, entries):
+        """Finds the duplicates in the walk entries, returning a list of
+        groups where each group is a sorted list of paths to files with
+        the same contents."""
+
+        buckets = {}
+
+        for entry in entries:
+            buckets.setdefault(entry.size, []).append(entry.path)
+
+        buckets = [
+            (size, sorted(set(paths)))
+            for size, paths in buckets.iteritems()]
+        buckets = [bucket for bucket in buckets if len(bucket[1]) > 1]
+        self.report("size", buckets)
+
+        buckets = self.remove_links(buckets)
+        self.report("links", buckets)
+
+        buckets = self.split(buckets, self.get_media_key, True)
+        self.report("media", buckets)
+
+        buckets = self.split(buckets, self.get_sample_hash)
+        self.report("sample", buckets)
+
+        # If the samples covered the whole file, there is no need to
+        # read it again.
+        small = [
+            bucket
+            for bucket in buckets
+            if bucket[0] <= self.sample_count * self.sample_size]
+        large = [
+            bucket
+            for bucket in buckets
+            if bucket[0] > self.sample_count * self.sample_size]
+        buckets = small + self.split(large, self.get_full_hash)
+        self.report("full", buckets)
+
+        groups = [paths for size, paths in buckets]
+        groups.sort()
+        return groups
+
+    def report(self, name, buckets):
+        """Reports the number of candidates left after a step."""
+
+        self.log.info(
+            "After {0}: {1} files in {2} groups".format(
+                name,
+                sum([len(paths) for size, paths in buckets]),
+                len(buckets)))
+
+    def remove_links(self, buckets):
+        """Keeps only the first path to each file in the buckets. Hard
+        links share the same contents but removing one doesn't free
+        anything, so they aren't duplicates."""
+
+        paths = [path for size, bucket in buckets for path in bucket]
+
+        if not paths:
+            return []
+
+        pool = multiprocessing.pool.ThreadPool(self.workers)
+
+        try:
+            inodes = dict(zip(paths, pool.map(self.get_inode, paths, 16)))
+        finally:
+            pool.close()
+            pool.join()
+
+        results = []
+
+        for size, bucket in buckets:
+            seen = set()
+            paths = []
+
+            for path in bucket:
+                inode = inodes[path]
+
+                if inode is None:
+                    continue
+
+                if inode in seen:
+                    self.log.debug("Skipping hard link: " + path)
+                    continue
+
+                seen.add(inode)
+                paths.append(path)
+
+            if len(paths) > 1:
+                results.append((size, paths))
+
+        return results
+
+    def get_inode(self, path):
+        """Retrieves the device and inode of the file, or None if it
+        can't be found."""
+
+        try:
+            stat = os.stat(path)
+        except OSError, exception:
+            self.log.error("Cannot stat {0}: {1}".format(path, exception))
+            return None
+
+        return (stat.st_dev, stat.st_ino)
+
+    def split(self, buckets, function, keep_unknown=False):
+        """Splits each bucket by the key the function returns for each
+        of its files. Files with a key of None are dropped unless
+        keep_unknown is true, where a bucket with any unknown keys is
+        kept whole since we can't tell those files apart."""
+
+        paths = [path for size, bucket in buckets for path in bucket]
+
+        if not paths:
+            return []
+
+        pool = multiprocessing.pool.ThreadPool(self.workers)
+
+        try:
+            keys = dict(zip(paths, pool.map(function, paths, 1)))
+        finally:
+            pool.close()
+            pool.join()
+
+        results = []
+
+        for size, bucket in buckets:
+            if keep_unknown and None in [keys[path] for path in bucket]:
+                results.append((size, bucket))
+                continue
+
+            split = {}
+
+            for path in bucket:
+                if keys[path] is not None:
+                    split.setdefault(keys[path], []).append(path)
+
+            for paths in split.itervalues():
+                if len(paths) > 1:
+                    results.append((size, paths))
+
+        return results
+
+    def get_media_key(self, path):
+        """Retrieves the length and resolution of the file from its
+        sidecar, or by running MPlayer if we are identifying files.
+        Returns None if we don't know them."""
+
+        info = None
+        sidecar = os.path.splitext(path)[0] + ".json"
+
+        if os.path.isfile(sidecar) and sidecar != path:
+            try:
+                stream = open(sidecar, 'r')
+                info = simplejson.load(stream).get("mplayer")
+                stream.close()
+            except (IOError, ValueError, AttributeError):
+                info = None
+
+        if not info and self.identify:
+            info = mfgames_media.mplayer.identify(path)
+
+        if not info or "length" not in info:
+            return None
+
+        return tuple([info.get(field) for field in MEDIA_FIELDS])
+
+    def get_sample_offsets(self, size):
+        """Retrieves the offsets and lengths of the samples of a file.
+        If the samples would cover most of the file, the whole file is
+        a single sample."""
+
+        if size <= self.sample_count * self.sample_size:
+            return [(0, size)]
+
+        last = size - self.sample_size
+
+        return [
+            (last * index / (self.sample_count - 1), self.sample_size)
+            for index in range(self.sample_count)]
+
+    def get_sample_hash(self, path):
+        """Hashes the samples of a file."""
+
+        try:
+            size = os.path.getsize(path)
+            digest = hashlib.sha1()
+            stream = open(path, 'rb')
+
+            try:
+                for offset, length in self.get_sample_offsets(size):
+                    stream.seek(offset)
+                    data = stream.read(length)
+                    digest.update(data)
+                    self.add_bytes(len(data))
+            finally:
+                stream.close()
+
+            return digest.hexdigest()
+        except (IOError, OSError), exception:
+            self.log.error("Cannot read {0}: {1}".format(path, exception))
+            return None
+
+    def get_full_hash(self, path):
+        """Hashes the entire contents of a file."""
+
+        try:
+            digest = hashlib.sha1()
+            stream = open(path, 'rb')
+
+            try:
+                while True:
+                    data = stream.read(CHUNK_SIZE)
+
+                    if not data:
+                        break
+
+                    digest.update(data)
+                    self.add_bytes(len(data))
+            finally:
+                stream.close()
+
+            return digest.hexdigest()
+        except (IOError, OSError), exception:
+            self.log.error("Cannot read {0}: {1}".format(path, exception))
+            return None
+
+    def add_bytes(self, count):
+        """Adds to the count of bytes read from the files."""
+
+        with self.lock:
+            self.bytes_read += count
+
+
+class DupesProcess(mfgames_tools.process.Process):
+    """Reports the groups of identical media files in one or more
+    directory trees."""
+
+    def __init__(self):
+        super(DupesProcess, self).__init__()
+
+    def get_help(self):
+        return "Finds duplicate media files in directories."
+
+    def process(self, args):
+        # Handle the base class' processing.
+        super(DupesProcess, self).process(args)
+
+        # Logging to report the status.
+        log = logging.getLogger("dupes")
+
+        # Walk the directories and gather up the files big enough to
+        # care about.
+        walker = mfgames_media.walker.TreeWalker(
+            extensions=args.extension,
+            ignore=args.ignore,
+            workers=args.walkers)
+        entries = []
+
+        for root in args.directory:
+            log.info("Scanning directory: " + root)
+
+            for entry in walker.walk(root):
+                if entry.size >= args.min_size:
+                    entries.append(entry)
+
+        total_bytes = sum([entry.size for entry in entries])
+        log.info(
+            "Found {0} files using {1:.1f} MB".format(
+                len(entries),
+                total_bytes / 1000000.0))
+
+        # Find the duplicates and print each group with a blank line
+        # between them.
+        finder = DupesFinder(
+            args.workers,
+            args.samples,
+            args.sample_size,
+            args.identify)
+        groups = finder.find(entries)
+        sizes = dict([(entry.path, entry.size) for entry in entries])
+        wasted = 0
+
+        for index, group in enumerate(groups):
+            if index:
+                print
+
+            for path in group:
+                print path
+
+            wasted += sizes[group[0]] * (len(group) - 1)
+
+        log.info(
+            "Found {0} groups of duplicates wasting {1:.1f} MB".format(
+                len(groups),
+                wasted / 1000000.0))
+        log.info(
+            "Read {0:.1f} MB of {1:.1f} MB ({2:.2%})".format(
+                finder.bytes_read / 1000000.0,
+                total_bytes / 1000000.0,
+                float(finder.bytes_read) / total_bytes if total_bytes else 0))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(DupesProcess, self).setup_arguments(parser)
+
+        parser.add_argument(
+            'directory',
+            type=str,
+            nargs='+',
+            help='Directories to search for duplicates.')
+        parser.add_argument(
+            '--extension', '-e',
+            type=str,
+            action='append',
+            help='Only consider files with this extension, such as mkv.')
+        parser.add_argument(
+            '--ignore',
+            type=str,
+            action='append',
+            help='Ignore the files and directories matching this pattern.')
+        parser.add_argument(
+            '--min-size',
+            type=int,
+            default=1024 * 1024,
+            help='Ignore the files smaller than this many bytes.')
+        parser.add_argument(
+            '--identify',
+            action='store_true',
+            help='If used, MPlayer is run on files without a sidecar.')
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=SAMPLE_COUNT,
+            help='The number of blocks sampled from each file.')
+        parser.add_argument(
+            '--sample-size',
+            type=int,
+            default=SAMPLE_SIZE,
+            help='The number of bytes in each sampled block.')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='The number of files to read at the same time.')
+        parser.add_argument(
+            '--walkers',
+            type=int,
+            default=mfgames_media.walker.DEFAULT_WORKERS,
+            help='The number of directories to scan at the same time.')
@@ -0,0 +1,197 @@
+"""Contains the local helpers for working with MythTV storage groups."""
+
+
+import logging
+import os
+import simplejson
+
+import mfgames_media.walker
+
+
+# Version of the persisted storage index. If the file on disk has a
+# different version, it is thrown away and rebuilt.
+INDEX_VERSION = 1
+
+
+class StorageIndex(object):
+    """Maintains an index of the files inside the local MythTV storage
+    group directories. Each directory is walked once and the relative
+    path of every file is mapped to the storage directories that
+    contain it. The modification time of every walked directory is
+    persisted along with the names so later refreshes only rescan the
+    directories that have actually changed."""
+
+    def __init__(self, filename=None):
+        # Set up logging for the index.
+        self.log = logging.getLogger('index')
+
+        # If we weren't given a filename, put it in the configuration
+        # directory next to the other mfgames files.
+        if not filename:
+            filename = os.path.join(
+                os.path.expanduser("~"),
+                '.config',
+                'mfgames',
+                'mfgames-mythtv',
+                'storage-index.json')
+
+        self.filename = filename
+        self.dirty = False
+
+        # The roots are keyed by the storage directory. Each root is a
+        # dictionary of relative directory to a record with the
+        # directory's "mtime", the names of the "files" inside it and
+        # the names of its immediate subdirectories in "dirs".
+        self.roots = {}
+
+        # The lookup table is built from the roots and maps the
+        # relative path of a file to a list of storage directories.
+        self.lookup = {}
+
+    def load(self):
+        """Loads the index from the disk, if it exists."""
+
+        if not os.path.isfile(self.filename):
+            self.log.info("Index does not exist: " + self.filename)
+            return False
+
+        stream = open(self.filename, 'r')
+        data = simplejson.load(stream)
+        stream.close()
+
+        if data.get("version") != INDEX_VERSION:
+            self.log.info("Ignoring out of date index: " + self.filename)
+            return False
+
+        self.roots = data["roots"]
+        self.build_lookup()
+        return True
+
+    def save(self):
+        """Writes out the index to the disk if it has changed."""
+
+        if not self.dirty:
+            return
+
+        # Make sure the directory exists.
+        directory = os.path.dirname(self.filename)
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Write out to a temporary file and then rename it so we
+        # never leave a truncated index if we are interrupted.
+        data = {
+            "version": INDEX_VERSION,
+            "roots": self.roots,
+            }
+        temp_filename = self.filename + ".tmp"
+        stream = open(temp_filename, 'w')
+        simplejson.dump(data, stream)
+        stream.close()
+        os.rename(temp_filename, self.filename)
+
+        self.dirty = False
+
+    def build_lookup(self):
+        """Rebuilds the relative path to storage directory lookup from
+        the roots."""
+
+        self.lookup = {}
+
+        for dirname, root in self.roots.iteritems():
+            for reldir, record in root.iteritems():
+                for name in record["files"]:
+                    relpath = os.path.join(reldir, name)
+                    self.lookup.setdefault(relpath, []).append(dirname)
+
+    def refresh(self, dirnames, rebuild=False):
+        """Walks the given storage directories, only rescanning the
+        directories whose modification time has changed since the last
+        refresh unless rebuild is true."""
+
+        # Drop any roots that are no longer part of the storage groups.
+        for dirname in self.roots.keys():
+            if dirname not in dirnames:
+                self.log.info("Removing storage directory: " + dirname)
+                del self.roots[dirname]
+                self.dirty = True
+
+        # Go through the requested directories and refresh each one.
+        for dirname in dirnames:
+            if rebuild or dirname not in self.roots:
+                self.roots[dirname] = {}
+
+            self.log.info("Refreshing storage directory: " + dirname)
+            self.refresh_root(dirname, self.roots[dirname])
+
+        # Rebuild the lookup table since the files have changed.
+        self.build_lookup()
+
+    def refresh_root(self, dirname, root):
+        """Refreshes a single storage directory. The directories whose
+        modification time hasn't changed are not listed again, but their
+        subdirectories are still checked since changes inside them do
+        not change the modification time of the parent. We only need
+        the names, so the files are never stat'ed."""
+
+        def get_dirs(reldir, mtime):
+            record = root.get(reldir)
+
+            if record and record["mtime"] == mtime:
+                return record["dirs"]
+
+            return None
+
+        walker = mfgames_media.walker.TreeWalker(stat=False)
+        found = set()
+
+        for directory in walker.walk_directories(dirname, get_dirs):
+            found.add(directory.relpath)
+
+            if directory.files is None:
+                continue
+
+            root[directory.relpath] = {
+                "mtime": directory.mtime,
+                "files": [
+                    os.path.basename(entry.relpath)
+                    for entry in directory.files],
+                "dirs": directory.dirs,
+                }
+            self.dirty = True
+
+        # Remove the directories that no longer exist.
+        for reldir in root.keys():
+            if reldir not in found:
+                del root[reldir]
+                self.dirty = True
+
+    def add(self, dirname, relpath):
+        """Adds a single file that was found outside of a refresh,
+        such as through stat probing. Only files inside an already
+        indexed directory are added."""
+
+        if dirname not in self.roots:
+            return
+
+        reldir, name = os.path.split(relpath)
+        record = self.roots[dirname].get(reldir)
+
+        if record and name not in record["files"]:
+            record["files"].append(name)
+            self.lookup.setdefault(relpath, []).append(dirname)
+            self.dirty = True
+
+    def resolve(self, relpath, dirnames):
+        """Looks up the relative path in the index and returns the
+        absolute filename from the first of the given storage
+        directories that contains it, or None if it isn't indexed."""
+
+        relpath = os.path.normpath(relpath)
+
+        for dirname in self.lookup.get(relpath, []):
+            if dirname in dirnames:
+                return os.path.join(dirname, relpath)
+
+        return None
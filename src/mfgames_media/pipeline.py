@@ -0,0 +1,138 @@
+"""Runs items through a series of stages, each with its own workers."""
+
+
+import logging
+import Queue
+import threading
+
+
+# Marker placed in a queue to tell a worker to stop.
+STOP = object()
+
+
+class Stage(object):
+    """Describes a single stage of the pipeline. The function is called
+    with each item and is responsible for deciding if the item needs
+    any work at this stage. The stage runs the given number of workers
+    at the same time, so CPU-bound stages can use one per core while
+    network-bound stages use one per connection. The stage will run
+    after all the stages it requires."""
+
+    def __init__(self, name, function, workers=1, requires=None):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.requires = requires or []
+
+
+class Pipeline(object):
+    """Connects the stages with in-memory queues in dependency order.
+    Every item goes through every stage, even if a stage fails on it,
+    so the later stages can still save whatever work was done."""
+
+    def __init__(self, stages, queue_size=100):
+        self.log = logging.getLogger('pipeline')
+        self.stages = self.sort_stages(stages)
+        self.queue_size = queue_size
+
+    def sort_stages(self, stages):
+        """Sorts the stages so each one comes after the stages it
+        requires while otherwise keeping the given order."""
+
+        names = [stage.name for stage in stages]
+        ordered = []
+        done = set()
+        remaining = list(stages)
+
+        while remaining:
+            for stage in remaining:
+                missing = [
+                    name for name in stage.requires
+                    if name not in done]
+
+                for name in missing:
+                    if name not in names:
+                        raise ValueError(
+                            "Stage {0} requires unknown stage {1}".format(
+                                stage.name,
+                                name))
+
+                if not missing:
+                    break
+            else:
+                raise ValueError("Stages have a circular dependency.")
+
+            remaining.remove(stage)
+            ordered.append(stage)
+            done.add(stage.name)
+
+        return ordered
+
+    def run(self, items):
+        """Runs all the items through the stages and returns them in
+        the order they finished."""
+
+        # Create the queues between the stages. The last queue collects
+        # the finished items. The queues are bounded so a fast stage
+        # doesn't pull everything into memory ahead of a slow one.
+        queues = [Queue.Queue(self.queue_size) for stage in self.stages]
+        finished = Queue.Queue()
+        queues.append(finished)
+
+        # Start up the workers for every stage.
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            stage_threads = []
+
+            for worker in range(stage.workers):
+                thread = threading.Thread(
+                    target=self.work,
+                    name="{0}-{1}".format(stage.name, worker),
+                    args=(stage, queues[index], queues[index + 1]))
+                thread.daemon = True
+                thread.start()
+                stage_threads.append(thread)
+
+            threads.append(stage_threads)
+
+        # Feed the items into the first stage.
+        for item in items:
+            queues[0].put(item)
+
+        # Shut down the stages in order. Once all the workers of a
+        # stage have stopped, nothing else will go into the next one.
+        for index, stage_threads in enumerate(threads):
+            for thread in stage_threads:
+                queues[index].put(STOP)
+
+            for thread in stage_threads:
+                thread.join()
+
+        # Gather up the finished items.
+        results = []
+
+        while not finished.empty():
+            results.append(finished.get())
+
+        return results
+
+    def work(self, stage, input, output):
+        """Processes items for a single worker of a stage."""
+
+        while True:
+            item = input.get()
+
+            if item is STOP:
+                return
+
+            try:
+                stage.function(item)
+            except Exception, exception:
+                self.log.exception(
+                    "{0} failed on {1}: {2}".format(
+                        stage.name,
+                        item,
+                        exception))
+
+            output.put(item)
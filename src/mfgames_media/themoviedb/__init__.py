@@ -0,0 +1,1215 @@
+"""Process classes for working with themoviedb.com."""
+
+
+import atexit
+import urllib
+import simplejson
+import logging
+import mfgames_tools.process
+import os
+import pycurl
+import re
+import sys
+import threading
+import tmdb
+
+import mfgames_media.themoviedb.cache
+import mfgames_media.themoviedb.client
+import mfgames_media.themoviedb.images
+import mfgames_media.themoviedb.limiter
+import mfgames_media.themoviedb.match
+import mfgames_media.themoviedb.metrics
+import mfgames_media.themoviedb.mirror
+import mfgames_media.themoviedb.nfo
+import mfgames_media.themoviedb.posters
+import mfgames_media.walker
+
+
+# The base URL for the version 3 API of themoviedb.com.
+DEFAULT_API_URL = "http://api.themoviedb.org/3"
+
+
+class TmdbProcess(mfgames_tools.process.Process):
+    """Common base class for TMDB processes that handles handling of
+    the API key and common configuration."""
+
+    def __init__(self):
+        super(TmdbProcess, self).__init__()
+
+        # Set up logging for this proces.
+        self.log = logging.getLogger('tmdb')
+        self.cache = None
+        self.clients = threading.local()
+        self.limiter = None
+        self.images = None
+        self.mirror = None
+        self.metrics = mfgames_media.themoviedb.metrics.RequestMetrics()
+
+    def process(self, args):
+        """Loads the TMDB configuration and ensures the API is
+        properly set."""
+
+        # Perform any base class processing.
+        super(TmdbProcess, self).process(args)
+
+        # Get the API key or blow up if we can't figure it out. We
+        # don't need one if we are searching the offline mirror.
+        if not args.api_key and not args.mirror:
+            self.log.error("Cannot find API key from command line "
+                           + "or configuration file.")
+            return False
+
+        # Set up the response cache unless we were told not to.
+        if args.offline and args.no_cache:
+            self.log.error("Cannot use --offline with --no-cache.")
+            return False
+
+        if not args.no_cache:
+            ttls = {}
+
+            for ttl in args.cache_ttl or []:
+                endpoint, sep, seconds = ttl.partition("=")
+
+                if not sep or not endpoint.strip() \
+                        or not seconds.strip().isdigit():
+                    self.log.error(
+                        "Cannot parse --cache-ttl " + ttl
+                        + ", expected endpoint=seconds.")
+                    return False
+
+                ttls[endpoint.strip()] = int(seconds)
+
+            self.cache = mfgames_media.themoviedb.cache.ResponseCache(
+                args.cache_dir,
+                ttls,
+                args.offline)
+
+        # If we have an image store, then the posters are shared
+        # between all the movies.
+        if args.image_store:
+            self.images = mfgames_media.themoviedb.images.ImageStore(
+                args.image_store,
+                args.image_link)
+
+        # If we are using the offline mirror, then open it up.
+        if args.mirror:
+            self.mirror = mfgames_media.themoviedb.mirror.Mirror(
+                args.mirror_file)
+            self.mirror.open()
+
+        # If we are reporting the requests, write them out once the
+        # process is done.
+        if args.metrics:
+            atexit.register(self.metrics.write, args.metrics)
+
+        # Set up the rate limiting for the requests.
+        self.limiter = mfgames_media.themoviedb.limiter.TokenBucket(
+            args.rate,
+            args.burst)
+
+        # We were successful, so return true.
+        return True
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(TmdbProcess, self).setup_arguments(parser)
+
+        # Add the Creole-conversion specific processes.
+        parser.add_argument(
+            '--api-key', '-a',
+            type=str,
+            nargs=1,
+            help='API key from themoviedb.com, required.')
+        parser.add_argument(
+            '--api-url',
+            type=str,
+            default=DEFAULT_API_URL,
+            help='The base URL of the TMDB API, such as a local stand-in server.')
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=4,
+            help='The number of connections to use for concurrent requests.')
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='The maximum requests per second, 0 for unlimited.')
+        parser.add_argument(
+            '--burst',
+            type=int,
+            help='The number of requests allowed in a burst above the rate.')
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=3,
+            help='The number of times to retry a rate-limited request.')
+        parser.add_argument(
+            '--cache-dir',
+            type=str,
+            help='Directory to cache the responses from themoviedb.com.')
+        parser.add_argument(
+            '--cache-ttl',
+            type=str,
+            action='append',
+            help='Seconds a cached response is fresh, as ENDPOINT=SECONDS '
+            + 'where ENDPOINT is configuration, movie, search, or default.')
+        parser.add_argument(
+            '--image-store',
+            type=str,
+            help='Directory to keep a single copy of every downloaded image.')
+        parser.add_argument(
+            '--image-link',
+            type=str,
+            default='hard',
+            choices=['hard', 'symbolic', 'copy'],
+            help='How images are linked from the image store to the movies.')
+        parser.add_argument(
+            '--mirror',
+            action='store_true',
+            help='If used, searches will use the offline TMDB mirror.')
+        parser.add_argument(
+            '--mirror-file',
+            type=str,
+            help='The offline TMDB mirror to use instead of the default.')
+        parser.add_argument(
+            '--metrics',
+            type=str,
+            help='File to write a JSON summary of the requests to, or - for standard error.')
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='If used, responses will not be read from or written to the cache.')
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='If used, responses will only come from the cache.')
+
+    def configure(self):
+        # Configure the TMDB database.
+        tmdb.configure(self.args.api_key)
+
+        # Get the v3 API stuff directly through JSON.
+        url = "{0}/configuration?api_key={1}".format(
+            self.args.api_url.rstrip("/"),
+            self.args.api_key)
+        self.configuration = self.get_json(url)
+
+    def get_images_base_url(self):
+        return self.configuration['images']['base_url']
+
+    def get_client(self):
+        """Retrieves the HTTP client for this process, creating it if
+        needed. The client keeps the connections open between
+        requests. Since curl handles can't be shared between threads,
+        each thread gets its own client."""
+
+        client = getattr(self.clients, "client", None)
+
+        if not client:
+            client = mfgames_media.themoviedb.client.HttpClient(
+                self.args.connections)
+            self.clients.client = client
+
+        return client
+
+    def get_json(self, url):
+        return self.get_json_many([url])[0]
+
+    def get_json_many(self, urls, callback=None, strict=True):
+        """Retrieves the JSON for all of the given URLs, using the
+        cache when possible and downloading the rest concurrently. The
+        results are returned in the same order as the URLs. If a
+        callback is given, it is called with the index and JSON of
+        each URL as it finishes. If strict is false, then a failed
+        request is logged and its result is None instead of raising an
+        exception."""
+
+        results = [None] * len(urls)
+        entries = {}
+        pending = []
+
+        for index, url in enumerate(urls):
+            # If we have a fresh response in the cache, then use it
+            # without going to the network. While offline, any cached
+            # response is good enough.
+            if self.cache:
+                entry = self.cache.get(url)
+
+                if entry and (self.cache.offline
+                              or self.cache.is_fresh(url, entry)):
+                    results[index] = entry["body"]
+                    self.cache.hits += 1
+                    self.metrics.record_cache(
+                        mfgames_media.themoviedb.cache.get_endpoint(url))
+
+                    if callback:
+                        callback(index, results[index])
+
+                    continue
+
+                if self.cache.offline:
+                    exception = mfgames_media.themoviedb.cache.OfflineException(
+                        "Cannot find cached response: "
+                        + self.cache.get_key(url))
+
+                    if strict:
+                        raise exception
+
+                    self.log.error(str(exception))
+                    continue
+
+                if entry:
+                    entries[index] = entry
+
+                self.cache.misses += 1
+
+            pending.append(index)
+
+        # If the server tells us we are going too fast, we stop handing
+        # out tokens until it says we can try again.
+        def check_rate_limit(response):
+            if response.status == 429:
+                delay = mfgames_media.themoviedb.limiter.get_retry_delay(
+                    response,
+                    attempt)
+                self.log.warning(
+                    "Rate limited, waiting {0} seconds".format(delay))
+                self.limiter.pause(delay)
+
+        # Download the remaining URLs, retrying the ones that were
+        # rate limited.
+        attempt = 0
+
+        while pending:
+            requests = []
+
+            for index in pending:
+                # If we have a stale entry, we ask the server if it has
+                # changed.
+                headers = ["Accept: application/json"]
+
+                if index in entries:
+                    headers.extend(self.cache.get_headers(entries[index]))
+
+                requests.append(
+                    mfgames_media.themoviedb.client.Request(
+                        urls[index],
+                        headers))
+
+            responses = self.get_client().perform(
+                requests,
+                check_rate_limit,
+                self.limiter)
+            retry = []
+
+            for index, response in zip(pending, responses):
+                # Keep track of how the request went.
+                cache = None
+
+                if self.cache:
+                    cache = "miss"
+
+                    if index in entries and response.status == 304:
+                        cache = "revalidated"
+
+                self.metrics.record_response(
+                    mfgames_media.themoviedb.cache.get_endpoint(urls[index]),
+                    response,
+                    cache)
+
+                if response.status == 429 and attempt < self.args.retries:
+                    retry.append(index)
+                    continue
+
+                try:
+                    results[index] = self.parse_json(
+                        response,
+                        entries.get(index))
+                except (mfgames_media.themoviedb.client.HttpException,
+                        ValueError), exception:
+                    if strict:
+                        raise
+
+                    self.log.error(str(exception))
+                    continue
+
+                if callback:
+                    callback(index, results[index])
+
+            pending = retry
+            attempt += 1
+
+        return results
+
+    def parse_json(self, response, entry=None):
+        """Parses the JSON from a response and updates the cache. If
+        the response says the stale cache entry is still good, then
+        the entry's body is used instead."""
+
+        if response.error:
+            raise mfgames_media.themoviedb.client.HttpException(
+                "Cannot retrieve {0}: {1}".format(
+                    response.url,
+                    response.error))
+
+        # If the server says the stale entry is still good, use it.
+        if response.status == 304 and entry:
+            self.cache.revalidate(response.url, entry)
+            return entry["body"]
+
+        if response.status != 200:
+            raise mfgames_media.themoviedb.client.HttpException(
+                "Cannot retrieve {0}: HTTP {1}".format(
+                    response.url,
+                    response.status))
+
+        # Parse the resulting JSON and cache it.
+        json = simplejson.loads(response.body)
+
+        if self.cache:
+            self.cache.put(response.url, json, response.headers)
+
+        # Return the resulting JSON file.
+        return json
+
+    def load_sidecar(self, filename):
+        """Loads the JSON sidecar file for a movie, returning an empty
+        one if it doesn't exist or is "-"."""
+
+        if filename == "-":
+            return {}
+
+        if os.path.isfile(filename):
+            self.log.info("Using JSON file: " + filename)
+            stream = open(filename, 'r')
+            json = simplejson.load(stream)
+            stream.close()
+            return json
+
+        self.log.info("Creating JSON file: " + filename)
+        return {}
+
+    def write_sidecar(self, json, filename):
+        """Writes out the JSON sidecar file for a movie or prints it
+        to the output if the filename is "-"."""
+
+        if filename == "-":
+            # Just print it to the output.
+            print simplejson.dumps(json, indent=4, sort_keys=True)
+        else:
+            # Open the stream for writing.
+            stream = open(filename, "w")
+            simplejson.dump(json, stream, sort_keys=True, indent=4)
+            stream.close()
+
+    def get_poster_job(self, filename, sidecar, output, width, force):
+        """Figures out the poster to download for the given sidecar. If
+        the poster doesn't need to be downloaded, this returns None.
+        When the output exists, it is only replaced if the sidecar
+        records that it came from a different poster or if forced."""
+
+        # If the sidecar came from the JSON process, the movie is
+        # inside it. Otherwise, it is the TMDB information itself.
+        movie = sidecar.get("tmdb", sidecar)
+
+        if not movie.get("poster_path"):
+            self.log.info("No poster for " + filename)
+            return None
+
+        # If we don't have an output parameter, we figure it out from
+        # the input filename.
+        if not output:
+            output = os.path.splitext(filename)[0] + ".jpg"
+
+        # Check to see if the file exists. If it does, we can only
+        # replace it if we know it is out of date.
+        key = width + movie['poster_path']
+
+        if os.path.isfile(output) and not force:
+            if sidecar.get("tmdb-poster") == key:
+                self.log.info("Poster is current: " + output)
+                return None
+
+            if "tmdb-poster" not in sidecar:
+                self.log.info("Cannot overwrite file: " + output)
+                return None
+
+        # Build up the path to get the image. This is described in
+        # http://help.themoviedb.org/kb/api/configuration
+        # http://cf2.imgobject.com/t/p/w500/mOTtuakUTb1qY6jG6lzMfjdhLwc.jpg
+        url = "{0}/{1}".format(self.get_images_base_url().rstrip("/"), key)
+
+        return mfgames_media.themoviedb.posters.PosterJob(
+            url,
+            output,
+            key,
+            filename,
+            sidecar)
+
+    def download_posters(self, jobs, write=True):
+        """Downloads the posters for the given jobs and records the
+        poster key in the sidecars that came from the JSON process so
+        unchanged posters can be skipped later. If write is false, the
+        key is recorded but the sidecar is left for the caller to
+        write. If we have an image
+        store, each distinct poster is downloaded into the store once
+        and the outputs are linked to it. Returns the jobs that
+        finished."""
+
+        def record_poster(job):
+            if job.sidecar is not None and "tmdb" in job.sidecar:
+                job.sidecar["tmdb-poster"] = job.key
+
+                if write:
+                    self.write_sidecar(job.sidecar, job.filename)
+
+        downloader = mfgames_media.themoviedb.posters.PosterDownloader(
+            self.get_client(),
+            self.limiter,
+            self.metrics,
+            self.args.retries)
+
+        if not self.images:
+            return downloader.download(jobs, record_poster)
+
+        # Group the jobs by their key so editions sharing a poster
+        # only download it once and skip the ones already stored.
+        keys = {}
+        downloads = []
+
+        for job in jobs:
+            if job.key not in keys:
+                keys[job.key] = []
+
+                if not self.images.contains(job.key):
+                    downloads.append(
+                        mfgames_media.themoviedb.posters.PosterJob(
+                            job.url,
+                            self.images.prepare(job.key),
+                            job.key))
+
+            keys[job.key].append(job)
+
+        self.log.info(
+            "Downloading {0} of {1} posters into the image store".format(
+                len(downloads),
+                len(keys)))
+        downloader.download(downloads)
+
+        # Link every job whose poster is now in the store.
+        finished = []
+
+        for key, key_jobs in keys.iteritems():
+            if not self.images.contains(key):
+                continue
+
+            for job in key_jobs:
+                self.images.link(key, job.output)
+                record_poster(job)
+                finished.append(job)
+
+        return finished
+
+    def search_movies(self, titles, strict=True):
+        """Searches for each of the titles, using the offline mirror if
+        we have one or the TMDB API otherwise. This returns a list of
+        movies in the form of the TMDB search results for each of the
+        titles. If strict is false, a failed search is logged and its
+        result is None instead of raising an exception."""
+
+        if self.mirror:
+            return [self.mirror.search(title) for title in titles]
+
+        urls = [self.get_search_url(title) for title in titles]
+        searches = self.get_json_many(urls, strict=strict)
+
+        return [
+            search["results"] if search is not None else None
+            for search in searches]
+
+    def get_search_url(self, title):
+        """Retrieves the URL for searching for a movie title."""
+
+        if isinstance(title, unicode):
+            title = title.encode("utf-8")
+
+        return "{0}/search/movie?api_key={1}&query={2}".format(
+            self.args.api_url.rstrip("/"),
+            self.args.api_key,
+            urllib.quote_plus(title))
+
+    def get_movie_url(self, id):
+        """Retrieves the URL for the details of a given movie."""
+
+        return "{0}/movie/{1}?api_key={2}".format(
+            self.args.api_url.rstrip("/"),
+            id,
+            self.args.api_key)
+
+
+class TmdbMovieProcess(TmdbProcess):
+    """Common base class for processes that operate on a single
+    movie. This takes a JSON file with information as the first
+    parameter."""
+
+    def __init__(self):
+        super(TmdbMovieProcess, self).__init__()
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(TmdbMovieProcess, self).process(args):
+            return False
+
+        # Load the movie information into memory.
+        if not os.path.isfile(args.tmdb):
+            self.log("Cannot find JSON file: " + args.tmdb)
+            return False
+
+        # If the file came from the JSON process, the movie is inside
+        # the sidecar. Otherwise, it is the TMDB information itself.
+        stream = open(args.tmdb, 'r')
+        self.sidecar = simplejson.load(stream)
+        self.movie = self.sidecar.get("tmdb", self.sidecar)
+        stream.close()
+
+        # We were successful, so return true.
+        return True
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(TmdbMovieProcess, self).setup_arguments(parser)
+
+        # Add the Creole-conversion specific processes.
+        parser.add_argument(
+            'tmdb',
+            type=str,
+            help='JSON file with the information about a TMDB movie.')
+
+
+class IdProcess(TmdbProcess):
+    """Searches themoviedb.com for the ID for a given movie."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(IdProcess, self).process(args):
+            return
+
+        # Combine the title elements together since we allow both a
+        # single variable or combined together. Once we have that,
+        # normalize the name.
+        title = " ".join(args.title).decode("utf-8", "replace")
+        title, year = mfgames_media.themoviedb.match.parse_title(title)
+        
+        # Do a search for the title using the v3 API so the results
+        # can be cached. We use the best ranked movie instead of the
+        # first one. If the search fails, we don't print anything.
+        try:
+            movies = self.search_movies([title])[0]
+        except (mfgames_media.themoviedb.client.HttpException,
+                mfgames_media.themoviedb.cache.OfflineException,
+                ValueError), exception:
+            self.log.error("Cannot search for {0}: {1}".format(
+                title,
+                exception))
+            return False
+
+        ranked = mfgames_media.themoviedb.match.rank_movies(
+            title,
+            year,
+            movies)
+
+        if ranked:
+            print args.format % {
+                "id": ranked[0][1]['id'],
+                "title": ranked[0][1]['title'].encode("utf-8"),
+                }
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(IdProcess, self).setup_arguments(parser)
+
+        # Add the Creole-conversion specific processes.
+        parser.add_argument(
+            'title',
+            type=str,
+            nargs='+',
+            help='One or more names to search for the ID.')
+        parser.add_argument(
+            '--format', '-f',
+            type=str,
+            default="%(id)s",
+            help='Output format: %(id)s, %(title)s')
+
+    def get_help(self):
+        return "Searches TMDB for a movie with the given title and optional attributes."
+
+    def normalize_title(self, title):
+        """Normalizes the title by handling articles at the end of the
+        title while excluding any search keys in parentheses."""
+
+        return mfgames_media.themoviedb.match.parse_title(title)[0]
+
+
+class MatchProcess(TmdbProcess):
+    """Matches many titles or filenames to TMDB IDs at once."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(MatchProcess, self).process(args):
+            return
+
+        # Gather up the inputs, from both the command line and the
+        # batch file if we have one.
+        inputs = list(args.input)
+
+        if args.batch:
+            for line in open(args.batch, 'r'):
+                line = line.strip()
+
+                if line != "":
+                    inputs.append(line)
+
+        # Load the previous matches so we only search for the titles
+        # we haven't matched before.
+        matches = mfgames_media.themoviedb.match.MatchCache(
+            args.match_cache
+            or os.path.join(
+                mfgames_media.themoviedb.cache.get_cache_directory(),
+                "matches.json"))
+
+        results = {}
+        queries = []
+
+        for text in inputs:
+            title, year = mfgames_media.themoviedb.match.parse_input(
+                text.decode("utf-8", "replace"))
+            match = matches.get(title, year)
+
+            if match and match["confidence"] >= args.min_confidence:
+                results[text] = match
+            else:
+                queries.append((text, title, year))
+
+        self.log.info(
+            "Searching for {0} titles, {1} already matched".format(
+                len(queries),
+                len(results)))
+
+        # Search for the remaining titles concurrently, ranking the
+        # results against the title and year.
+        searches = self.search_movies(
+            [title for text, title, year in queries],
+            False)
+
+        for (text, title, year), movies in zip(queries, searches):
+            if not movies:
+                continue
+
+            confidence, movie = mfgames_media.themoviedb.match.rank_movies(
+                title,
+                year,
+                movies)[0]
+
+            if confidence < args.min_confidence:
+                continue
+
+            match = {
+                "id": movie["id"],
+                "title": movie["title"],
+                "year": mfgames_media.themoviedb.match.get_year(movie),
+                "confidence": confidence,
+                }
+            matches.put(title, year, match)
+            results[text] = match
+
+        matches.save()
+
+        # Write out the results in the same order as the inputs.
+        unmatched = 0
+
+        for text in inputs:
+            if text not in results:
+                self.log.warning("Could not match: " + text)
+                unmatched += 1
+                continue
+
+            values = dict(results[text])
+            values["input"] = text
+            values["json"] = os.path.splitext(text)[0] + ".json"
+            values["title"] = values["title"].encode("utf-8")
+            print args.format % values
+
+        self.log.info(
+            "Matched {0} titles, {1} unmatched".format(
+                len(inputs) - unmatched,
+                unmatched))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(MatchProcess, self).setup_arguments(parser)
+
+        # Add the match-specific arguments.
+        parser.add_argument(
+            'input',
+            type=str,
+            nargs='*',
+            help='Titles or filenames to match, such as "Thing, The (1982).mkv".')
+        parser.add_argument(
+            '--batch', '-b',
+            type=str,
+            help='File with a title or filename on each line.')
+        parser.add_argument(
+            '--format', '-f',
+            type=str,
+            default="%(id)s\t%(confidence).2f\t%(title)s\t%(input)s",
+            help='Output format: %%(id)s, %%(confidence)f, %%(title)s, %%(year)s, %%(input)s, %%(json)s')
+        parser.add_argument(
+            '--min-confidence',
+            type=float,
+            default=0.6,
+            help='The lowest confidence, from 0.0 to 1.0, that counts as a match.')
+        parser.add_argument(
+            '--match-cache',
+            type=str,
+            help='The file used to remember the matches between runs.')
+
+    def get_help(self):
+        return "Matches many titles or filenames to TMDB IDs."
+
+
+class MirrorProcess(mfgames_tools.process.Process):
+    """Builds the offline TMDB mirror from a daily ID export."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        super(MirrorProcess, self).process(args)
+
+        # Ingest the export into the mirror.
+        mirror = mfgames_media.themoviedb.mirror.Mirror(args.mirror_file)
+        mirror.ingest(args.export)
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(MirrorProcess, self).setup_arguments(parser)
+
+        # Add the mirror-specific arguments.
+        parser.add_argument(
+            'export',
+            type=str,
+            help='The TMDB daily ID export, such as movie_ids_05_15_2024.json.gz.')
+        parser.add_argument(
+            '--mirror-file',
+            type=str,
+            help='The offline TMDB mirror to build instead of the default.')
+
+    def get_help(self):
+        return "Builds the offline TMDB mirror from a daily ID export."
+
+
+class JsonProcess(TmdbProcess):
+    """Downloads the Json file for a given TMDB ID movie."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(JsonProcess, self).process(args):
+            return
+
+        # Load the JSON file if it exists.
+        json = self.load_sidecar(args.json)
+
+        # If the file exists and we have the enable flag, then we
+        # check to see if we are going to force writing the file.
+        if "enable-tmdb" in json and not args.force:
+            self.log.info("Information already cached, skipping")
+            return False
+
+        # If the ID is 0 or less, then we disable it.
+        if args.id <= 0:
+            # Remove any existing JSON data and disable TMDB.
+            json["enable-tmdb"] = False
+
+            if "tmdb" in json:
+                del json["tmdb"]
+        else:
+            # Set up the configuration for TMDB.
+            self.configure()
+
+            tmdb_json = self.get_json(self.get_movie_url(args.id))
+
+            # Insert the TMDB JSON data into the JSON.
+            json["enable-tmdb"] = True
+            json["tmdb"] = tmdb_json
+
+        # Figure out how to output the file.
+        if not args.output:
+            args.output = args.json
+
+        self.write_sidecar(json, args.output)
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(JsonProcess, self).setup_arguments(parser)
+
+        # Add the Creole-conversion specific processes.
+        parser.add_argument(
+            'id',
+            type=int,
+            help='The TMDB ID for the movie to retrieve.')
+        parser.add_argument(
+            'json',
+            type=str,
+            help='The input JSON file for caching the TMDB information.')
+        parser.add_argument(
+            '--output', '-o',
+            type=str,
+            help='The output file to write the results. If - or missing, it will write to standard output.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then the output will overwrite the file.")
+
+    def get_help(self):
+        return "Downloads the JSON file for a given ID and write it to a file or standard out."
+
+
+class JsonBatchProcess(TmdbProcess):
+    """Downloads the JSON files for many TMDB ID movies at once."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(JsonBatchProcess, self).process(args):
+            return
+
+        # Go through the batch file and figure out which sidecars
+        # need to be downloaded. Each line is an ID and a JSON file
+        # separated by whitespace.
+        items = []
+        skipped = 0
+        invalid = 0
+
+        for number, line in enumerate(open(args.batch, 'r'), 1):
+            line = line.strip()
+
+            if line == "" or line[0] == "#":
+                continue
+
+            # A bad line only loses that movie, not the whole batch.
+            try:
+                id, filename = line.split(None, 1)
+                id = int(id)
+            except ValueError:
+                self.log.error(
+                    "Cannot parse {0}:{1}: {2}".format(
+                        args.batch,
+                        number,
+                        line))
+                invalid += 1
+                continue
+
+            json = self.load_sidecar(filename)
+
+            # If the file exists and we have the enable flag, then we
+            # check to see if we are going to force writing the file.
+            if "enable-tmdb" in json and not args.force:
+                skipped += 1
+                continue
+
+            # If the ID is 0 or less, then we disable it without
+            # needing to download anything.
+            if id <= 0:
+                json["enable-tmdb"] = False
+
+                if "tmdb" in json:
+                    del json["tmdb"]
+
+                self.write_sidecar(json, filename)
+                continue
+
+            items.append((id, filename, json))
+
+        self.log.info(
+            "Downloading {0} movies, skipped {1} already cached".format(
+                len(items),
+                skipped))
+
+        # Download all the movies, writing each sidecar as soon as it
+        # has finished so an interrupted batch keeps its progress.
+        def write_movie(index, tmdb_json):
+            id, filename, json = items[index]
+            json["enable-tmdb"] = True
+            json["tmdb"] = tmdb_json
+            self.write_sidecar(json, filename)
+
+        urls = [self.get_movie_url(id) for id, filename, json in items]
+        results = self.get_json_many(urls, write_movie, False)
+
+        # Report the failures so they can be retried.
+        failed = [
+            items[index][1]
+            for index in range(len(items))
+            if results[index] is None]
+
+        for filename in failed:
+            self.log.error("Could not download: " + filename)
+
+        self.log.info(
+            "Downloaded {0} movies, {1} failed".format(
+                len(items) - len(failed),
+                len(failed) + invalid))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(JsonBatchProcess, self).setup_arguments(parser)
+
+        # Add the batch-specific arguments. Batches default to the
+        # TMDB request limit.
+        parser.add_argument(
+            'batch',
+            type=str,
+            help='File with a TMDB ID and a JSON file on each line.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then the outputs will overwrite the files.")
+        parser.set_defaults(rate=4.0)
+
+    def get_help(self):
+        return "Downloads the JSON files for many IDs listed in a file."
+
+
+class PosterProcess(TmdbMovieProcess):
+    """Downloads the poster of for a given movie."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(PosterProcess, self).process(args):
+            return
+
+        # Configure the process.
+        self.configure()
+
+        # Figure out if we need to download the poster.
+        job = self.get_poster_job(
+            args.tmdb,
+            self.sidecar,
+            args.output,
+            args.width,
+            args.force)
+
+        if not job:
+            return False
+
+        # Download the poster into the output.
+        if not self.download_posters([job]):
+            return False
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(PosterProcess, self).setup_arguments(parser)
+
+        # Add the Creole-conversion specific processes.
+        parser.add_argument(
+            '--output', '-o',
+            type=str,
+            help='The filename of the image file to write. If missing, then it will be based on the input file.')
+        parser.add_argument(
+            '--width', '-w',
+            type=str,
+            default='w342',
+            help='The width code for TMDB: "w92", "w154", "w185", "w342", "w500", "original"')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then the output will overwrite the file.")
+
+    def get_help(self):
+        return "Downloads the JSON file for a given ID and write it to a file or standard out."
+
+
+class PosterBatchProcess(TmdbProcess):
+    """Downloads the posters for many movies at once."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(PosterBatchProcess, self).process(args):
+            return
+
+        # Configure the process.
+        self.configure()
+
+        # Go through the sidecars and figure out which posters need
+        # to be downloaded.
+        jobs = []
+
+        for filename in args.tmdb:
+            if not os.path.isfile(filename):
+                self.log.error("Cannot find JSON file: " + filename)
+                continue
+
+            sidecar = self.load_sidecar(filename)
+            job = self.get_poster_job(
+                filename,
+                sidecar,
+                None,
+                args.width,
+                args.force)
+
+            if job:
+                jobs.append(job)
+
+        # Download all the posters.
+        self.log.info("Downloading {0} posters".format(len(jobs)))
+        finished = self.download_posters(jobs)
+        self.log.info(
+            "Downloaded {0} posters, {1} failed".format(
+                len(finished),
+                len(jobs) - len(finished)))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(PosterBatchProcess, self).setup_arguments(parser)
+
+        # Add the batch-specific arguments.
+        parser.add_argument(
+            'tmdb',
+            type=str,
+            nargs='+',
+            help='JSON files with the information about TMDB movies.')
+        parser.add_argument(
+            '--width', '-w',
+            type=str,
+            default='w342',
+            help='The width code for TMDB: "w92", "w154", "w185", "w342", "w500", "original"')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then the outputs will overwrite the files.")
+
+    def get_help(self):
+        return "Downloads the posters for many JSON files."
+
+
+class NfoProcess(TmdbMovieProcess):
+    """Creates an NFO file from the cached TMDB."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(NfoProcess, self).process(args):
+            return
+
+        # If we don't have an output parameter, we figure it out from
+        # the input filename.
+        output = args.output
+
+        if not output:
+            output = os.path.splitext(args.tmdb)[0] + ".nfo"
+
+        # Check to see if the file is newer than the JSON file.
+        if mfgames_media.themoviedb.nfo.is_current(args.tmdb, output) \
+                and not args.force:
+            self.log.info("NFO file is current: " + output)
+            return False
+
+        # Write out the file.
+        mfgames_media.themoviedb.nfo.write_nfo(args.tmdb, self.sidecar, output)
+
+        # Report that we created the file.
+        self.log.info("Created " + output)
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(NfoProcess, self).setup_arguments(parser)
+
+        # Add the Creole-conversion specific processes.
+        parser.add_argument(
+            '--output', '-o',
+            type=str,
+            help='The filename of the image file to write. If missing, then it will be based on the input file.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then the output will be written even if it is current.")
+
+    def get_help(self):
+        return "Creates a NFO file from the cached JSON file."
+
+
+class NfoBatchProcess(mfgames_tools.process.Process):
+    """Creates the NFO files for all the cached TMDB sidecars in one or
+    more directory trees."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        super(NfoBatchProcess, self).process(args)
+
+        log = logging.getLogger('nfo')
+        created = 0
+        current = 0
+        failed = 0
+
+        walker = mfgames_media.walker.TreeWalker(extensions=[".json"])
+
+        for root in args.directory:
+            for entry in walker.walk(root):
+                # Skip the NFO files newer than their JSON files
+                # before we bother loading the JSON.
+                filename = entry.path
+                output = os.path.splitext(filename)[0] + ".nfo"
+
+                if mfgames_media.themoviedb.nfo.is_current(
+                        filename, output, entry.mtime) and not args.force:
+                    current += 1
+                    continue
+
+                # Load the sidecar and make sure it has TMDB data.
+                try:
+                    stream = open(filename, 'r')
+                    sidecar = simplejson.load(stream)
+                    stream.close()
+                except ValueError:
+                    log.error("Cannot parse JSON file: " + filename)
+                    failed += 1
+                    continue
+
+                if not isinstance(sidecar, dict) \
+                        or not sidecar.get("enable-tmdb") \
+                        or "tmdb" not in sidecar:
+                    continue
+
+                # Write out the NFO file.
+                try:
+                    mfgames_media.themoviedb.nfo.write_nfo(
+                        filename,
+                        sidecar,
+                        output)
+                    created += 1
+                except (KeyError, IOError, OSError), exception:
+                    log.error("Cannot create {0}: {1}".format(
+                        output,
+                        exception))
+                    failed += 1
+
+        log.info(
+            "Created {0} NFO files, {1} current, {2} failed".format(
+                created,
+                current,
+                failed))
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(NfoBatchProcess, self).setup_arguments(parser)
+
+        # Add the batch-specific arguments.
+        parser.add_argument(
+            'directory',
+            type=str,
+            nargs='+',
+            help='Directories to search for the cached JSON files.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then the outputs will be written even if they are current.")
+
+    def get_help(self):
+        return "Creates the NFO files for all the cached JSON files in directories."
@@ -0,0 +1,208 @@
+"""Persistent on-disk cache for the responses from themoviedb.com."""
+
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import urllib
+import urlparse
+
+import simplejson
+
+
+# The default time-to-live, in seconds, for each of the endpoints we
+# cache. The configuration almost never changes, but the movie details
+# and search results are edited by the community.
+DEFAULT_TTLS = {
+    "configuration": 7 * 24 * 60 * 60,
+    "movie": 24 * 60 * 60,
+    "search": 24 * 60 * 60,
+    "default": 60 * 60,
+    }
+
+# The regular expressions used to map a URL path into an endpoint
+# name for the time-to-live lookups.
+ENDPOINTS = [
+    ("configuration", re.compile(r'^/3/configuration')),
+    ("movie", re.compile(r'^/3/movie/')),
+    ("search", re.compile(r'^/3/search/')),
+    ]
+
+
+def get_cache_directory():
+    """Retrieves the default directory for the cached TMDB data."""
+
+    return os.path.join(
+        os.path.expanduser("~"),
+        '.cache',
+        'mfgames',
+        'mfgames-media',
+        'tmdb')
+
+
+def get_endpoint(url):
+    """Determines the name of the endpoint for the given URL."""
+
+    path = urlparse.urlsplit(url).path
+
+    for name, regex in ENDPOINTS:
+        if regex.match(path):
+            return name
+
+    return "default"
+
+
+class OfflineException(Exception):
+    """Indicates that a response was requested while offline and it
+    could not be found in the cache."""
+    pass
+
+
+class ResponseCache(object):
+    """Stores the parsed JSON responses from themoviedb.com in a
+    directory, one file per URL. The URLs are keyed without the API key
+    so the cache can be shared between keys. Each entry keeps the
+    ETag and Last-Modified headers so stale entries can be revalidated
+    with a conditional request instead of downloaded again. The number
+    of requests answered from the cache and the ones that needed the
+    network are counted in hits and misses."""
+
+    def __init__(self, directory=None, ttls=None, offline=False):
+        # Set up logging for the cache.
+        self.log = logging.getLogger('cache')
+
+        # If we weren't given a directory, use a common one.
+        if not directory:
+            directory = get_cache_directory()
+
+        self.directory = directory
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+        # Merge in the time-to-live values with the defaults.
+        self.ttls = dict(DEFAULT_TTLS)
+
+        if ttls:
+            self.ttls.update(ttls)
+
+    def get_key(self, url):
+        """Normalizes the URL into the key used for the cache, which is
+        the URL without the API key."""
+
+        parts = urlparse.urlsplit(url)
+        query = [
+            (name, value)
+            for name, value in urlparse.parse_qsl(parts.query, True)
+            if name != "api_key"]
+        query.sort()
+
+        return urlparse.urlunsplit((
+            parts.scheme,
+            parts.netloc,
+            parts.path,
+            urllib.urlencode(query),
+            ""))
+
+    def get_filename(self, url):
+        """Determines the filename of the cache entry for the URL."""
+
+        digest = hashlib.sha1(self.get_key(url)).hexdigest()
+        return os.path.join(self.directory, digest[0:2], digest + ".json")
+
+    def get_endpoint(self, url):
+        """Determines the name of the endpoint for the given URL."""
+
+        return get_endpoint(url)
+
+    def get_ttl(self, url):
+        """Retrieves the number of seconds a response is fresh."""
+
+        return self.ttls[self.get_endpoint(url)]
+
+    def get(self, url):
+        """Retrieves the cache entry for the URL or None if there is
+        no entry for it."""
+
+        filename = self.get_filename(url)
+
+        if not os.path.isfile(filename):
+            return None
+
+        try:
+            stream = open(filename, 'r')
+            entry = simplejson.load(stream)
+            stream.close()
+        except ValueError:
+            # The entry is corrupted, so treat it as a miss.
+            self.log.warning("Ignoring invalid cache entry: " + filename)
+            return None
+
+        return entry
+
+    def is_fresh(self, url, entry):
+        """Determines if the entry is still within the time-to-live
+        for its endpoint."""
+
+        return time.time() - entry["time"] < self.get_ttl(url)
+
+    def get_headers(self, entry):
+        """Retrieves the conditional request headers to revalidate
+        a stale entry."""
+
+        headers = []
+
+        if entry.get("etag"):
+            headers.append("If-None-Match: " + entry["etag"])
+
+        if entry.get("last-modified"):
+            headers.append("If-Modified-Since: " + entry["last-modified"])
+
+        return headers
+
+    def put(self, url, body, headers):
+        """Stores the parsed body of a response along with the
+        validators from the response headers."""
+
+        entry = {
+            "url": self.get_key(url),
+            "time": time.time(),
+            "etag": headers.get("etag"),
+            "last-modified": headers.get("last-modified"),
+            "body": body,
+            }
+        self.write(url, entry)
+        return entry
+
+    def revalidate(self, url, entry):
+        """Marks an existing entry as fresh after the server reported
+        it has not been modified."""
+
+        entry["time"] = time.time()
+        self.write(url, entry)
+
+    def write(self, url, entry):
+        """Writes out the entry for the URL, going through a temporary
+        file so a reader never sees a partial entry."""
+
+        filename = self.get_filename(url)
+        directory = os.path.dirname(filename)
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another thread may have created it first.
+                if not os.path.isdir(directory):
+                    raise
+
+        temp_filename = filename + ".{0}.{1}.tmp".format(
+            os.getpid(),
+            threading.current_thread().ident)
+        stream = open(temp_filename, 'w')
+        simplejson.dump(entry, stream)
+        stream.close()
+        os.rename(temp_filename, filename)
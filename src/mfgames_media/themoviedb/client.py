@@ -0,0 +1,234 @@
+"""HTTP client shared by the themoviedb.com processes."""
+
+
+import logging
+import StringIO
+import time
+
+import pycurl
+
+
+# The timings we keep from curl for each request, in seconds from the
+# start of the request. The application connect is the TLS handshake.
+TIMINGS = [
+    ("namelookup", pycurl.NAMELOOKUP_TIME),
+    ("connect", pycurl.CONNECT_TIME),
+    ("appconnect", pycurl.APPCONNECT_TIME),
+    ("starttransfer", pycurl.STARTTRANSFER_TIME),
+    ("total", pycurl.TOTAL_TIME),
+    ]
+
+
+class HttpException(Exception):
+    """Indicates that a request failed, either because of the transfer
+    itself or because the server responded with an error status."""
+    pass
+
+
+class Request(object):
+    """Describes a single HTTP GET request. If a stream is given, the
+    body of the response is written to it instead of being kept in
+    memory. If an offset is given, the transfer resumes from that byte
+    and curl fails it with E_RANGE_ERROR if the server ignores the
+    range.
+
+    Instead of a stream, an opener can be given. It is called with the
+    request when a handle picks it up and returns the stream, which is
+    closed once the transfer finishes. This keeps a file open only
+    while its transfer is running, no matter how many requests are
+    queued up."""
+
+    def __init__(self, url, headers=None, stream=None, offset=0, opener=None):
+        self.url = url
+        self.headers = headers or []
+        self.stream = stream
+        self.offset = offset
+        self.opener = opener
+
+
+class Response(object):
+    """Contains the results of a single HTTP request. If the transfer
+    itself failed, the errno and error contain the code and message
+    from curl and the status is whatever the server sent, if
+    anything. The timings come from curl and the size is the number of
+    bytes downloaded."""
+
+    def __init__(self, request):
+        self.request = request
+        self.url = request.url
+        self.status = 0
+        self.headers = {}
+        self.errno = 0
+        self.error = None
+        self.buffer = None
+        self.timings = {}
+        self.size = 0
+
+        # If we don't have an output stream, we keep it in memory.
+        if request.opener:
+            self.stream = request.opener(request)
+        elif request.stream:
+            self.stream = request.stream
+        else:
+            self.buffer = StringIO.StringIO()
+            self.stream = self.buffer
+
+    @property
+    def body(self):
+        """Retrieves the body of the response if it was kept in
+        memory."""
+
+        if self.buffer:
+            return self.buffer.getvalue()
+
+        return None
+
+    def write_header(self, line):
+        """Parses a single header line from the response. When we
+        follow redirects, we only keep the headers of the last one."""
+
+        if line.startswith("HTTP/"):
+            self.headers.clear()
+        elif ":" in line:
+            name, value = line.split(":", 1)
+            self.headers[name.strip().lower()] = value.strip()
+
+
+class HttpClient(object):
+    """Performs HTTP requests through a pool of curl handles attached
+    to a single multi handle. Since the multi handle owns the
+    connection cache, connections are kept alive and reused between
+    requests, both serial and concurrent. All requests ask for gzip
+    compressed responses which curl decompresses transparently."""
+
+    def __init__(self, connections=4):
+        # Set up logging for the client.
+        self.log = logging.getLogger('http')
+
+        # Create the multi handle and the pool of easy handles.
+        self.multi = pycurl.CurlMulti()
+        self.handles = []
+
+        for index in range(max(1, connections)):
+            self.handles.append(pycurl.Curl())
+
+    def close(self):
+        """Closes all the curl handles and the connections they hold
+        open."""
+
+        for curl in self.handles:
+            curl.close()
+
+        self.multi.close()
+        self.handles = []
+
+    def get(self, url, headers=None, stream=None):
+        """Performs a single request and returns the response."""
+
+        return self.perform([Request(url, headers, stream)])[0]
+
+    def perform(self, requests, callback=None, limiter=None):
+        """Performs all the given requests, running as many at the same
+        time as there are handles in the pool. The responses are
+        returned in the same order as the requests. If a callback is
+        given, it is called with each response as it finishes. If a
+        limiter is given, a token is taken from it before each request
+        is started."""
+
+        responses = [None] * len(requests)
+        pending = list(enumerate(requests))
+        pending.reverse()
+        free = list(self.handles)
+        active = 0
+
+        while pending or active:
+            # Fill up the free handles with pending requests, as long
+            # as the limiter lets us.
+            wait = 0
+
+            while pending and free:
+                if limiter:
+                    wait = limiter.take()
+
+                    if wait:
+                        break
+
+                index, request = pending.pop()
+                curl = free.pop()
+                curl.index = index
+                curl.response = Response(request)
+                self.prepare(curl, curl.response)
+                self.multi.add_handle(curl)
+                active += 1
+
+            # Run the transfers until curl no longer wants to be
+            # called immediately.
+            while True:
+                ret, handles = self.multi.perform()
+
+                if ret != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+
+            # Pull out any of the transfers that have finished.
+            while True:
+                queued, succeeded, failed = self.multi.info_read()
+                finished = [(curl, 0, None) for curl in succeeded]
+                finished.extend(failed)
+
+                for curl, errno, message in finished:
+                    response = curl.response
+                    response.errno = errno
+                    response.error = message
+                    response.status = curl.getinfo(pycurl.RESPONSE_CODE)
+                    response.size = int(curl.getinfo(pycurl.SIZE_DOWNLOAD))
+
+                    for name, info in TIMINGS:
+                        response.timings[name] = curl.getinfo(info)
+
+                    if message:
+                        self.log.warning(
+                            "Cannot retrieve {0}: {1}".format(
+                                response.url,
+                                message))
+
+                    self.multi.remove_handle(curl)
+                    curl.response = None
+
+                    if response.request.opener:
+                        response.stream.close()
+                    free.append(curl)
+                    active -= 1
+
+                    responses[curl.index] = response
+
+                    if callback:
+                        callback(response)
+
+                if queued == 0:
+                    break
+
+            # Wait for more data to arrive on the active transfers or
+            # until the limiter will give us another token.
+            if active:
+                self.multi.select(min(wait, 1.0) if wait else 1.0)
+            elif wait:
+                time.sleep(wait)
+
+        return responses
+
+    def prepare(self, curl, response):
+        """Sets up a curl handle to perform the request."""
+
+        request = response.request
+        headers = ["Connection: keep-alive"]
+        headers.extend(request.headers)
+
+        curl.setopt(pycurl.URL, request.url)
+        curl.setopt(pycurl.HTTPHEADER, headers)
+        curl.setopt(pycurl.ENCODING, "gzip")
+        curl.setopt(pycurl.FOLLOWLOCATION, 1)
+        curl.setopt(pycurl.MAXREDIRS, 5)
+        curl.setopt(pycurl.NOSIGNAL, 1)
+        curl.setopt(pycurl.RESUME_FROM, request.offset)
+        curl.setopt(pycurl.WRITEFUNCTION, response.stream.write)
+        curl.setopt(pycurl.HEADERFUNCTION, response.write_header)
@@ -0,0 +1,86 @@
+"""Shared storage for the TMDB images used across the library."""
+
+
+import logging
+import os
+import shutil
+
+
+class ImageStore(object):
+    """Keeps a single copy of every TMDB image in a directory, keyed by
+    the width code and TMDB path (e.g., "w342/mOTtuakUTb1qY6jG6lzMfjdhLwc.jpg").
+    TMDB never changes the contents of an image path, so once an image
+    is in the store it never has to be downloaded again. The files next
+    to the movies are links into the store instead of full copies."""
+
+    def __init__(self, directory, link="hard"):
+        self.log = logging.getLogger('images')
+        self.directory = directory
+        self.link_type = link
+
+    def get_path(self, key):
+        """Retrieves the path inside the store for the given key."""
+
+        return os.path.join(self.directory, *key.split("/"))
+
+    def contains(self, key):
+        """Determines if the image for the key is already in the
+        store."""
+
+        return os.path.isfile(self.get_path(key))
+
+    def prepare(self, key):
+        """Makes sure the directory for the key exists so an image can
+        be downloaded into it and returns the path for the image."""
+
+        path = self.get_path(key)
+        directory = os.path.dirname(path)
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another thread may have created it first.
+                if not os.path.isdir(directory):
+                    raise
+
+        return path
+
+    def link(self, key, output):
+        """Links the image for the key to the output, replacing the
+        output if it already exists. Hard links fall back to symbolic
+        links if the output is on a different filesystem and symbolic
+        links fall back to a copy if the filesystem can't hold them."""
+
+        path = self.get_path(key)
+
+        # If the output is already the same file, there is nothing to do.
+        if os.path.exists(output) and os.path.samefile(path, output):
+            return
+
+        # We create the link under a temporary name and then rename it
+        # so the output is replaced in a single step.
+        temp_output = output + ".link"
+
+        if os.path.lexists(temp_output):
+            os.remove(temp_output)
+
+        link_type = self.link_type
+
+        if link_type == "hard":
+            try:
+                os.link(path, temp_output)
+            except OSError:
+                link_type = "symbolic"
+
+        if link_type == "symbolic":
+            try:
+                os.symlink(os.path.abspath(path), temp_output)
+            except OSError:
+                link_type = "copy"
+
+        if link_type == "copy":
+            shutil.copyfile(path, temp_output)
+
+        os.rename(temp_output, output)
+        self.log.debug("Linked {0} to {1}".format(output, key))
@@ -0,0 +1,314 @@
+"""Tags an entire library of movies in a single pipeline."""
+
+
+import logging
+import multiprocessing
+import os
+import threading
+
+import mfgames_media.mplayer
+import mfgames_media.pipeline
+import mfgames_media.themoviedb
+import mfgames_media.themoviedb.cache
+import mfgames_media.themoviedb.match
+import mfgames_media.themoviedb.nfo
+import mfgames_media.walker
+
+
+# The stages of the pipeline and the number of workers for each one by
+# default. Identifying runs MPlayer so it uses one per core while the
+# network stages use one per connection.
+DEFAULT_WORKERS = {
+    "identify": multiprocessing.cpu_count(),
+    "match": 4,
+    "fetch": 4,
+    "poster": 4,
+    "write": 1,
+    "nfo": 1,
+    }
+
+
+class LibraryItem(object):
+    """Keeps track of a single movie while it goes through the
+    pipeline. The sidecar is loaded once when the movie is scanned and
+    the stages only mark it as dirty, so it is written at most once."""
+
+    def __init__(self, video, filename, sidecar):
+        self.video = video
+        self.filename = filename
+        self.sidecar = sidecar
+        self.dirty = False
+        self.id = None
+        self.stages = []
+
+    def __str__(self):
+        return self.video
+
+
+class LibraryProcess(mfgames_media.themoviedb.TmdbProcess):
+    """Scans directories for movies and runs each one through the
+    identify, match, fetch, poster, and NFO stages. Each stage skips
+    the movies that are already up to date, so the library can be
+    processed again whenever new movies are added."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        if not super(LibraryProcess, self).process(args):
+            return False
+
+        # Figure out how many workers each stage gets.
+        workers = dict(DEFAULT_WORKERS)
+
+        for worker in args.workers or []:
+            stage, count = worker.split("=", 1)
+            workers[stage.strip()] = int(count)
+
+        # Set up the configuration for TMDB so we know where to get the
+        # posters from.
+        self.configure()
+
+        # Load the previous matches so we only search for the titles we
+        # haven't matched before.
+        self.matches = mfgames_media.themoviedb.match.MatchCache(
+            args.match_cache
+            or os.path.join(
+                mfgames_media.themoviedb.cache.get_cache_directory(),
+                "matches.json"))
+
+        # When posters are shared in the image store, two movies with
+        # the same poster can't download it at the same time.
+        self.poster_locks = {}
+        self.poster_lock = threading.Lock()
+
+        # Build up the pipeline and run the movies through it.
+        pipeline = mfgames_media.pipeline.Pipeline([
+            mfgames_media.pipeline.Stage(
+                "identify",
+                self.identify,
+                workers["identify"]),
+            mfgames_media.pipeline.Stage(
+                "match",
+                self.match,
+                workers["match"]),
+            mfgames_media.pipeline.Stage(
+                "fetch",
+                self.fetch,
+                workers["fetch"],
+                ["match"]),
+            mfgames_media.pipeline.Stage(
+                "poster",
+                self.poster,
+                workers["poster"],
+                ["fetch"]),
+            mfgames_media.pipeline.Stage(
+                "write",
+                self.write,
+                workers["write"],
+                ["identify", "fetch", "poster"]),
+            mfgames_media.pipeline.Stage(
+                "nfo",
+                self.nfo,
+                workers["nfo"],
+                ["write"]),
+            ])
+        items = pipeline.run(self.scan(args.directory))
+
+        self.matches.save()
+
+        # Report how much work each stage did.
+        counts = dict([(stage.name, 0) for stage in pipeline.stages])
+
+        for item in items:
+            for stage in item.stages:
+                counts[stage] += 1
+
+        self.log.info(
+            "Processed {0} movies: ".format(len(items))
+            + ", ".join([
+                "{0} {1}".format(counts[stage.name], stage.name)
+                for stage in pipeline.stages]))
+
+    def scan(self, directories):
+        """Finds the movies in the directories and loads their sidecars,
+        yielding them as they are found so the rest of the pipeline can
+        start before the scan finishes."""
+
+        walker = mfgames_media.walker.TreeWalker(
+            extensions=mfgames_media.themoviedb.match.VIDEO_EXTENSIONS,
+            stat=False)
+
+        for root in directories:
+            if os.path.isfile(root):
+                yield self.load_item(root)
+                continue
+
+            for entry in walker.walk(root):
+                yield self.load_item(entry.path)
+
+    def load_item(self, video):
+        """Creates the item for a movie along with its sidecar."""
+
+        filename = os.path.splitext(video)[0] + ".json"
+        return LibraryItem(video, filename, self.load_sidecar(filename))
+
+    def identify(self, item):
+        """Runs MPlayer on the movie if we don't have its information."""
+
+        if "enable-mplayer" in item.sidecar and not self.args.force:
+            return
+
+        item.sidecar["enable-mplayer"] = True
+        item.sidecar["mplayer"] = mfgames_media.mplayer.identify(item.video)
+        item.dirty = True
+        item.stages.append("identify")
+
+    def match(self, item):
+        """Figures out the TMDB ID from the filename if the movie hasn't
+        been matched before."""
+
+        if "enable-tmdb" in item.sidecar and not self.args.force:
+            return
+
+        # If we matched it in a previous run, then use that.
+        title, year = mfgames_media.themoviedb.match.parse_filename(
+            item.video.decode("utf-8", "replace"))
+        match = self.matches.get(title, year)
+
+        if not match or match["confidence"] < self.args.min_confidence:
+            movies = self.search_movies([title], False)[0]
+
+            if not movies:
+                self.log.warning("Could not match: " + item.video)
+                return
+
+            confidence, movie = mfgames_media.themoviedb.match.rank_movies(
+                title,
+                year,
+                movies)[0]
+
+            if confidence < self.args.min_confidence:
+                self.log.warning("Could not match: " + item.video)
+                return
+
+            match = {
+                "id": movie["id"],
+                "title": movie["title"],
+                "year": mfgames_media.themoviedb.match.get_year(movie),
+                "confidence": confidence,
+                }
+            self.matches.put(title, year, match)
+
+        item.id = match["id"]
+        item.stages.append("match")
+
+    def fetch(self, item):
+        """Downloads the TMDB information for a matched movie."""
+
+        if not item.id:
+            return
+
+        tmdb_json = self.get_json_many(
+            [self.get_movie_url(item.id)],
+            strict=False)[0]
+
+        if tmdb_json is None:
+            return
+
+        item.sidecar["enable-tmdb"] = True
+        item.sidecar["tmdb"] = tmdb_json
+        item.dirty = True
+        item.stages.append("fetch")
+
+    def poster(self, item):
+        """Downloads the poster if it is missing or has changed."""
+
+        if not item.sidecar.get("enable-tmdb") or "tmdb" not in item.sidecar:
+            return
+
+        job = self.get_poster_job(
+            item.filename,
+            item.sidecar,
+            None,
+            self.args.width,
+            False)
+
+        if not job:
+            return
+
+        # Only one thread can download a given poster at a time, the
+        # others will find it in the image store once it is done.
+        with self.poster_lock:
+            lock = self.poster_locks.setdefault(job.key, threading.Lock())
+
+        with lock:
+            if not self.download_posters([job], False):
+                return
+
+        item.dirty = True
+        item.stages.append("poster")
+
+    def write(self, item):
+        """Writes out the sidecar if any of the stages changed it."""
+
+        if not item.dirty:
+            return
+
+        self.write_sidecar(item.sidecar, item.filename)
+        item.stages.append("write")
+
+    def nfo(self, item):
+        """Writes out the NFO file if it is older than the sidecar."""
+
+        if not item.sidecar.get("enable-tmdb") or "tmdb" not in item.sidecar:
+            return
+
+        output = os.path.splitext(item.filename)[0] + ".nfo"
+
+        if mfgames_media.themoviedb.nfo.is_current(item.filename, output):
+            return
+
+        mfgames_media.themoviedb.nfo.write_nfo(
+            item.filename,
+            item.sidecar,
+            output)
+        item.stages.append("nfo")
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(LibraryProcess, self).setup_arguments(parser)
+
+        # Add the library-specific arguments. Like the other batches,
+        # we default to the TMDB request limit.
+        parser.add_argument(
+            'directory',
+            type=str,
+            nargs='+',
+            help='Directories to search for movies, or individual movies.')
+        parser.add_argument(
+            '--workers',
+            type=str,
+            action='append',
+            help='Workers for a stage, as STAGE=COUNT where STAGE is '
+            + 'identify, match, fetch, poster, write, or nfo.')
+        parser.add_argument(
+            '--width', '-w',
+            type=str,
+            default='w342',
+            help='The width code for TMDB: "w92", "w154", "w185", "w342", "w500", "original"')
+        parser.add_argument(
+            '--min-confidence',
+            type=float,
+            default=0.6,
+            help='The lowest confidence, from 0.0 to 1.0, that counts as a match.')
+        parser.add_argument(
+            '--match-cache',
+            type=str,
+            help='The file used to remember the matches between runs.')
+        parser.add_argument(
+            '--force', '-f',
+            action='store_true',
+            help="If used, then the movies will be identified and matched again.")
+        parser.set_defaults(rate=4.0)
+
+    def get_help(self):
+        return "Identifies, matches, and tags all the movies in directories."
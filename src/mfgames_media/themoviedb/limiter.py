@@ -0,0 +1,85 @@
+"""Rate limiting for the requests to themoviedb.com."""
+
+
+import threading
+import time
+
+
+def get_retry_delay(response, attempt):
+    """Retrieves the number of seconds to wait after the server says we
+    are going too fast. This is the Retry-After header if it has one,
+    otherwise it backs off with each attempt."""
+
+    delay = response.headers.get("retry-after", "")
+
+    return int(delay) if delay.isdigit() else 2 ** attempt
+
+
+class TokenBucket(object):
+    """Implements a token bucket that allows a given number of
+    requests per second with short bursts up to the capacity. The
+    bucket can also be paused, such as when the server responds with
+    a Retry-After header. A rate of zero or None is unlimited, but
+    still honors the pauses. The bucket can be shared between
+    threads."""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate or 1))
+        self.tokens = float(self.capacity)
+        self.updated = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Attempts to take a token out of the bucket. If successful,
+        this returns zero, otherwise the number of seconds to wait
+        before trying again."""
+
+        with self.lock:
+            return self.take_locked()
+
+    def take_locked(self):
+        """Takes a token out of the bucket while holding the lock."""
+
+        now = time.time()
+
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        if not self.rate:
+            return 0
+
+        # Add in the tokens that have accumulated since the last time.
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Blocks until a token can be taken out of the bucket."""
+
+        while True:
+            wait = self.take()
+
+            if not wait:
+                return
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stops handing out tokens for the given number of seconds.
+        The bucket is emptied so the requests resume gradually."""
+
+        with self.lock:
+            self.paused_until = max(
+                self.paused_until,
+                time.time() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
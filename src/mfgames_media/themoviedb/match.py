@@ -0,0 +1,222 @@
+"""Matching of titles and filenames to the movies on themoviedb.com."""
+
+
+import difflib
+import logging
+import os
+import re
+
+import simplejson
+
+
+# The file extensions we consider to be movies.
+VIDEO_EXTENSIONS = [
+    ".avi",
+    ".m4v",
+    ".mkv",
+    ".mov",
+    ".mp4",
+    ".mpg",
+    ".ts",
+    ".wmv",
+    ]
+
+# Regular expression for the file extensions we strip off of the
+# filenames. We don't use os.path.splitext directly since titles such
+# as "Mr. Smith Goes to Washington" would lose most of their name, and
+# a year such as "Star.Wars.1977" isn't an extension.
+EXTENSION_REGEX = re.compile(r'^(.*)\.(?!\d{4}$)[A-Za-z0-9]{2,4}$')
+
+# Regular expression for a year in parentheses at the end of a title.
+YEAR_REGEX = re.compile(r'^(.*?)\s*\(\s*(\d{4})\s*\)\s*$')
+
+# Regular expression for a bare year after the title in filenames that
+# use dots instead of spaces, which is usually followed by tags like
+# the resolution that aren't part of the title.
+DOTTED_YEAR_REGEX = re.compile(r'^(.+?) ((?:19|20)\d\d)\b')
+
+
+def is_filename(text):
+    """Determines if the text is a filename instead of a title, either
+    because the file exists or it has a video extension."""
+
+    if os.path.isfile(text):
+        return True
+
+    return os.path.splitext(text)[1].lower() in VIDEO_EXTENSIONS
+
+
+def parse_input(text):
+    """Parses the text as a filename or a title, whichever it is."""
+
+    if is_filename(text):
+        return parse_filename(text)
+
+    return parse_title(text)
+
+
+def parse_filename(filename):
+    """Splits a filename, such as "Movies/Thing, The (1982).mkv", into
+    the normalized title and year after removing the directories and
+    the extension."""
+
+    title = os.path.basename(filename)
+    match = EXTENSION_REGEX.match(title)
+
+    if match and not YEAR_REGEX.match(title):
+        title = match.group(1)
+
+    return parse_title(title)
+
+
+def parse_title(text):
+    """Splits a title, such as "Thing, The (1982)", into the normalized
+    title and year. The year is None if it wasn't included in the
+    title."""
+
+    title = text
+
+    # Check to see if we need to remove the "()" characters and
+    # contents.
+    year = None
+    match = YEAR_REGEX.match(title)
+
+    if match:
+        title = match.group(1)
+        year = int(match.group(2))
+
+    # Filenames without spaces usually use dots or underscores
+    # between the words instead.
+    if " " not in title:
+        title = re.sub(r'[._]+', ' ', title)
+        match = DOTTED_YEAR_REGEX.match(title)
+
+        if match and not year:
+            title = match.group(1)
+            year = int(match.group(2))
+
+    # Move the articles to the beginning.
+    title = re.sub(r'(.*?), (The|A|An)$', r'\2 \1', title.strip())
+
+    return title, year
+
+
+def simplify_title(title):
+    """Simplifies a title for comparison by lowercasing it and removing
+    everything but letters, numbers, and single spaces."""
+
+    title = re.sub(r'[^\w\s]+', '', title.lower(), flags=re.UNICODE)
+    return " ".join(title.split())
+
+
+def get_year(movie):
+    """Retrieves the release year of a TMDB movie, or None if it doesn't
+    have a release date."""
+
+    release_date = movie.get("release_date") or ""
+
+    if len(release_date) >= 4 and release_date[0:4].isdigit():
+        return int(release_date[0:4])
+
+    return None
+
+
+def score_movie(title, year, movie):
+    """Scores how well a TMDB movie matches the title and year from 0.0
+    to 1.0. The title similarity is the best of the title and original
+    title. If we have a year, it is a quarter of the score, with half
+    credit for being a year off since releases and festivals often
+    straddle the new year. Movies without a release date, such as the
+    ones from the offline mirror, are only scored on their title."""
+
+    simple_title = simplify_title(title)
+    similarity = 0.0
+
+    for field in ("title", "original_title"):
+        if movie.get(field):
+            similarity = max(
+                similarity,
+                difflib.SequenceMatcher(
+                    None,
+                    simple_title,
+                    simplify_title(movie[field])).ratio())
+
+    movie_year = get_year(movie)
+
+    if not year or not movie_year:
+        return similarity
+
+    year_score = 0.0
+
+    if movie_year == year:
+        year_score = 1.0
+    elif abs(movie_year - year) == 1:
+        year_score = 0.5
+
+    return similarity * 0.75 + year_score * 0.25
+
+
+def rank_movies(title, year, movies):
+    """Ranks the TMDB search results against the title and year. This
+    returns a list of confidence and movie tuples with the best match
+    first. Ties keep the order from TMDB which is by popularity."""
+
+    ranked = [
+        (score_movie(title, year, movie), index, movie)
+        for index, movie in enumerate(movies)]
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+
+    return [(confidence, movie) for confidence, index, movie in ranked]
+
+
+class MatchCache(object):
+    """Stores the successful matches from normalized queries to the
+    TMDB movies in a single file so reruns only have to search for the
+    titles that didn't match before."""
+
+    def __init__(self, filename):
+        self.log = logging.getLogger('match')
+        self.filename = filename
+        self.matches = {}
+        self.dirty = False
+
+        if os.path.isfile(filename):
+            stream = open(filename, 'r')
+            self.matches = simplejson.load(stream)
+            stream.close()
+
+    def get_key(self, title, year):
+        """Retrieves the key for a title and year."""
+
+        return u"{0}|{1}".format(simplify_title(title), year or "")
+
+    def get(self, title, year):
+        """Retrieves the match for the title and year or None if we
+        don't have one."""
+
+        return self.matches.get(self.get_key(title, year))
+
+    def put(self, title, year, match):
+        """Stores the match for a title and year."""
+
+        self.matches[self.get_key(title, year)] = match
+        self.dirty = True
+
+    def save(self):
+        """Writes out the matches if they have changed."""
+
+        if not self.dirty:
+            return
+
+        directory = os.path.dirname(self.filename)
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp_filename = self.filename + ".tmp"
+        stream = open(temp_filename, 'w')
+        simplejson.dump(self.matches, stream, sort_keys=True, indent=4)
+        stream.close()
+        os.rename(temp_filename, self.filename)
+
+        self.dirty = False
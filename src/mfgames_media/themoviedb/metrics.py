@@ -0,0 +1,161 @@
+"""Instrumentation of the requests made to themoviedb.com."""
+
+
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+import simplejson
+
+import mfgames_media.themoviedb.client
+
+
+# The percentiles reported for each of the timings.
+PERCENTILES = [50, 90, 95, 99]
+
+
+def get_percentile(values, percentile):
+    """Retrieves the nearest-rank percentile from the sorted values."""
+
+    if not values:
+        return None
+
+    index = int(math.ceil(percentile / 100.0 * len(values))) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+class RequestMetrics(object):
+    """Records every request a process makes, including the ones that
+    were answered from the cache, so a run can be summarized by
+    endpoint. The network requests keep the timings from curl, the
+    status code, and the number of bytes downloaded. Requests can be
+    recorded from multiple threads."""
+
+    def __init__(self):
+        self.log = logging.getLogger('metrics')
+        self.started = time.time()
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record_cache(self, endpoint):
+        """Records a request that was answered from the cache without
+        going to the network."""
+
+        self.add({"endpoint": endpoint, "cache": "hit"})
+
+    def record_response(self, endpoint, response, cache=None):
+        """Records a request that went to the network. The cache is
+        "miss" if we had nothing cached, "revalidated" if a stale entry
+        was confirmed, or None if the request isn't cached at all."""
+
+        record = {
+            "endpoint": endpoint,
+            "cache": cache,
+            "status": response.status,
+            "size": response.size,
+            "error": response.errno,
+            }
+        record.update(response.timings)
+        self.add(record)
+
+    def add(self, record):
+        """Adds a single record."""
+
+        with self.lock:
+            self.records.append(record)
+
+    def summarize(self):
+        """Summarizes the records by endpoint. Each endpoint has the
+        count of requests, the cache outcomes, the status codes, the
+        bytes downloaded, and the percentiles of the timings of the
+        network requests in milliseconds."""
+
+        with self.lock:
+            records = list(self.records)
+
+        endpoints = {}
+
+        for record in records:
+            endpoint = endpoints.setdefault(
+                record["endpoint"],
+                {
+                    "requests": 0,
+                    "network": 0,
+                    "bytes": 0,
+                    "errors": 0,
+                    "cache": {},
+                    "status": {},
+                    "timings": {},
+                })
+            endpoint["requests"] += 1
+
+            cache = record.get("cache")
+
+            if cache:
+                endpoint["cache"][cache] = endpoint["cache"].get(cache, 0) + 1
+
+            if "status" not in record:
+                continue
+
+            endpoint["network"] += 1
+            endpoint["bytes"] += record["size"]
+            status = str(record["status"])
+            endpoint["status"][status] = endpoint["status"].get(status, 0) + 1
+
+            if record["error"]:
+                endpoint["errors"] += 1
+
+            for name, info in mfgames_media.themoviedb.client.TIMINGS:
+                if name in record:
+                    endpoint["timings"].setdefault(name, []).append(
+                        record[name] * 1000.0)
+
+        # Replace the timings with their percentiles.
+        for endpoint in endpoints.itervalues():
+            for name, values in endpoint["timings"].items():
+                values.sort()
+                summary = {
+                    "mean": sum(values) / len(values),
+                    "max": values[-1],
+                    }
+
+                for percentile in PERCENTILES:
+                    summary["p{0}".format(percentile)] = get_percentile(
+                        values,
+                        percentile)
+
+                endpoint["timings"][name] = summary
+
+        return {
+            "started": self.started,
+            "seconds": time.time() - self.started,
+            "requests": len(records),
+            "endpoints": endpoints,
+            }
+
+    def write(self, filename):
+        """Writes out the summary as JSON to the file, or to standard
+        error if the filename is "-" since standard output is usually
+        being used by the process."""
+
+        summary = self.summarize()
+
+        if filename == "-":
+            simplejson.dump(summary, sys.stderr, sort_keys=True, indent=4)
+            sys.stderr.write("\n")
+            return
+
+        directory = os.path.dirname(filename)
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp_filename = filename + ".tmp"
+        stream = open(temp_filename, 'w')
+        simplejson.dump(summary, stream, sort_keys=True, indent=4)
+        stream.close()
+        os.rename(temp_filename, filename)
+        self.log.info("Wrote request metrics to " + filename)
@@ -0,0 +1,216 @@
+"""Local offline mirror of the movie titles from themoviedb.com."""
+
+
+import gzip
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import simplejson
+
+import mfgames_media.themoviedb.cache
+import mfgames_media.themoviedb.match
+
+
+# Schema used to identify the current file structure. If the mirror on
+# disk has a different one, it needs to be ingested again.
+DATABASE_SCHEMA = 1
+
+# The number of rows we insert with a single statement while ingesting.
+BATCH_SIZE = 10000
+
+
+def get_mirror_filename():
+    """Retrieves the default filename for the mirror database."""
+
+    return os.path.join(
+        mfgames_media.themoviedb.cache.get_cache_directory(),
+        'mirror.sqlite3')
+
+
+class Mirror(object):
+    """Wraps a SQLite database built from the TMDB daily ID export,
+    which is a gzipped file with one JSON object per line containing
+    the id, original_title, popularity, adult, and video fields. The
+    titles are kept in a full-text index so they can be searched
+    without going to the network. The searches can be called from
+    multiple threads, but only one runs at a time."""
+
+    def __init__(self, filename=None):
+        self.log = logging.getLogger('mirror')
+        self.filename = filename or get_mirror_filename()
+        self.db = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        """Opens the mirror database for searching."""
+
+        if not os.path.isfile(self.filename):
+            raise IOError("Cannot find TMDB mirror: " + self.filename)
+
+        self.db = sqlite3.connect(self.filename, check_same_thread=False)
+
+        cursor = self.db.cursor()
+        cursor.execute("SELECT value FROM mirror WHERE name = 'schema'")
+        schema_version = int(cursor.fetchone()[0])
+        cursor.close()
+
+        if schema_version != DATABASE_SCHEMA:
+            raise IOError(
+                "TMDB mirror schema {0} needs to be ingested again: {1}"
+                .format(schema_version, self.filename))
+
+    def close(self):
+        """Closes the mirror database."""
+
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    def ingest(self, export):
+        """Builds the mirror from a TMDB ID export file. The database is
+        built under a temporary name and renamed over the existing one
+        so searches never see a partial mirror."""
+
+        # Make sure the directory exists.
+        directory = os.path.dirname(self.filename)
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp_filename = self.filename + ".tmp"
+
+        if os.path.isfile(temp_filename):
+            os.remove(temp_filename)
+
+        # Create the structure. Since we can always ingest again, we
+        # don't need the journal while building it.
+        db = sqlite3.connect(temp_filename)
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE mirror (name TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE movie ("
+                   + "id INTEGER PRIMARY KEY, "
+                   + "original_title TEXT, "
+                   + "popularity REAL, "
+                   + "adult INTEGER, "
+                   + "video INTEGER)")
+        db.execute("CREATE VIRTUAL TABLE title_index USING fts4(title)")
+
+        # Go through the export and insert the rows in batches.
+        if export.endswith(".gz"):
+            stream = gzip.open(export, 'rb')
+        else:
+            stream = open(export, 'r')
+
+        count = 0
+        movies = []
+        titles = []
+
+        for line in stream:
+            line = line.strip()
+
+            if not line:
+                continue
+
+            movie = simplejson.loads(line)
+            title = movie.get("original_title") or ""
+            movies.append((
+                movie["id"],
+                title,
+                movie.get("popularity", 0),
+                1 if movie.get("adult") else 0,
+                1 if movie.get("video") else 0))
+            titles.append((
+                movie["id"],
+                mfgames_media.themoviedb.match.simplify_title(title)))
+
+            if len(movies) >= BATCH_SIZE:
+                count += self.insert(db, movies, titles)
+                movies = []
+                titles = []
+
+        count += self.insert(db, movies, titles)
+        stream.close()
+
+        # Finish up the metadata and optimize the index.
+        db.executemany(
+            "INSERT INTO mirror VALUES (?, ?)",
+            [
+                ("schema", str(DATABASE_SCHEMA)),
+                ("export", os.path.basename(export)),
+                ("ingested", str(int(time.time()))),
+                ("count", str(count)),
+            ])
+        db.execute("INSERT INTO title_index(title_index) VALUES('optimize')")
+        db.commit()
+        db.close()
+
+        os.rename(temp_filename, self.filename)
+        self.log.info("Ingested {0} movies into {1}".format(
+            count,
+            self.filename))
+        return count
+
+    def insert(self, db, movies, titles):
+        """Inserts a batch of movies and their titles."""
+
+        db.executemany(
+            "INSERT OR REPLACE INTO movie VALUES (?, ?, ?, ?, ?)",
+            movies)
+        db.executemany(
+            "INSERT INTO title_index(docid, title) VALUES (?, ?)",
+            titles)
+        return len(movies)
+
+    def search(self, title, limit=20, adult=False):
+        """Searches the mirror for a title, returning the movies in the
+        same form as the TMDB search results with the most popular
+        first. All of the words have to match, but if nothing does we
+        fall back to any of the words matching."""
+
+        words = mfgames_media.themoviedb.match.simplify_title(title).split()
+
+        if not words:
+            return []
+
+        # FTS4 needs words with quotes to avoid them being treated as
+        # operators like "and" or "not".
+        words = ['"' + word + '"' for word in words]
+        movies = self.query(" ".join(words), limit, adult)
+
+        if not movies and len(words) > 1:
+            movies = self.query(" OR ".join(words), limit, adult)
+
+        return movies
+
+    def query(self, match, limit, adult):
+        """Performs a single full-text query against the titles."""
+
+        with self.lock:
+            return self.query_locked(match, limit, adult)
+
+    def query_locked(self, match, limit, adult):
+        """Performs the query while holding the lock."""
+
+        cursor = self.db.cursor()
+        cursor.execute(
+            "SELECT m.id, m.original_title, m.popularity "
+            + "FROM title_index t JOIN movie m ON m.id = t.docid "
+            + "WHERE t.title MATCH ? "
+            + ("" if adult else "AND m.adult = 0 ")
+            + "ORDER BY m.popularity DESC LIMIT ?",
+            (match, limit))
+        movies = [
+            {
+                "id": row[0],
+                "title": row[1],
+                "original_title": row[1],
+                "popularity": row[2],
+            }
+            for row in cursor]
+        cursor.close()
+
+        return movies
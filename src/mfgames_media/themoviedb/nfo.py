@@ -0,0 +1,107 @@
+"""Generation of the NFO files from the cached TMDB sidecars."""
+
+
+from elementtree.SimpleXMLWriter import XMLWriter
+import logging
+import os
+
+
+# The resolutions we report in the NFO files, from largest to smallest,
+# along with the smallest width or height that counts for each one. We
+# check both so letterboxed and pillarboxed videos land in the right
+# place.
+RESOLUTIONS = [
+    ("2160p", 3200, 1800),
+    ("1080p", 1800, 1000),
+    ("720p", 1200, 700),
+    ("576p", 1000, 560),
+    ("480p", 0, 0),
+    ]
+
+
+def get_resolution(sidecar):
+    """Determines the resolution name, such as "1080p", from the
+    MPlayer information in the sidecar. If we don't have it, we assume
+    480p like we always have."""
+
+    mplayer = sidecar.get("mplayer") or {}
+
+    try:
+        width = int(mplayer.get("video-width", 0))
+        height = int(mplayer.get("video-height", 0))
+    except ValueError:
+        return "480p"
+
+    for name, min_width, min_height in RESOLUTIONS:
+        if width >= min_width or height >= min_height:
+            return name
+
+
+def is_current(filename, output, mtime=None):
+    """Determines if the NFO output is newer than the JSON file it is
+    generated from. If the modification time of the JSON file is
+    already known, it can be passed in to save a stat."""
+
+    try:
+        if mtime is None:
+            mtime = os.stat(filename).st_mtime
+
+        return os.stat(output).st_mtime >= mtime
+    except OSError:
+        return False
+
+
+def write_nfo(filename, sidecar, output):
+    """Writes out the NFO file for the sidecar. The file is written
+    under a temporary name and renamed when finished, so a failure
+    never leaves a partial NFO behind."""
+
+    # If the sidecar came from the JSON process, the movie is inside
+    # it. Otherwise, it is the TMDB information itself.
+    movie = sidecar.get("tmdb", sidecar)
+    resolution = get_resolution(sidecar)
+    temp_output = output + ".tmp"
+    xml = open(temp_output, 'w')
+
+    try:
+        xml.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n")
+
+        w = XMLWriter(xml, 'utf-8')
+        tag = w.start("movie", ThumbGen="1")
+        w.element("hasrighttoleftdirection", "false")
+        w.element("title", movie['title'])
+        w.element("originaltitle", movie['original_title'])
+        w.element("filename", os.path.splitext(filename)[0] + ".mp4")
+        w.element("tagline", movie['tagline'])
+        w.element("releasedate", movie['release_date'])
+        w.element("id", movie['imdb_id'])
+        w.element("runtime", format(movie['runtime']))
+        w.element("plot", movie['overview'])
+
+        # Write out the genres.
+        w.start("genre")
+
+        for genre in movie['genres']:
+            w.element("name", genre['name'])
+
+        w.end()
+
+        # Media information
+        w.start("mediainfo")
+        w.start("Resolution")
+        w.element("Flag", "Resolution_" + resolution)
+        w.end()
+        w.element("resolution", resolution.upper())
+        w.end()
+
+        # Finish up the document.
+        w.end()
+        w.close(tag)
+        xml.close()
+    except:
+        # Clean up the partial file and let the caller know.
+        xml.close()
+        os.remove(temp_output)
+        raise
+
+    os.rename(temp_output, output)
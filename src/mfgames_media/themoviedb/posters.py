@@ -0,0 +1,177 @@
+"""Concurrent and resumable downloads of the TMDB poster images."""
+
+
+import logging
+import os
+
+import pycurl
+
+import mfgames_media.themoviedb.client
+import mfgames_media.themoviedb.limiter
+
+
+class PosterJob(object):
+    """Describes a single poster to download. The key is the width code
+    and the TMDB poster path (e.g., "w342/mOTtuakUTb1qY6jG6lzMfjdhLwc.jpg")
+    which identifies the image. The download goes into a partial file
+    named after the key so a changed poster never resumes on top of the
+    bytes of the old one."""
+
+    def __init__(self, url, output, key, filename=None, sidecar=None):
+        self.url = url
+        self.output = output
+        self.key = key
+        self.part = "{0}.{1}.part".format(output, key.replace("/", "-"))
+
+        # The sidecar the poster belongs to, if any, so the key can be
+        # recorded after the download.
+        self.filename = filename
+        self.sidecar = sidecar
+
+    def open_part(self, request):
+        """Opens the partial file when a transfer for the poster starts,
+        appending to it if we are resuming."""
+
+        return open(self.part, 'ab' if request.offset else 'wb')
+
+    def truncate_part(self, offset):
+        """Throws away anything written to the partial file past the
+        offset, such as the body of an error response."""
+
+        if not os.path.isfile(self.part):
+            return
+
+        if not offset:
+            os.remove(self.part)
+            return
+
+        stream = open(self.part, 'r+b')
+        stream.truncate(offset)
+        stream.close()
+
+
+class PosterDownloader(object):
+    """Downloads posters concurrently through the shared HTTP client.
+    Each poster is streamed into a partial file which is renamed over
+    the output once it is complete. If a partial file already exists
+    from an interrupted run, the download resumes with a range request
+    instead of starting over. The partial files are only opened when a
+    transfer starts, so a large batch never holds more files open than
+    there are connections. If the server says we are going too fast,
+    the limiter is paused and the poster retried."""
+
+    def __init__(self, client, limiter=None, metrics=None, retries=3):
+        self.log = logging.getLogger('poster')
+        self.client = client
+        self.limiter = limiter
+        self.metrics = metrics
+        self.retries = retries
+
+    def download(self, jobs, callback=None):
+        """Downloads all the posters, returning the jobs that were
+        successful. If a callback is given, it is called with each job
+        as it finishes successfully."""
+
+        finished = []
+        pending = list(jobs)
+        attempt = 0
+
+        # If the server tells us we are going too fast, we stop handing
+        # out tokens until it says we can try again.
+        def check_rate_limit(response):
+            if response.status == 429 and self.limiter:
+                delay = mfgames_media.themoviedb.limiter.get_retry_delay(
+                    response,
+                    attempt)
+                self.log.warning(
+                    "Rate limited, waiting {0} seconds".format(delay))
+                self.limiter.pause(delay)
+
+        # We keep going as long as there are posters to retry. These
+        # are the ones that were rate limited and the ones whose
+        # partial file could not be resumed and need to start from the
+        # beginning, which can only happen once per poster.
+        while pending:
+            requests = []
+
+            for job in pending:
+                # See if we can resume a previous download.
+                offset = 0
+
+                if os.path.isfile(job.part):
+                    offset = os.path.getsize(job.part)
+
+                if offset:
+                    self.log.info(
+                        "Resuming {0} at {1} bytes".format(
+                            job.output,
+                            offset))
+
+                requests.append(
+                    mfgames_media.themoviedb.client.Request(
+                        job.url,
+                        offset=offset,
+                        opener=job.open_part))
+
+            responses = self.client.perform(
+                requests,
+                check_rate_limit,
+                self.limiter)
+            retry = []
+
+            for job, response in zip(pending, responses):
+                if self.metrics:
+                    self.metrics.record_response("image", response)
+
+                # If we have a complete download, move it into place.
+                if not response.error and response.status in (200, 206):
+                    os.rename(job.part, job.output)
+                    finished.append(job)
+                    self.log.info("Downloaded " + job.output)
+
+                    if callback:
+                        callback(job)
+
+                    continue
+
+                # If we were rate limited, throw away the error page and
+                # try again once the limiter lets us.
+                if response.status == 429 and attempt < self.retries:
+                    job.truncate_part(response.request.offset)
+                    retry.append(job)
+                    continue
+
+                # If the server couldn't resume the partial file, then
+                # throw it away and try again from the beginning.
+                if response.request.offset \
+                        and (response.errno == pycurl.E_RANGE_ERROR
+                             or response.status == 416):
+                    job.truncate_part(0)
+                    retry.append(job)
+                    continue
+
+                # If the transfer was interrupted, we keep the partial
+                # file so the next run can resume it. Otherwise, the
+                # server doesn't have the image.
+                if response.error:
+                    self.log.error(
+                        "Cannot download {0}: {1}".format(
+                            job.url,
+                            response.error))
+                else:
+                    self.log.error(
+                        "Cannot download {0}: HTTP {1}".format(
+                            job.url,
+                            response.status))
+
+                    # A poster that stayed rate limited can still be
+                    # resumed, so only drop what the error page added.
+                    if response.status == 429:
+                        job.truncate_part(response.request.offset)
+                    else:
+                        job.truncate_part(0)
+
+            pending = retry
+            attempt += 1
+
+        return finished
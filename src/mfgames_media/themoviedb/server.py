@@ -0,0 +1,370 @@
+"""Local stand-in for themoviedb.com used for testing and benchmarks."""
+
+
+import BaseHTTPServer
+import gzip
+import hashlib
+import logging
+import math
+import mfgames_tools.process
+import re
+import SocketServer
+import StringIO
+import threading
+import time
+import urlparse
+
+import simplejson
+
+import mfgames_media.themoviedb.cache
+import mfgames_media.themoviedb.limiter
+
+
+# The URL the recorded responses were cached under. The cache keys
+# don't include the API key, so any recording can be replayed.
+RECORDED_URL = "http://api.themoviedb.org"
+
+# The genres handed out to the generated movies.
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Science Fiction"]
+
+# The regular expressions for the paths we know how to answer.
+MOVIE_REGEX = re.compile(r'^/3/movie/(\d+)$')
+IMAGE_REGEX = re.compile(r'^/images/(\w+)/(.+)$')
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers a single request to the stand-in server."""
+
+    protocol_version = "HTTP/1.1"
+
+    # The headers and body are written separately, so without this the
+    # keep-alive connections stall on delayed acknowledgements.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        parts = urlparse.urlsplit(self.path)
+        endpoint = self.get_endpoint(parts.path)
+        server.count(endpoint)
+
+        # Pretend we are far away.
+        if server.latency:
+            time.sleep(server.latency)
+
+        # If the requests are coming in too fast, tell the client to
+        # back off like TMDB does.
+        if server.limiter and endpoint != "image":
+            wait = server.limiter.take()
+
+            if wait:
+                server.count("rate-limited")
+                self.send_body(
+                    429,
+                    simplejson.dumps({"status_code": 25}),
+                    [("Retry-After", str(int(math.ceil(wait))))])
+                return
+
+        if endpoint == "image":
+            self.send_image(parts.path)
+            return
+
+        json = server.get_response(self.path, parts, endpoint)
+
+        if json is None:
+            self.send_body(404, simplejson.dumps({"status_code": 34}))
+            return
+
+        # Use the body's hash as the ETag so the clients can revalidate.
+        body = simplejson.dumps(json, sort_keys=True)
+        etag = '"' + hashlib.sha1(body).hexdigest()[0:16] + '"'
+
+        if self.headers.get("If-None-Match") == etag:
+            server.count("not-modified")
+            self.send_body(304, "", [("ETag", etag)])
+            return
+
+        self.send_body(200, body, [("ETag", etag)])
+
+    def get_endpoint(self, path):
+        """Determines the name of the endpoint for the path."""
+
+        if IMAGE_REGEX.match(path):
+            return "image"
+
+        for name, regex in mfgames_media.themoviedb.cache.ENDPOINTS:
+            if regex.match(path):
+                return name
+
+        return "default"
+
+    def send_image(self, path):
+        """Sends the generated bytes of an image, honoring a range so
+        the posters can be resumed."""
+
+        body = self.server.get_image(path)
+        status = 200
+        headers = [("Content-Type", "image/jpeg")]
+        range = self.headers.get("Range")
+
+        if range and range.startswith("bytes="):
+            start = int(range[6:].split("-")[0] or 0)
+
+            if start >= len(body):
+                self.send_body(416, "")
+                return
+
+            status = 206
+            headers.append((
+                "Content-Range",
+                "bytes {0}-{1}/{2}".format(start, len(body) - 1, len(body))))
+            body = body[start:]
+
+        self.send_body(status, body, headers, False)
+
+    def send_body(self, status, body, headers=None, compress=True):
+        """Sends the response, compressing it if the client asked."""
+
+        if compress and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            buffer = StringIO.StringIO()
+            stream = gzip.GzipFile(fileobj=buffer, mode='wb')
+            stream.write(body)
+            stream.close()
+            body = buffer.getvalue()
+            headers = (headers or []) + [("Content-Encoding", "gzip")]
+
+        self.send_response(status)
+
+        for name, value in headers or []:
+            self.send_header(name, value)
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.log.debug(format % args)
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves the configuration, movie, search, and image requests of
+    the TMDB API from a local port. Responses recorded in a response
+    cache directory are replayed as-is. Everything else is generated
+    from the request so any movie ID or title can be used. The server
+    can add latency to every request and answer with 429 when the
+    requests come in faster than the rate."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        port=0,
+        recordings=None,
+        latency=0,
+        rate=0,
+        burst=None,
+        image_size=20000):
+        BaseHTTPServer.HTTPServer.__init__(
+            self,
+            ("127.0.0.1", port),
+            StandInHandler)
+        self.log = logging.getLogger('server')
+        self.latency = latency
+        self.image_size = image_size
+        self.limiter = None
+        self.recordings = None
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+        if rate:
+            self.limiter = mfgames_media.themoviedb.limiter.TokenBucket(
+                rate,
+                burst)
+
+        if recordings:
+            self.recordings = mfgames_media.themoviedb.cache.ResponseCache(
+                recordings)
+
+    @property
+    def url(self):
+        """Retrieves the base URL of the API for the --api-url."""
+
+        return "http://127.0.0.1:{0}/3".format(self.server_address[1])
+
+    def start(self):
+        """Starts serving the requests in a background thread."""
+
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stops the background thread and closes the port."""
+
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name):
+        """Counts a request for the given endpoint or outcome."""
+
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def reset(self):
+        """Clears the request counts and returns the previous ones."""
+
+        with self.lock:
+            counts = self.counts
+            self.counts = {}
+
+        return counts
+
+    def get_response(self, path, parts, endpoint):
+        """Retrieves the JSON for an API request, either from the
+        recordings or generated from the request."""
+
+        if self.recordings:
+            entry = self.recordings.get(RECORDED_URL + path)
+
+            if entry:
+                return entry["body"]
+
+        query = dict(urlparse.parse_qsl(parts.query, True))
+
+        if endpoint == "configuration":
+            return {
+                "images": {
+                    "base_url": "http://127.0.0.1:{0}/images/".format(
+                        self.server_address[1]),
+                    "poster_sizes": [
+                        "w92", "w154", "w185", "w342", "w500", "original"],
+                    },
+                }
+
+        if endpoint == "search":
+            title = query.get("query", "").decode("utf-8", "replace")
+            return {
+                "page": 1,
+                "results": self.search_movies(title),
+                }
+
+        match = MOVIE_REGEX.match(parts.path)
+
+        if match:
+            return self.get_movie(int(match.group(1)))
+
+        return None
+
+    def get_movie(self, id, title=None, year=None):
+        """Generates the details for a movie from its ID."""
+
+        year = year or 1950 + id % 70
+
+        return {
+            "id": id,
+            "imdb_id": "tt{0:07d}".format(id),
+            "title": title or u"Movie {0}".format(id),
+            "original_title": title or u"Movie {0}".format(id),
+            "tagline": u"",
+            "overview": u"A generated movie for testing.",
+            "release_date": "{0}-01-01".format(year),
+            "runtime": 90 + id % 60,
+            "popularity": 1.0 / (1 + id % 100),
+            "poster_path": "/{0}.jpg".format(id),
+            "genres": [
+                {"id": index, "name": GENRES[index]}
+                for index in (id % len(GENRES), (id + 2) % len(GENRES))],
+            }
+
+    def search_movies(self, title):
+        """Generates the search results for a title. The first result
+        has the title and the others are less similar, so the ranking
+        has something to do."""
+
+        if not title:
+            return []
+
+        id = int(hashlib.sha1(title.encode("utf-8")).hexdigest()[0:6], 16)
+        movies = [
+            self.get_movie(id, title),
+            self.get_movie(id + 1, title + u" II"),
+            self.get_movie(id + 2, u"The Return of " + title),
+            ]
+
+        for movie in movies:
+            for field in ("imdb_id", "tagline", "overview", "runtime",
+                          "genres"):
+                del movie[field]
+
+        return movies
+
+    def get_image(self, path):
+        """Generates the bytes of an image. The same path always has
+        the same bytes."""
+
+        seed = hashlib.sha1(path).digest()
+        return (seed * (self.image_size / len(seed) + 1))[0:self.image_size]
+
+
+class ServerProcess(mfgames_tools.process.Process):
+    """Runs the local stand-in for themoviedb.com until interrupted."""
+
+    def process(self, args):
+        # Perform any base class processing.
+        super(ServerProcess, self).process(args)
+
+        # Create and run the server.
+        log = logging.getLogger('server')
+        server = StandInServer(
+            args.port,
+            args.recordings,
+            args.latency,
+            args.rate,
+            args.burst,
+            args.image_size)
+        log.info("Serving the TMDB API at " + server.url)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+        server.server_close()
+
+    def setup_arguments(self, parser):
+        # Add in the argument from the base class.
+        super(ServerProcess, self).setup_arguments(parser)
+
+        # Add the server-specific arguments.
+        parser.add_argument(
+            '--port', '-p',
+            type=int,
+            default=8765,
+            help='The port to listen to on the local host.')
+        parser.add_argument(
+            '--recordings',
+            type=str,
+            help='Response cache directory with recorded responses to replay.')
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0,
+            help='Seconds to wait before answering each request.')
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='The requests per second before answering with 429, 0 for unlimited.')
+        parser.add_argument(
+            '--burst',
+            type=int,
+            help='The number of requests allowed in a burst above the rate.')
+        parser.add_argument(
+            '--image-size',
+            type=int,
+            default=20000,
+            help='The number of bytes in each generated image.')
+
+    def get_help(self):
+        return "Runs a local stand-in for themoviedb.com."
@@ -0,0 +1,276 @@
+"""Walks media directory trees with several directories at a time."""
+
+
+import fnmatch
+import logging
+import os
+import Queue
+import threading
+
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+
+# The default number of directories scanned at the same time.
+DEFAULT_WORKERS = 8
+
+# Put on the queues to tell the other side there is nothing more.
+STOP = object()
+
+
+class WalkEntry(object):
+    """Describes a single file found by the walker. The relative path
+    is from the root of the walk, the size and modification time are
+    None if the walker wasn't asked to stat the files."""
+
+    __slots__ = (
+        "root",
+        "relpath",
+        "size",
+        "mtime",
+        )
+
+    def __init__(self, root, relpath, size=None, mtime=None):
+        self.root = root
+        self.relpath = relpath
+        self.size = size
+        self.mtime = mtime
+
+    @property
+    def path(self):
+        """Retrieves the full path to the file."""
+
+        return os.path.join(self.root, self.relpath)
+
+
+class WalkDirectory(object):
+    """Describes a single directory found by the walker with the files
+    directly inside it and the names of its subdirectories. The files
+    are None if the directory was unchanged and wasn't scanned."""
+
+    __slots__ = (
+        "relpath",
+        "mtime",
+        "files",
+        "dirs",
+        )
+
+    def __init__(self, relpath, mtime, files, dirs):
+        self.relpath = relpath
+        self.mtime = mtime
+        self.files = files
+        self.dirs = dirs
+
+
+class TreeWalker(object):
+    """Walks a directory tree with a pool of threads, so the latency of
+    listing each directory on a network share overlaps with the others.
+    The files are filtered by extension and both files and directories
+    can be ignored by name with shell patterns. The size and
+    modification time come from the stat cached on each directory
+    entry, which the operating system may have returned with the
+    listing."""
+
+    def __init__(
+        self,
+        extensions=None,
+        ignore=None,
+        stat=True,
+        workers=DEFAULT_WORKERS):
+        self.log = logging.getLogger('walker')
+        self.workers = max(1, workers)
+        self.stat = stat
+        self.ignore = ignore or []
+
+        if extensions:
+            self.extensions = set([
+                "." + name.lower().lstrip(".")
+                for name in extensions])
+        else:
+            self.extensions = None
+
+    def is_ignored(self, name):
+        """Determines if the name matches one of the ignore patterns."""
+
+        for pattern in self.ignore:
+            if fnmatch.fnmatch(name, pattern):
+                return True
+
+        return False
+
+    def is_wanted(self, name):
+        """Determines if a file should be included in the results."""
+
+        if self.is_ignored(name):
+            return False
+
+        if self.extensions is None:
+            return True
+
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def walk(self, root):
+        """Yields every file under the root. If the root is a file, it
+        is the only one yielded."""
+
+        if os.path.isfile(root):
+            dirname, name = os.path.split(root)
+
+            if self.is_wanted(name):
+                yield self.get_entry(dirname, "", name, root)
+
+            return
+
+        for directory in self.walk_directories(root):
+            for entry in directory.files:
+                yield entry
+
+    def walk_directories(self, root, unchanged=None):
+        """Yields every directory under the root, including the root
+        itself. The order of the directories depends on how quickly each
+        one is listed, but the files inside each one are sorted.
+
+        If given, unchanged is called with the relative path and
+        modification time of each directory before it is listed. If it
+        returns the names of the subdirectories, the directory is
+        treated as unchanged: it is yielded without files and only those
+        subdirectories are walked. It may be called from several threads
+        at once."""
+
+        work = Queue.Queue()
+        results = Queue.Queue()
+        state = {"pending": 1, "stopped": False}
+        lock = threading.Lock()
+
+        def run():
+            while True:
+                reldir = work.get()
+
+                if reldir is STOP:
+                    return
+
+                directory = None
+
+                if not state["stopped"]:
+                    try:
+                        directory = self.scan_directory(
+                            root,
+                            reldir,
+                            unchanged)
+                    except Exception, exception:
+                        self.log.exception(
+                            "Cannot scan {0}: {1}".format(
+                                os.path.join(root, reldir),
+                                exception))
+
+                # Hand over the results and queue up the subdirectories
+                # before this one counts as finished, so the pending
+                # count never drops to zero while there is still
+                # something to give the caller.
+                if directory:
+                    results.put(directory)
+
+                with lock:
+                    if directory:
+                        for name in directory.dirs:
+                            state["pending"] += 1
+                            work.put(os.path.join(reldir, name))
+
+                    state["pending"] -= 1
+                    finished = state["pending"] == 0
+
+                if finished:
+                    results.put(STOP)
+
+        threads = [
+            threading.Thread(target=run)
+            for index in range(self.workers)]
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        work.put("")
+
+        try:
+            while True:
+                directory = results.get()
+
+                if directory is STOP:
+                    break
+
+                yield directory
+        finally:
+            # If the caller stopped early, let the threads drain the
+            # rest of the work without scanning it.
+            state["stopped"] = True
+
+            for thread in threads:
+                work.put(STOP)
+
+            for thread in threads:
+                thread.join()
+
+    def scan_directory(self, root, reldir, unchanged=None):
+        """Lists a single directory, returning None if it can't be
+        read."""
+
+        path = os.path.join(root, reldir)
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError, exception:
+            self.log.warning("Cannot stat {0}: {1}".format(path, exception))
+            return None
+
+        if unchanged:
+            dirs = unchanged(reldir, mtime)
+
+            if dirs is not None:
+                return WalkDirectory(reldir, mtime, None, dirs)
+
+        self.log.debug("Scanning directory: " + path)
+        files = []
+        dirs = []
+
+        try:
+            entries = list(scandir(path))
+        except OSError, exception:
+            self.log.warning("Cannot list {0}: {1}".format(path, exception))
+            return None
+
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not self.is_ignored(entry.name):
+                        dirs.append(entry.name)
+                elif entry.is_file() and self.is_wanted(entry.name):
+                    files.append(
+                        self.get_entry(root, reldir, entry.name, entry))
+            except OSError, exception:
+                # The file may have been removed since the listing.
+                self.log.debug(
+                    "Cannot stat {0}: {1}".format(entry.path, exception))
+
+        files.sort(key=lambda entry: entry.relpath)
+        dirs.sort()
+
+        return WalkDirectory(reldir, mtime, files, dirs)
+
+    def get_entry(self, root, reldir, name, entry):
+        """Creates the entry for a file, either from a directory entry
+        or a path."""
+
+        relpath = os.path.join(reldir, name)
+
+        if not self.stat:
+            return WalkEntry(root, relpath)
+
+        if isinstance(entry, basestring):
+            stat = os.stat(entry)
+        else:
+            stat = entry.stat()
+
+        return WalkEntry(root, relpath, stat.st_size, stat.st_mtime)